@@ -0,0 +1,95 @@
+"""
+Measures how often the event loop wakes up and how much CPU it uses while IRC
+listeners sit idle on a connection to a local fake IRC server.
+
+    poetry run python benchmarks/irc_idle.py --listeners 12 --duration 10
+
+Pass ``--interrupter`` to also run the 5ms polling coroutine that listeners
+used to start on connect, for comparison.
+"""
+
+import argparse
+import asyncio
+import time
+
+from chitanda.config import config
+from chitanda.listeners import IRCListener
+
+HOSTNAME = "127.0.0.1"
+
+
+async def fake_server(reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.startswith(b"USER"):
+            writer.write(
+                b":fake 001 bench :Welcome\r\n"
+                b":fake 375 bench :MOTD\r\n"
+                b":fake 376 bench :End\r\n"
+            )
+            await writer.drain()
+
+
+async def loop_interrupter():
+    while True:
+        await asyncio.sleep(0.005)
+
+
+def count_wakeups(loop):
+    counter = {"wakeups": 0}
+    select = loop._selector.select
+
+    def counting_select(timeout=None):
+        counter["wakeups"] += 1
+        return select(timeout)
+
+    loop._selector.select = counting_select
+    return counter
+
+
+async def run(listeners, duration, interrupter):
+    server = await asyncio.start_server(fake_server, HOSTNAME, 0)
+    port = server.sockets[0].getsockname()[1]
+    config._config = {"irc_servers": {HOSTNAME: {"perform": []}}}
+
+    clients = [IRCListener(None, f"bench{i}", HOSTNAME) for i in range(listeners)]
+    for client in clients:
+        await client.connect(HOSTNAME, port, tls=False)
+    await asyncio.sleep(1)  # Let registration settle.
+    assert all(client.performed for client in clients)
+
+    tasks = []
+    if interrupter:
+        tasks = [asyncio.ensure_future(loop_interrupter()) for _ in clients]
+
+    counter = count_wakeups(asyncio.get_event_loop())
+    cpu_start = time.process_time()
+    await asyncio.sleep(duration)
+    cpu = time.process_time() - cpu_start
+
+    for task in tasks:
+        task.cancel()
+    for client in clients:
+        await client.disconnect(expected=True)
+    server.close()
+
+    print(f"listeners:          {listeners}")
+    print(f"wakeups per second: {counter['wakeups'] / duration:.1f}")
+    print(f"CPU usage:          {cpu / duration * 100:.2f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--listeners", type=int, default=12)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--interrupter", action="store_true")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(
+        run(args.listeners, args.duration, args.interrupter)
+    )
+
+
+if __name__ == "__main__":
+    main()
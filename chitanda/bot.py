@@ -1,11 +1,13 @@
 import asyncio
 import logging
 import sys
+from copy import copy
 from types import AsyncGeneratorType, GeneratorType
 
 from aiohttp import web
 
 from chitanda.config import config
+from chitanda.database import configure_database
 from chitanda.errors import BotError, NoCommandFound
 from chitanda.listeners import DiscordListener, IRCListener
 from chitanda.loader import load_commands
@@ -13,6 +15,8 @@ from chitanda.util import Response
 
 logger = logging.getLogger(__name__)
 
+HANDLER_TIMEOUT = 15
+
 
 class Chitanda:
 
@@ -23,10 +27,12 @@ class Chitanda:
         self.discord_listener = None
         self.message_handlers = []
         self.response_handlers = []
+        self.shutdown_handlers = []
         if config["webserver"]["enable"]:
             self.web_application = web.Application()
 
     def start(self):
+        configure_database(config.get("database", {}).get("pragmas", {}))
         load_commands(self)
         if hasattr(self, "web_application"):
             self.webserver = self._start_webserver()
@@ -58,7 +64,11 @@ class Chitanda:
         for hostname, server in config["irc_servers"].items():
             logger.info(f"Connecting to IRC server: {hostname}.")
             self.irc_listeners[hostname] = IRCListener(
-                self, server["nickname"], hostname
+                self,
+                server["nickname"],
+                hostname,
+                throttle=server.get("throttle"),
+                pack=server.get("pack", True),
             )
             asyncio.ensure_future(
                 self.irc_listeners[hostname].connect(
@@ -70,8 +80,10 @@ class Chitanda:
             )
 
     def _connect_discord(self):
-        self.discord_listener = DiscordListener(self)
-        self.discord_listener.run(config["discord_token"])
+        self.discord_listener = DiscordListener(
+            self, members_intent=config.get("discord_members_intent", False)
+        )
+        asyncio.ensure_future(self.discord_listener.start(config["discord_token"]))
 
     async def handle_message(self, message):
         logger.debug(
@@ -79,13 +91,53 @@ class Chitanda:
             f"from {message.author}: {message.contents}"
         )
         try:
-            for handler in self.message_handlers:
-                await self.handle_response(handler(message), source=message)
+            ordered, unordered = self._split_message_handlers()
+            for handler in ordered:
+                await self._call_message_handler(handler, message)
+        except BotError as e:
+            return await self._report_error(message, e)
+
+        # The command is dispatched on a copy, as it strips the trigger from
+        # the message contents that the unordered handlers still read.
+        await asyncio.gather(
+            *(
+                self._catch_errors(self._call_message_handler(h, message), message)
+                for h in unordered
+            ),
+            self._catch_errors(self.dispatch_command(copy(message)), message),
+        )
+
+    def _split_message_handlers(self):
+        """
+        Split the message handlers into those that must run in order before
+        the command is dispatched and those that can run concurrently.
+        """
+        ordered, unordered = [], []
+        for handler in self.message_handlers:
+            if hasattr(handler, "ordered"):
+                ordered.append(handler)
+            else:
+                unordered.append(handler)
+        return ordered, unordered
+
+    async def _call_message_handler(self, handler, message):
+        try:
+            await asyncio.wait_for(
+                self.handle_response(handler(message), source=message),
+                timeout=HANDLER_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Message handler {handler.__qualname__} timed out.")
 
-            await self.dispatch_command(message)
+    async def _catch_errors(self, coro, message):
+        try:
+            await coro
         except BotError as e:
-            logger.info(f"Error triggered by {message.author}: {e}.")
-            await message.listener.message(message.target, f"Error: {e}")
+            await self._report_error(message, e)
+
+    async def _report_error(self, message, error):
+        logger.info(f"Error triggered by {message.author}: {error}.")
+        await message.listener.message(message.target, f"Error: {error}")
 
     async def dispatch_command(self, message):
         try:
@@ -122,3 +174,20 @@ class Chitanda:
     async def call_response_handlers(self, response):
         for handler in self.response_handlers:
             await handler(response)
+
+    async def shutdown(self):
+        await self.run_shutdown_handlers()
+        # Closed after the shutdown handlers, which may still relay.
+        if self.discord_listener is not None:
+            await self.discord_listener.close()
+
+    async def run_shutdown_handlers(self):
+        """
+        Run the modules' shutdown handlers, such as those that save buffered
+        state. They are run when the bot exits and before modules are reloaded.
+        """
+        for handler in self.shutdown_handlers:
+            try:
+                await handler()
+            except Exception as e:
+                logger.error(f"Error running shutdown handler: {e}")
@@ -1,13 +1,14 @@
 import asyncio
 import json
 import logging
+import signal
 import sys
 
 import click
 
 from chitanda.bot import Chitanda
 from chitanda.config import BLANK_CONFIG, CONFIG_PATH
-from chitanda.database import calculate_migrations_needed, database
+from chitanda.database import calculate_migrations_needed, close_database, database
 
 logger = logging.getLogger(__name__)
 
@@ -22,7 +23,14 @@ def run():
     """Run the bot."""
     bot = Chitanda()
     bot.start()
-    asyncio.get_event_loop().run_forever()
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(bot.shutdown())
+        close_database()
 
 
 @cmdgroup.command()
@@ -34,6 +34,7 @@ BLANK_CONFIG = {
         }
     },
     "admins": {},
+    "database": {"pragmas": {}},
 }
 
 
@@ -50,6 +51,12 @@ class Config:
 
         return self._config[key]
 
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
     def _load_config(self):
         if CONFIG_PATH.exists():
             with open(CONFIG_PATH, "r") as cf:
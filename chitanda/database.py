@@ -1,8 +1,12 @@
+import asyncio
 import logging
 import sqlite3
 import sys
+import threading
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
 
 import click
@@ -11,20 +15,194 @@ from chitanda import DATA_DIR
 from chitanda.errors import BotError
 
 DATABASE_PATH = DATA_DIR / "db.sqlite3"
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+}
+READER_POOL_SIZE = 4
+CACHED_STATEMENTS = 256
 
 
 logger = logging.getLogger(__name__)
 
 Migration = namedtuple("Migration", "path, version, source")
 
+_pool = None
+_pool_lock = threading.RLock()
+_pragmas = {}
 
-@contextmanager
-def database():
-    with sqlite3.connect(str(DATABASE_PATH)) as conn:
+
+class ConnectionPool:
+    """
+    Long-lived connections to the database: a single writer connection shared
+    by all writes and a small pool of idle read-only connections. Readers past
+    the pool size are opened as needed and closed once released.
+
+    ``write_lock`` must be held while the writer connection is in use, so that
+    transactions from different threads don't interleave on it.
+    """
+
+    def __init__(self, path, pragmas, size):
+        self.path = path
+        self.pragmas = pragmas
+        self.size = size
+        self.write_lock = threading.RLock()
+        self._writer = None
+        self._readers = []
+        self._lock = threading.Lock()
+
+    @property
+    def writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = self._connect()
+            return self._writer
+
+    def acquire_reader(self):
+        with self._lock:
+            if self._readers:
+                return self._readers.pop()
+        return self._connect(readonly=True)
+
+    def release_reader(self, conn):
+        with self._lock:
+            if len(self._readers) < self.size:
+                self._readers.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _connect(self, readonly=False):
+        conn = sqlite3.connect(
+            str(self.path),
+            cached_statements=CACHED_STATEMENTS,
+            check_same_thread=False,
+        )
         conn.row_factory = sqlite3.Row
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        if readonly:
+            conn.execute("PRAGMA query_only = 1")
+        return conn
+
+
+@contextmanager
+def database(readonly=False):
+    pool = _get_pool()
+    if readonly:
+        conn = pool.acquire_reader()
+        try:
+            with _transaction(conn) as cursor:
+                yield conn, cursor
+        finally:
+            pool.release_reader(conn)
+    else:
+        with pool.write_lock:
+            conn = pool.writer
+            with _transaction(conn) as cursor:
+                yield conn, cursor
+
+
+@contextmanager
+def _transaction(conn):
+    with conn:
         cursor = conn.cursor()
-        yield conn, cursor
-        cursor.close()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+
+def configure_database(pragmas):
+    """
+    Set the pragmas that are run on each new connection, in addition to the
+    default pragmas. Open connections are closed so that they are re-opened
+    with the new pragmas.
+    """
+    global _pragmas
+    _pragmas = pragmas
+    close_database()
+
+
+def close_database():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DATABASE_PATH:
+            close_database()
+            _pool = ConnectionPool(
+                DATABASE_PATH, {**DEFAULT_PRAGMAS, **_pragmas}, READER_POOL_SIZE
+            )
+        return _pool
+
+
+class AsyncDatabase:
+    """
+    Runs database work in threads so that a slow disk or a locked database
+    doesn't block the event loop. All writes go through a single writer thread
+    and reads go through a bounded pool of reader threads.
+    """
+
+    def __init__(self, readers=READER_POOL_SIZE):
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(readers, thread_name_prefix="db-reader")
+
+    async def execute(self, sql, params=()):
+        """Execute a write query and return the number of affected rows."""
+        return await self.transaction(
+            lambda cursor: cursor.execute(sql, params).rowcount
+        )
+
+    async def executemany(self, sql, seq_of_params):
+        return await self.transaction(
+            lambda cursor: cursor.executemany(sql, seq_of_params).rowcount
+        )
+
+    async def fetchone(self, sql, params=()):
+        return await self.read(lambda cursor: cursor.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.read(lambda cursor: cursor.execute(sql, params).fetchall())
+
+    async def transaction(self, func, *args):
+        """
+        Call ``func(cursor, *args)`` on the writer thread inside a single
+        transaction and return its result.
+        """
+        return await self._run(self._writer, False, func, *args)
+
+    async def read(self, func, *args):
+        """Call ``func(cursor, *args)`` on a reader thread and return its result."""
+        return await self._run(self._readers, True, func, *args)
+
+    async def _run(self, executor, readonly, func, *args):
+        return await asyncio.get_event_loop().run_in_executor(
+            executor, partial(self._call, readonly, func, *args)
+        )
+
+    @staticmethod
+    def _call(readonly, func, *args):
+        with database(readonly=readonly) as (conn, cursor):
+            return func(cursor, *args)
+
+
+db = AsyncDatabase()
 
 
 def create_database_if_nonexistent():
@@ -85,6 +263,6 @@ def _find_migrations():
 
 
 def _get_versions():
-    with database() as (conn, cursor):
+    with database(readonly=True) as (conn, cursor):
         cursor.execute("SELECT source, MAX(version) FROM versions GROUP BY source")
         return {r["source"]: r[1] for r in cursor.fetchall()}
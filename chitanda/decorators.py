@@ -120,3 +120,8 @@ def allowed_listeners(*listeners):
         return wrapper
 
     return decorator
+
+
+def ordered(func):
+    setattr(func, "ordered", True)
+    return func
@@ -0,0 +1,194 @@
+import itertools
+import logging
+import sys
+from array import array
+from collections import OrderedDict, deque
+
+from chitanda.config import config
+
+logger = logging.getLogger(__name__)
+
+# The number of messages kept per channel.
+CHANNEL_LENGTH = 1024
+
+# The default memory budget of the history, in megabytes. The config can
+# override it with ``history.memory_mb``.
+DEFAULT_MEMORY_MB = 64
+
+# Estimates of the bytes used by each message, author, and channel on top of
+# the size of their strings.
+MESSAGE_OVERHEAD = 20
+AUTHOR_OVERHEAD = 112
+CHANNEL_OVERHEAD = 1024
+
+_channel_ids = itertools.count()
+
+
+class ChannelHistory:
+    """
+    The recent messages of a channel, newest first. Authors are stored as IDs
+    in the history's author table, and each message is formatted as
+    ``<author> text`` only when read.
+
+    ``added`` counts the messages ever added, so that a reader holding a copy
+    can be sent only the messages it lacks.
+    """
+
+    def __init__(self, history, maxlen):
+        self.id = next(_channel_ids)
+        self.maxlen = maxlen
+        self.added = 0
+        self._history = history
+        self._authors = array("I")  # Oldest first, like ``_texts``.
+        self._texts = deque()
+        self._folded = deque()  # Case-folded lines, or None until needed.
+
+    def __len__(self):
+        return len(self._texts)
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self._texts):
+            raise IndexError("channel history index out of range")
+        return self._format(len(self._texts) - 1 - index)
+
+    def __iter__(self):
+        for index in range(len(self._texts) - 1, -1, -1):
+            yield self._format(index)
+
+    def messages(self):
+        """Iterate over the ``(author, text)`` pairs of the messages."""
+        names = self._history._author_names
+        for index in range(len(self._texts) - 1, -1, -1):
+            yield names[self._authors[index]], self._texts[index]
+
+    def folded(self):
+        """
+        Iterate over the case-folded formatted messages, newest first. Folded
+        lines are cached, and count towards the history's memory use.
+        """
+        for index in range(len(self._texts) - 1, -1, -1):
+            folded = self._folded[index]
+            if folded is None:
+                folded = self._folded[index] = self._format(index).casefold()
+                self._history.memory += sys.getsizeof(folded)
+            yield folded
+
+    def _format(self, index):
+        author = self._history._author_names[self._authors[index]]
+        return f"<{author}> {self._texts[index]}"
+
+    def _append(self, author_id, text):
+        if len(self._texts) == self.maxlen:
+            self._pop_oldest()
+        self._authors.append(author_id)
+        self._texts.append(text)
+        self._folded.append(None)
+        self._history.memory += _message_size(text)
+        self.added += 1
+
+    def _pop_oldest(self):
+        self._history._release_author(self._authors.pop(0))
+        self._history.memory -= _message_size(self._texts.popleft())
+        folded = self._folded.popleft()
+        if folded is not None:
+            self._history.memory -= sys.getsizeof(folded)
+
+    def _clear(self):
+        while self._texts:
+            self._pop_oldest()
+
+
+class MessageHistory:
+    """
+    The message history of every channel, kept within a memory budget. Once
+    the budget is exceeded, the channels that were least recently written to
+    or read from are evicted whole.
+    """
+
+    def __init__(self, memory_mb=None, channel_length=CHANNEL_LENGTH):
+        self.memory_mb = memory_mb
+        self.channel_length = channel_length
+        self.memory = 0
+        self.evicted = 0
+        self._channels = OrderedDict()  # Maps (listener, target) to histories.
+        self._author_ids = {}  # Maps author names to [ID, reference count].
+        self._author_names = []  # Maps author IDs to names.
+        self._free_author_ids = []
+
+    def get(self, listener, target):
+        """Return the history of a channel, creating it if necessary."""
+        key = (listener, target)
+        try:
+            self._channels.move_to_end(key)
+        except KeyError:
+            self._channels[key] = ChannelHistory(self, self.channel_length)
+            self.memory += CHANNEL_OVERHEAD
+        return self._channels[key]
+
+    def add(self, listener, target, author, text):
+        channel = self.get(listener, target)
+        channel._append(self._acquire_author(author), text)
+        self._enforce_budget(channel)
+
+    @property
+    def stats(self):
+        """Memory use and size statistics for monitoring."""
+        return {
+            "channels": len(self._channels),
+            "messages": sum(len(c) for c in self._channels.values()),
+            "authors": len(self._author_ids),
+            "memory": self.memory,
+            "budget": self._budget(),
+            "evicted": self.evicted,
+        }
+
+    def _budget(self):
+        memory_mb = self.memory_mb
+        if memory_mb is None:
+            memory_mb = config.get("history", {}).get("memory_mb", DEFAULT_MEMORY_MB)
+        return memory_mb * 2 ** 20
+
+    def _enforce_budget(self, channel):
+        budget = self._budget()
+        while self.memory > budget and len(self._channels) > 1:
+            (listener, target), evicted = self._channels.popitem(last=False)
+            evicted._clear()
+            self.memory -= CHANNEL_OVERHEAD
+            self.evicted += 1
+            logger.info(f"Evicted the message history of {target} on {listener}.")
+
+        # A single channel over the budget loses its oldest messages instead.
+        while self.memory > budget and len(channel) > 1:
+            channel._pop_oldest()
+
+    def _acquire_author(self, author):
+        try:
+            entry = self._author_ids[author]
+        except KeyError:
+            if self._free_author_ids:
+                author_id = self._free_author_ids.pop()
+                self._author_names[author_id] = author
+            else:
+                author_id = len(self._author_names)
+                self._author_names.append(author)
+            entry = self._author_ids[author] = [author_id, 0]
+            self.memory += AUTHOR_OVERHEAD + sys.getsizeof(author)
+        entry[1] += 1
+        return entry[0]
+
+    def _release_author(self, author_id):
+        author = self._author_names[author_id]
+        entry = self._author_ids[author]
+        entry[1] -= 1
+        if not entry[1]:
+            del self._author_ids[author]
+            self._author_names[author_id] = None
+            self._free_author_ids.append(author_id)
+            self.memory -= AUTHOR_OVERHEAD + sys.getsizeof(author)
+
+
+def _message_size(text):
+    return sys.getsizeof(text) + MESSAGE_OVERHEAD
+
+
+history = MessageHistory()
@@ -1,3 +1,4 @@
 # flake8: noqa
 from .discord import DiscordListener
 from .irc import IRCListener
+from .scheduler import Priority
@@ -1,52 +1,156 @@
+import asyncio
 import logging
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 from functools import partial
 
 import discord
 
 from chitanda.config import config
-from chitanda.util import Message
+from chitanda.util import Message, split_message
+
+from .members import MemberIndex
+from .scheduler import TokenBucket
 
 logger = logging.getLogger(__name__)
 
+MESSAGE_LENGTH_LIMIT = 2000
+
+# Discord allows 5 messages per 5 seconds in each channel.
+CHANNEL_RATE = 1
+CHANNEL_BURST = 5
+
+# The number of users whose DM channel ids are cached.
+DM_CACHE_SIZE = 1024
+
+# Seconds after which an idle channel sender is discarded. By then, its rate
+# limit has fully recovered, so nothing is lost.
+SENDER_IDLE_TIMEOUT = CHANNEL_BURST / CHANNEL_RATE
+
+
+class ChannelSender:
+    """
+    Sends the messages queued for a Discord channel, packing consecutive text
+    messages into as few messages as fit in Discord's length limit. Sends are
+    paced to stay within the channel's rate limit instead of running into it.
+    """
+
+    def __init__(self, send, on_idle):
+        self._send = send
+        self._on_idle = on_idle
+        self.queue = deque()
+        self.bucket = TokenBucket(CHANNEL_RATE, CHANNEL_BURST)
+        self.task = None
+
+    def enqueue(self, message, embed=False):
+        if embed:
+            self.queue.append((message, True))
+        elif len(str(message)) > MESSAGE_LENGTH_LIMIT:
+            for line in split_message(str(message), MESSAGE_LENGTH_LIMIT):
+                self.queue.append((line, False))
+        else:
+            self.queue.append((str(message), False))
+
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        try:
+            while self.queue:
+                await self.bucket.acquire()
+                kwargs = self._pop()
+                try:
+                    await self._send(**kwargs)
+                except Exception as e:
+                    logger.error(f"Failed to send message on Discord: {e}")
+        finally:
+            self.task = None
+            self._on_idle()
+
+    def _pop(self):
+        message, embed = self.queue.popleft()
+        if embed:
+            return {"embed": message}
+
+        while self.queue and not self.queue[0][1]:
+            if len(message) + 1 + len(self.queue[0][0]) > MESSAGE_LENGTH_LIMIT:
+                break
+            message += "\n" + self.queue.popleft()[0]
+        return {"content": message}
+
 
 class DiscordListener(discord.Client):
-    def __init__(self, bot):
+    def __init__(self, bot, members_intent=False):
         self.bot = bot
-        self.message_lock = defaultdict(lambda: False)
-        self.message_queue = defaultdict(partial(deque))
-        super().__init__()
+        self.senders = {}
+        self.dm_channel_ids = OrderedDict()  # LRU cache of user id to channel id.
+        self.member_indexes = {}  # Maps guild ids to their member indexes.
+        intents = discord.Intents.default()
+        intents.members = members_intent
+        super().__init__(intents=intents)
 
     def __repr__(self):  # pragma: no cover
         return "DiscordListener"
 
-    async def message(self, target, message, private=False, embed=False):
+    async def message(self, target, message, private=False, embed=False, **_):
         if private:
             target = await self.get_dm_channel_id(target)
 
         logger.info(f'Adding "{message}" to Discord message queue for {target}.')
-        self.message_queue[target].append((message, embed))
-
-        if not self.message_lock[target]:
-            self.message_lock[target] = True
-            try:
-                discord_channel = self.get_channel(int(target))
-
-                logger.info(f'Sending "{message}" on Discord to {discord_channel}.')
-                while self.message_queue[target]:
-                    message, embed = self.message_queue[target].popleft()
-                    await discord_channel.send(
-                        **{("embed" if embed else "content"): message}
-                    )
-            finally:
-                self.message_lock[target] = False
+        if target not in self.senders:
+            self.senders[target] = ChannelSender(
+                partial(self._send_message, target),
+                on_idle=partial(self._schedule_eviction, target),
+            )
+        self.senders[target].enqueue(message, embed)
+
+    async def _send_message(self, target, **kwargs):
+        discord_channel = self.get_channel(int(target))
+        logger.info(f"Sending {kwargs} on Discord to {discord_channel}.")
+        try:
+            await discord_channel.send(**kwargs)
+        except Exception:
+            self._forget_dm_channel(target)
+            raise
+
+    def _schedule_eviction(self, target):
+        asyncio.get_event_loop().call_later(
+            SENDER_IDLE_TIMEOUT, self._evict_sender, target
+        )
+
+    def _evict_sender(self, target):
+        sender = self.senders.get(target)
+        if sender is None or sender.task is not None:
+            return
+        if sender.bucket.is_full():
+            del self.senders[target]
+        else:
+            self._schedule_eviction(target)
+
+    def max_message_length(self, target):
+        return MESSAGE_LENGTH_LIMIT
 
     async def get_dm_channel_id(self, user_id):
+        try:
+            self.dm_channel_ids.move_to_end(user_id)
+            return self.dm_channel_ids[user_id]
+        except KeyError:
+            pass
+
         discord_user = await self.fetch_user(user_id)
         if not discord_user.dm_channel:
             await discord_user.create_dm()
+
+        self.dm_channel_ids[user_id] = discord_user.dm_channel.id
+        if len(self.dm_channel_ids) > DM_CACHE_SIZE:
+            self.dm_channel_ids.popitem(last=False)
         return discord_user.dm_channel.id
 
+    def _forget_dm_channel(self, channel_id):
+        """Drop cached DM channels that failed to be sent to."""
+        for user_id, dm_channel_id in list(self.dm_channel_ids.items()):
+            if dm_channel_id == channel_id:
+                del self.dm_channel_ids[user_id]
+
     async def on_message(self, message):
         if not message.author.bot:
             message = Message(
@@ -67,5 +171,39 @@ class DiscordListener(discord.Client):
         return user
 
     async def find_prefix_matches(self, channel_id, prefix):
-        channel = self.get_channel(channel_id)
-        return await channel.guild.query_members(prefix)
+        """
+        Find the members of a channel's guild whose names start with the prefix.
+        Members are looked up in a local index first, and only queried from
+        Discord if the index can't answer. Once a guild's members are fully
+        loaded, which requires the members intent, the index holds all of them.
+        """
+        guild = self.get_channel(channel_id).guild
+        index = self._get_member_index(guild.id)
+        if guild.chunked and not index.complete:
+            index.fill(guild.members)
+        members = index.find(prefix)
+        if members is None:
+            members = await guild.query_members(prefix)
+            index.add_query_result(prefix, members)
+        return members
+
+    def _get_member_index(self, guild_id):
+        if guild_id not in self.member_indexes:
+            self.member_indexes[guild_id] = MemberIndex()
+        return self.member_indexes[guild_id]
+
+    async def on_member_join(self, member):
+        self._get_member_index(member.guild.id).add(member)
+
+    async def on_member_update(self, before, after):
+        self._get_member_index(after.guild.id).add(after)
+
+    async def on_member_remove(self, member):
+        self._get_member_index(member.guild.id).remove(member.id)
+
+    async def on_user_update(self, before, after):
+        for index in self.member_indexes.values():
+            index.refresh(after.id)
+
+    async def on_guild_remove(self, guild):
+        self.member_indexes.pop(guild.id, None)
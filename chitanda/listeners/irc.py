@@ -1,15 +1,26 @@
 import asyncio
 import logging
-import time
-from collections import deque
 
 import pydle
+from pydle.features.rfc1459.protocol import MESSAGE_LENGTH_LIMIT
 
 from chitanda.config import config
-from chitanda.util import Message
+from chitanda.util import Message, split_message
+
+from .scheduler import MessageScheduler, Priority
+from .whois import WhoisCache
 
 logger = logging.getLogger(__name__)
 
+# The account name IRCv3 servers send for users who are not logged in.
+NO_ACCOUNT = "*"
+
+# By default, allow bursts of 8 messages and 8 messages every 3 seconds after.
+DEFAULT_THROTTLE = {"rate": 8 / 3, "burst": 8}
+
+# Joins queued lines that are packed into a single message.
+PACK_SEPARATOR = " | "
+
 
 class IRCListener(
     pydle.Client,
@@ -17,62 +28,83 @@ class IRCListener(
     pydle.features.TLSSupport,
     pydle.features.RFC1459Support,
 ):
-    def __init__(self, bot, nickname, hostname):
+    def __init__(self, bot, nickname, hostname, throttle=None, pack=True):
         self.bot = bot
         self.hostname = hostname
-        self.performed = False  # Whether or not performs have been sent.
-        self.message_lock = False
-        self.message_queue = deque()
-        self.message_times = deque(maxlen=8)
+        self._performed = asyncio.Event()
+        self.scheduler = MessageScheduler(
+            self._send_message,
+            **{**DEFAULT_THROTTLE, **(throttle or {})},
+            merge=self._pack_lines if pack else None,
+        )
         super().__init__(nickname, username=nickname, realname=nickname)
+        self.whois_cache = WhoisCache(
+            lambda nickname: self.whois(nickname), normalize=self.normalize
+        )
+        # Accounts of users learned from IRCv3 account-tag, account-notify, and
+        # extended-join, keyed by normalized nickname. ``None`` means the user
+        # is known to not be logged in.
+        self.accounts = {}
 
     def __repr__(self):
         return f"IRCListener@{self.hostname}"
 
-    async def on_connect(self):  # pragma: no cover
+    async def on_connect(self):
         await self.set_mode(self.nickname, "BI")
         await self._perform()
-        await self._loop_interrupter()
 
     async def _perform(self):
         logger.info(f"Running IRC perform commands on {self.hostname}.")
         for cmd in config["irc_servers"][self.hostname]["perform"]:
             await self.raw(f"{cmd}\r\n")
-        self.performed = True
+        self._performed.set()
 
-    async def _loop_interrupter(self):  # pragma: no cover
+    @property
+    def performed(self):
+        """Whether or not performs have been sent on the current connection."""
+        return self._performed.is_set()
+
+    async def wait_performed(self):
+        await self._performed.wait()
+
+    async def message(self, target, message, priority=Priority.REPLY, wait=False, **_):
+        """
+        Queue a message to be sent by the throttled scheduler. Command replies
+        are sent before queued relay traffic. Messages longer than an IRC line
+        are split into several lines. If ``wait`` is true, return only once the
+        message has been sent.
         """
-        Pydle's event loop blocks other coroutines from running.
-        So there now is this.
+        sent = [
+            self.scheduler.enqueue(target, line, priority)
+            for line in split_message(str(message), self.max_message_length(target))
+        ]
+        if wait:
+            await asyncio.gather(*sent)
+
+    def _pack_lines(self, target, line, next_line):
+        """Join two lines queued for a target if they fit in one message."""
+        packed = f"{line}{PACK_SEPARATOR}{next_line}"
+        if len(packed.encode()) <= self.max_message_length(target):
+            return packed
+
+    async def _send_message(self, target, message):
+        logger.info(f'Sending "{message}" on IRC ({self.hostname}) to {target}.')
+        await super().message(target, message)
+
+    def max_message_length(self, target):
         """
-        while True:
-            await asyncio.sleep(0.005)
-
-    async def message(self, target, message, **_):
-        """Implement throttle on outgoing messages."""
-        self.message_queue.append((target, message, time.time()))
-        if not self.message_lock:
-            self.message_lock = True
-            try:
-                while self.message_queue:
-                    try:
-                        if time.time() - self.message_times[7] < 3:
-                            logger.info("Throttling outgoing IRC messages.")
-                            await asyncio.sleep(3 / 8)
-                    except IndexError:
-                        pass
-
-                    target, message, msg_time = self.message_queue.popleft()
-                    logger.info(
-                        f'Sending "{message}" on IRC ({self.hostname}) ' f"to {target}."
-                    )
-                    await super().message(target, message)
-                    self.message_times.appendleft(msg_time)
-            finally:
-                self.message_lock = False
-
-    async def on_raw(self, message):  # pragma: no cover
+        The length in bytes of the longest message that is sent to the target in
+        one line, leaving the same margin as pydle for the server's prefix.
+        """
+        hostmask = self._format_user_mask(self.nickname)
+        prefix = f"{hostmask} PRIVMSG {target} :".encode()
+        return MESSAGE_LENGTH_LIMIT - len(prefix) - 25
+
+    async def on_raw(self, message):
         logger.debug(f"Received raw IRC message: {message}".rstrip())
+        if self._capabilities.get("account-tag") and "!" in (message.source or ""):
+            nickname, _ = self._parse_user(message.source)
+            self._set_account(nickname, message.tags.get("account"))
         await super().on_raw(message)
 
     async def on_channel_message(self, target, by, message):
@@ -100,11 +132,95 @@ class IRCListener(
             await self.bot.handle_message(message)
 
     async def is_admin(self, user):
-        info = await self.whois(user)
-        return info["identified"] and info["account"] in config["admins"].get(
-            str(self), []
-        )
+        account = await self._get_account(user)
+        return account is not None and account in config["admins"].get(str(self), [])
 
     async def is_authed(self, user):
-        info = await self.whois(user)
-        return info["identified"] and info["account"]
+        return await self._get_account(user)
+
+    async def _get_account(self, user):
+        """
+        Look up the account of a user from the accounts learned through IRCv3
+        capabilities, falling back to a WHOIS on servers without them.
+        """
+        tracked = self._capabilities.get("account-notify") or self._capabilities.get(
+            "account-tag"
+        )
+        if tracked and self.normalize(user) in self.accounts:
+            return self.accounts[self.normalize(user)]
+
+        info = await self.whois_cache.get(user)
+        return info["account"] if info["identified"] else None
+
+    def _set_account(self, nickname, account):
+        self.accounts[self.normalize(nickname)] = (
+            None if account in (None, NO_ACCOUNT) else account
+        )
+
+    def _forget(self, *nicknames):
+        self.whois_cache.invalidate(*nicknames)
+        for nickname in nicknames:
+            self.accounts.pop(self.normalize(nickname), None)
+
+    async def on_raw_join(self, message):
+        if self._capabilities.get("extended-join") and len(message.params) > 1:
+            nickname, _ = self._parse_user(message.source)
+            self._set_account(nickname, message.params[1])
+        await super().on_raw_join(message)
+
+    async def on_raw_nick(self, message):
+        nickname, _ = self._parse_user(message.source)
+        new = message.params[0]
+        tracked = self.normalize(nickname) in self.accounts
+        account = self.accounts.get(self.normalize(nickname))
+        self._forget(nickname, new)
+        if tracked:
+            self._set_account(new, account)
+        await super().on_raw_nick(message)
+
+    def _forget_unseen(self):
+        """
+        Forget the accounts of users who no longer share a channel with the bot,
+        as the server stops sending their nick, quit, and account changes.
+        """
+        seen = {
+            self.normalize(user)
+            for channel in self.channels.values()
+            for user in channel["users"]
+        }
+        self._forget(*(nickname for nickname in self.accounts if nickname not in seen))
+
+    async def on_raw_part(self, message):
+        nickname, _ = self._parse_user(message.source)
+        self._forget(nickname)
+        await super().on_raw_part(message)
+        if self.is_same_nick(nickname, self.nickname):
+            self._forget_unseen()
+
+    async def on_raw_kick(self, message):
+        kicked = message.params[1].split(",")
+        self._forget(*kicked)
+        await super().on_raw_kick(message)
+        if any(self.is_same_nick(nickname, self.nickname) for nickname in kicked):
+            self._forget_unseen()
+
+    async def on_raw_quit(self, message):
+        self._forget(self._parse_user(message.source)[0])
+        await super().on_raw_quit(message)
+
+    async def on_raw_account(self, message):
+        nickname, _ = self._parse_user(message.source)
+        self.whois_cache.invalidate(nickname)
+        if self._capabilities.get("account-notify"):
+            self._set_account(nickname, message.params[0])
+        await super().on_raw_account(message)
+
+    async def on_raw_cap_del(self, params):
+        self.accounts.clear()
+        await super().on_raw_cap_del(params)
+
+    async def on_disconnect(self, expected):
+        self._performed.clear()
+        self.whois_cache.clear()
+        self.accounts.clear()
+        await super().on_disconnect(expected)
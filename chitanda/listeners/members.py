@@ -0,0 +1,105 @@
+import time
+from bisect import bisect_left, insort
+
+# The number of prefixes that found no members to remember per guild.
+MAX_MISSES = 1024
+# Seconds for which members and misses learned from queries are trusted. The
+# members of a complete index are kept up to date by member events instead.
+QUERY_TTL = 600
+
+
+class MemberIndex:
+    """
+    The known members of a Discord guild, searchable by case-insensitive
+    prefixes of their display names and usernames.
+
+    Unless the index is ``complete``, holding every member of the guild, it
+    only knows the members seen in queries and events. Other members may share
+    a prefix with them, so only exact name matches are answered from it.
+    """
+
+    def __init__(self):
+        self.complete = False
+        self._members = {}
+        self._added = {}  # Maps member ids to when they were indexed.
+        self._keys = {}  # Maps member ids to their entries in ``_names``.
+        self._names = []  # Sorted (lowercased name, member id) pairs.
+        self._misses = {}  # Maps prefixes that matched no member to when.
+
+    def __len__(self):
+        return len(self._members)
+
+    def add(self, member):
+        self.remove(member.id)
+        self._members[member.id] = member
+        self._added[member.id] = time.monotonic()
+        self._keys[member.id] = {
+            (name.lower(), member.id) for name in (member.display_name, member.name)
+        }
+        for key in self._keys[member.id]:
+            insort(self._names, key)
+        # A new name may match prefixes that previously matched nothing.
+        self._misses.clear()
+
+    def remove(self, member_id):
+        self._members.pop(member_id, None)
+        self._added.pop(member_id, None)
+        for key in self._keys.pop(member_id, ()):
+            del self._names[bisect_left(self._names, key)]
+
+    def refresh(self, user_id):
+        """Reindex a member after their username changes."""
+        if user_id in self._members:
+            self.add(self._members[user_id])
+
+    def fill(self, members):
+        """Index every member of the guild, making the index complete."""
+        for member in members:
+            self.add(member)
+        self.complete = True
+
+    def find(self, prefix):
+        """
+        Return the members whose names start with the prefix, an empty list if
+        none do, or ``None`` if the index can't tell.
+        """
+        prefix = prefix.lower()
+        if self._is_fresh(self._misses.get(prefix)):
+            return []
+
+        members = self._match(prefix)
+        if self.complete or any(
+            prefix in (member.display_name.lower(), member.name.lower())
+            for member in members
+        ):
+            return members
+        return None
+
+    def add_query_result(self, prefix, members):
+        for member in members:
+            self.add(member)
+        if not members:
+            if len(self._misses) >= MAX_MISSES:
+                self._misses.clear()
+            self._misses[prefix.lower()] = time.monotonic()
+
+    def _match(self, prefix):
+        ids = []
+        i = bisect_left(self._names, (prefix,))
+        while i < len(self._names) and self._names[i][0].startswith(prefix):
+            if self._names[i][1] not in ids:
+                ids.append(self._names[i][1])
+            i += 1
+
+        members = []
+        for id_ in ids:
+            if self._is_fresh(self._added[id_]):
+                members.append(self._members[id_])
+            else:
+                self.remove(id_)
+        return members
+
+    def _is_fresh(self, added):
+        return added is not None and (
+            self.complete or time.monotonic() - added < QUERY_TTL
+        )
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """
+    The priority of an outgoing message. Queued messages of a lower value are
+    sent before any message of a higher value.
+    """
+
+    REPLY = 0
+    RELAY = 1
+
+
+class TokenBucket:
+    """
+    A token bucket that refills at ``rate`` tokens per second and holds at most
+    ``burst`` tokens.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        self._refill()
+        if self._tokens < 1:
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+            self._refill()
+        self._tokens -= 1
+
+    def is_full(self):
+        self._refill()
+        return self._tokens >= self.burst
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class MessageScheduler:
+    """
+    Sends outgoing messages at the rate allowed by a token bucket. Messages are
+    queued per target, and the targets with queued messages are served
+    round-robin so that a flood to one target doesn't starve the others.
+    Messages of a more urgent priority are always sent first.
+
+    If ``merge`` is passed, it is called with a target and two messages queued
+    for it, and may return a single message to send in their place, or ``None``
+    if they should be sent separately.
+    """
+
+    def __init__(self, send, rate, burst, merge=None):
+        self._send = send
+        self._merge = merge
+        self._bucket = TokenBucket(rate, burst)
+        self._queues = {priority: OrderedDict() for priority in Priority}
+        self._task = None
+        self.depth = 0
+        self.sent = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+        self._total_wait = 0.0
+
+    def enqueue(self, target, message, priority=Priority.REPLY):
+        """
+        Queue a message, returning a future that completes once the message has
+        been sent, or has failed to send.
+        """
+        sent = asyncio.get_event_loop().create_future()
+        queue = self._queues[priority].setdefault(target, deque())
+        queue.append((message, time.monotonic(), sent))
+        self.depth += 1
+
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return sent
+
+    @property
+    def stats(self):
+        """Queue depth and wait time statistics for monitoring."""
+        return {
+            "depth": self.depth,
+            "depth_by_priority": {
+                priority.name.lower(): sum(len(q) for q in queues.values())
+                for priority, queues in self._queues.items()
+            },
+            "targets": len({t for queues in self._queues.values() for t in queues}),
+            "sent": self.sent,
+            "last_wait": self.last_wait,
+            "max_wait": self.max_wait,
+            "mean_wait": self._total_wait / self.sent if self.sent else 0.0,
+        }
+
+    async def _run(self):
+        try:
+            while self.depth:
+                await self._bucket.acquire()
+                target, message, queued_at, futures = self._pop()
+                self._record_wait(time.monotonic() - queued_at)
+                try:
+                    await self._send(target, message)
+                except Exception as e:
+                    logger.error(f"Failed to send message to {target}: {e}")
+                for sent in futures:
+                    if not sent.done():
+                        sent.set_result(None)
+        finally:
+            self._task = None
+
+    def _pop(self):
+        for queues in self._queues.values():
+            if queues:
+                target, queue = next(iter(queues.items()))
+                message, queued_at, sent = queue.popleft()
+                futures = [sent]
+                self.depth -= 1
+                while self._merge and queue:
+                    merged = self._merge(target, message, queue[0][0])
+                    if merged is None:
+                        break
+                    message = merged
+                    futures.append(queue.popleft()[2])
+                    self.depth -= 1
+                if queue:
+                    queues.move_to_end(target)
+                else:
+                    del queues[target]
+                return target, message, queued_at, futures
+
+    def _record_wait(self, wait):
+        self.sent += 1
+        self.last_wait = wait
+        self.max_wait = max(self.max_wait, wait)
+        self._total_wait += wait
+        if wait > 1:
+            logger.info(f"Outgoing message was throttled for {wait:.1f}s.")
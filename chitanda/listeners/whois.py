@@ -0,0 +1,51 @@
+import asyncio
+import time
+from functools import partial
+
+# Seconds that a WHOIS result is trusted for.
+WHOIS_TTL = 300
+
+
+class WhoisCache:
+    """
+    Caches WHOIS results per nickname for ``ttl`` seconds. Concurrent lookups
+    of the same nickname share a single WHOIS request.
+    """
+
+    def __init__(self, whois, normalize=str.lower, ttl=WHOIS_TTL):
+        self._whois = whois
+        self._normalize = normalize
+        self.ttl = ttl
+        self._results = {}
+        self._pending = {}
+
+    async def get(self, nickname):
+        key = self._normalize(nickname)
+        cached = self._results.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._whois(nickname))
+            task.add_done_callback(partial(self._store, key))
+        return await asyncio.shield(task)
+
+    def invalidate(self, *nicknames):
+        for nickname in nicknames:
+            key = self._normalize(nickname)
+            self._results.pop(key, None)
+            self._pending.pop(key, None)
+
+    def clear(self):
+        self._results.clear()
+        self._pending.clear()
+
+    def _store(self, key, task):
+        # A lookup invalidated while in flight is not cached.
+        if self._pending.get(key) is not task:
+            return
+
+        del self._pending[key]
+        if not task.cancelled() and task.exception() is None:
+            self._results[key] = (time.monotonic() + self.ttl, task.result())
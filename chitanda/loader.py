@@ -5,7 +5,7 @@ from pkgutil import iter_modules
 
 import chitanda.modules  # noqa
 from chitanda.config import config
-from chitanda.util import get_module_name
+from chitanda.util import CommandIndex, get_module_name
 
 
 def load_commands(bot, run_setup=True):
@@ -22,6 +22,8 @@ def load_commands(bot, run_setup=True):
             if run_setup and hasattr(sys.modules[name], "setup"):
                 sys.modules[name].setup(bot)
 
+    bot.command_index = CommandIndex(bot.commands, config["modules"])
+
 
 def _is_module_enabled(full_name):
     name = get_module_name(full_name)
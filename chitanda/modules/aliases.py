@@ -1,7 +1,7 @@
 from discord import Embed
 
 from chitanda.config import config
-from chitanda.decorators import args, register
+from chitanda.decorators import args, ordered, register
 from chitanda.listeners import DiscordListener
 
 
@@ -9,6 +9,7 @@ def setup(bot):  # pragma: no cover
     bot.message_handlers.append(alias_handler)
 
 
+@ordered
 async def alias_handler(message):
     if not message.contents.startswith(config["trigger_character"]):
         return
@@ -9,7 +9,7 @@ from discord import Embed
 
 from chitanda.config import config
 from chitanda.errors import BotError, InvalidListener
-from chitanda.listeners import DiscordListener
+from chitanda.listeners import DiscordListener, Priority
 from chitanda.util import get_listener, trim_message
 
 logger = logging.getLogger(__name__)
@@ -98,6 +98,7 @@ async def handle_push(listener, payload, cfg):
                 f'New tag {branch} tracking {payload["before"][:8]} pushed '
                 f'to {payload["repository"]["name"]}'
             ),
+            priority=Priority.RELAY,
         )
 
     if cfg["branches"] and branch not in cfg["branches"]:
@@ -121,17 +122,27 @@ async def _relay_push_discord(listener, channel, payload, branch):
             value=commit["url"].replace(commit["id"], commit["id"][:8]),
             inline=False,
         )
-    await listener.message(target=channel, message=embed, embed=True)
+    await listener.message(
+        target=channel, message=embed, embed=True, priority=Priority.RELAY
+    )
 
 
 async def _relay_push(listener, channel, payload, branch):
     await listener.message(
-        target=channel, message=_construct_push_message(payload, branch)
+        target=channel,
+        message=_construct_push_message(payload, branch),
+        priority=Priority.RELAY,
+    )
+    await listener.message(
+        target=channel,
+        message=f'Compare - {payload["compare"]}',
+        priority=Priority.RELAY,
     )
-    await listener.message(target=channel, message=f'Compare - {payload["compare"]}')
     for commit in payload["commits"]:
         await listener.message(
-            target=channel, message=_construct_commit_message(commit)
+            target=channel,
+            message=_construct_commit_message(commit),
+            priority=Priority.RELAY,
         )
 
 
@@ -163,6 +174,7 @@ async def handle_issue(listener, payload, cfg):
             f'{trim_message(payload["issue"]["title"], 200)} - '
             f'{payload["issue"]["html_url"]}'
         ),
+        priority=Priority.RELAY,
     )
 
 
@@ -177,6 +189,7 @@ async def handle_pull_request(listener, payload, cfg):
             f'{trim_message(payload["pull_request"]["title"], 200)} - '
             f'{payload["pull_request"]["html_url"]}'
         ),
+        priority=Priority.RELAY,
     )
 
 
@@ -2,103 +2,157 @@ import asyncio
 import logging
 from collections import defaultdict
 
+from pydle.features.rfc1459.protocol import MESSAGE_LENGTH_LIMIT
+
 from chitanda.bot import IRCListener
-from chitanda.database import database
+from chitanda.config import config
+from chitanda.database import db
+from chitanda.listeners.scheduler import TokenBucket
 
 logger = logging.getLogger(__name__)
 
+# The number of JOIN commands sent per second while rejoining channels.
+JOIN_RATE = 1
+
+# The longest comma-separated list of channels that fits in a JOIN command.
+JOIN_LENGTH = MESSAGE_LENGTH_LIMIT - len("JOIN \r\n")
+
+# Seconds to buffer joins and parts for before writing them to the database.
+FLUSH_DELAY = 1
+
+# Maps (channel, server) to whether the bot is in the channel, for joins and
+# parts not yet written to the database.
+_changes = {}
+_flush_task = None
+
 
 def setup(bot):  # pragma: no cover
     IRCListener.on_join = on_join
     IRCListener.on_part = on_part
+    bot.shutdown_handlers.append(flush)
 
-    channels = _get_channels_to_rejoin()
-    asyncio.ensure_future(_rejoin_channels(bot, channels))
+    asyncio.ensure_future(_rejoin(bot))
 
 
 async def on_join(self, channel, user):
     if self.is_same_nick(self.nickname, user):
-        with database() as (conn, cursor):
-            cursor.execute(
-                """
-                INSERT OR IGNORE INTO irc_channels (name, server)
-                VALUES (?, ?)
-                """,
-                (channel, self.hostname),
-            )
-            cursor.execute(
-                """
-                UPDATE irc_channels SET active = 1
-                WHERE name = ? AND server = ?
-                """,
-                (channel, self.hostname),
-            )
-            conn.commit()
+        _buffer_change(channel, self.hostname, True)
 
     await super(IRCListener, self).on_join(channel, user)
 
 
 async def on_part(self, channel, user, reason):
     if self.is_same_nick(self.nickname, user):
-        with database() as (conn, cursor):
-            cursor.execute(
-                """
-                UPDATE irc_channels SET active = 0
-                WHERE name = ? AND server = ?
-                """,
-                (channel, self.hostname),
-            )
-            conn.commit()
+        _buffer_change(channel, self.hostname, False)
 
     await super(IRCListener, self).on_part(channel, user, reason)
 
 
-def _get_channels_to_rejoin():
+def _buffer_change(channel, server, active):
+    global _flush_task
+    _changes[(channel, server)] = active
+    if _flush_task is None:
+        _flush_task = asyncio.ensure_future(_flush_later())
+
+
+async def _flush_later():
+    global _flush_task
+    try:
+        await asyncio.sleep(FLUSH_DELAY)
+    finally:
+        _flush_task = None
+    await flush()
+
+
+async def flush():
+    """Write the buffered joins and parts in one transaction."""
+    global _changes
+    changes, _changes = _changes, {}
+    if not changes:
+        return
+
+    try:
+        await db.transaction(_write_changes, changes)
+    except Exception as e:
+        logger.error(f"Failed to save IRC channel changes: {e}")
+        # Retry the changes with the next flush, unless they're outdated.
+        for key, active in changes.items():
+            _changes.setdefault(key, active)
+
+
+def _write_changes(cursor, changes):
+    cursor.executemany(
+        """
+        INSERT OR IGNORE INTO irc_channels (name, server)
+        VALUES (?, ?)
+        """,
+        list(changes),
+    )
+    cursor.executemany(
+        """
+        UPDATE irc_channels SET active = ?
+        WHERE name = ? AND server = ?
+        """,
+        [(active, channel, server) for (channel, server), active in changes.items()],
+    )
+
+
+async def _get_channels_to_rejoin():
     # Map server to a list of channels
     channels = defaultdict(list)
 
-    with database() as (conn, cursor):
-        cursor.execute(
-            """
-            SELECT name, server
-            FROM irc_channels
-            WHERE active = 1
-            """
-        )
-        for row in cursor.fetchall():
-            channels[row["server"]].append(row["name"])
+    rows = await db.fetchall(
+        """
+        SELECT name, server
+        FROM irc_channels
+        WHERE active = 1
+        """
+    )
+    for row in rows:
+        channels[row["server"]].append(row["name"])
 
     return channels
 
 
-async def _rejoin_channels(bot, channels):
+async def _rejoin(bot):
+    channels = await _get_channels_to_rejoin()
+    for server in set(channels) - set(bot.irc_listeners):
+        logger.info(f"Not rejoining channels on unconfigured IRC server {server}.")
+
+    await asyncio.gather(
+        *(
+            _rejoin_channels(listener, channels[server])
+            for server, listener in bot.irc_listeners.items()
+            if server in channels
+        )
+    )
+
+
+async def _rejoin_channels(listener, channels):
     """
-    Loop until the IRC listeners establish ther connections to the
-    IRC servers, then join the channels the bot was previously in.
+    Wait for the IRC listener to finish its performs, then join the channels the
+    bot was previously in, packing as many channels into each JOIN as fit.
     """
-    attempts = 0
-    while True:
-        for server, chan_names in list(channels.items()):
-            if server in bot.irc_listeners and bot.irc_listeners[server].performed:
-                for name in chan_names:
-                    logger.info(f"Rejoining IRC channel {name} on {server}.")
-                    await bot.irc_listeners[server].join(name)
-                del channels[server]
-
-        if not channels:
-            logger.info("All IRC channels rejoined.")
-            break
-
-        if attempts == 600:
-            logger.info(
-                "Some IRC channels have not been rejoined: "
-                + ", ".join(
-                    f"{chan}@{server}"
-                    for server, chans in channels.items()
-                    for chan in chans
-                )
-            )
-            break
-
-        attempts += 1
-        await asyncio.sleep(0.1)
+    await listener.wait_performed()
+
+    rate = config["irc_servers"][listener.hostname].get("join_rate", JOIN_RATE)
+    bucket = TokenBucket(rate, 1)
+    joined = 0
+    for batch in _pack_channels(channels):
+        await bucket.acquire()
+        await listener.rawmsg("JOIN", ",".join(batch))
+        joined += len(batch)
+        logger.info(
+            f"Rejoined {joined}/{len(channels)} IRC channels on {listener.hostname}."
+        )
+
+
+def _pack_channels(channels):
+    batch = []
+    for channel in channels:
+        if batch and len(",".join(batch + [channel]).encode()) > JOIN_LENGTH:
+            yield batch
+            batch = []
+        batch.append(channel)
+    if batch:
+        yield batch
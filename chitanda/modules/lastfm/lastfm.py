@@ -6,7 +6,7 @@ from json import JSONDecodeError
 import requests
 
 from chitanda.config import config
-from chitanda.database import database
+from chitanda.database import db
 from chitanda.decorators import args, auth_only, register
 from chitanda.errors import BotError
 
@@ -19,7 +19,7 @@ API_URL = "https://ws.audioscrobbler.com/2.0/"
 @auth_only
 async def call(message):
     """Relay your currently playing Last.FM track."""
-    lastfm = _get_lastfm_nick(message.username, message.listener)
+    lastfm = await _get_lastfm_nick(message.username, message.listener)
     response = await _get_now_playing(lastfm, message.formatted_author)
     track, album, artist = (
         response["name"],
@@ -38,20 +38,18 @@ async def call(message):
     )
 
 
-def _get_lastfm_nick(username, listener):
-    with database() as (conn, cursor):
-        cursor.execute(
-            """
-            SELECT lastfm
-            FROM lastfm
-            WHERE user = ?  AND listener = ?
-            """,
-            (username, str(listener)),
-        )
-        row = cursor.fetchone()
-        if not row:
-            raise BotError("No Last.FM name set.")
-        return row["lastfm"]
+async def _get_lastfm_nick(username, listener):
+    row = await db.fetchone(
+        """
+        SELECT lastfm
+        FROM lastfm
+        WHERE user = ?  AND listener = ?
+        """,
+        (username, str(listener)),
+    )
+    if not row:
+        raise BotError("No Last.FM name set.")
+    return row["lastfm"]
 
 
 async def _get_now_playing(lastfm, formatted_author=None):
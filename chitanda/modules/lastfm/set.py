@@ -1,4 +1,4 @@
-from chitanda.database import database
+from chitanda.database import db
 from chitanda.decorators import args, auth_only, register
 
 
@@ -8,18 +8,20 @@ from chitanda.decorators import args, auth_only, register
 async def call(message):
     """Set a Last.FM name for the nowplaying command."""
     lastfm = message.args[0]
-    with database() as (conn, cursor):
-        cursor.execute(
-            """
-            INSERT OR IGNORE INTO lastfm (
-                user, listener, lastfm
-            ) VALUES (?, ?, ?)
-            """,
-            (message.username, str(message.listener), lastfm),
-        )
-        cursor.execute(
-            "UPDATE lastfm SET lastfm = ? WHERE user = ? AND listener = ?",
-            (lastfm, message.username, str(message.listener)),
-        )
-        conn.commit()
+    await db.transaction(_set_lastfm, message.username, message.listener, lastfm)
     return f"Set Last.FM username to {lastfm}."
+
+
+def _set_lastfm(cursor, username, listener, lastfm):
+    cursor.execute(
+        """
+        INSERT OR IGNORE INTO lastfm (
+            user, listener, lastfm
+        ) VALUES (?, ?, ?)
+        """,
+        (username, str(listener), lastfm),
+    )
+    cursor.execute(
+        "UPDATE lastfm SET lastfm = ? WHERE user = ? AND listener = ?",
+        (lastfm, username, str(listener)),
+    )
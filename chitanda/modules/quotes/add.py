@@ -1,6 +1,10 @@
-from chitanda.database import database
+import sqlite3
+
+from chitanda.database import db
 from chitanda.decorators import args, auth_only, channel_only, register
 
+from . import ids
+
 
 @register("quote add")
 @channel_only
@@ -8,37 +12,43 @@ from chitanda.decorators import args, auth_only, channel_only, register
 @auth_only
 async def call(message):
     """Add a quote to the database."""
-    with database() as (conn, cursor):
-        new_quote_id = _get_quote_id(cursor, message.listener, message.target)
-        cursor.execute(
-            """
-            INSERT INTO quotes (
-                id, channel, listener, quote, adder
-            ) VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                new_quote_id,
-                message.target,
-                str(message.listener),
-                message.args[0],
-                message.username,
-            ),
-        )
-        conn.commit()
+    new_quote_id = await db.transaction(
+        _add_quote,
+        message.listener,
+        message.target,
+        message.args[0],
+        message.username,
+    )
     return f"Added quote with ID {new_quote_id}."
 
 
-def _get_quote_id(cursor, listener, target):
+def _add_quote(cursor, listener, target, quote, adder):
+    try:
+        new_quote_id = _insert_quote(cursor, listener, target, quote, adder)
+    except sqlite3.IntegrityError:
+        # The cached IDs are stale, so reload them and try again.
+        ids.invalidate(listener, target)
+        new_quote_id = _insert_quote(cursor, listener, target, quote, adder)
+
+    # Commit before caching the ID, so that readers never pick a quote that
+    # isn't saved yet.
+    cursor.connection.commit()
+    ids.add_id(listener, target, new_quote_id)
+    return new_quote_id
+
+
+def _insert_quote(cursor, listener, target, quote, adder):
+    new_quote_id = _get_quote_id(cursor, listener, target)
     cursor.execute(
         """
-        SELECT max(id)
-        FROM quotes
-        WHERE listener = ? AND channel = ?
+        INSERT INTO quotes (
+            id, channel, listener, quote, adder
+        ) VALUES (?, ?, ?, ?, ?)
         """,
-        (str(listener), target),
+        (new_quote_id, target, str(listener), quote, adder),
     )
-    row = cursor.fetchone()
-    try:
-        return row[0] + 1
-    except TypeError:
-        return 1
+    return new_quote_id
+
+
+def _get_quote_id(cursor, listener, target):
+    return ids.next_id(cursor, listener, target)
@@ -1,8 +1,8 @@
-from chitanda.database import database
+from chitanda.database import db
 from chitanda.decorators import admin_only, args, channel_only, register
 from chitanda.errors import BotError
 
-from . import fetch
+from . import fetch, ids
 
 
 @register("quote del")
@@ -12,27 +12,31 @@ from . import fetch
 async def call(message):
     """Delete a quote from the database."""
     quote_ids = _parse_quote_ids(message.args[0])
-    with database() as (conn, cursor):
-        yield "Deleted the following quotes:"
-        for quote in fetch.fetch_quotes(
-            cursor, message.target, message.listener, quote_ids.copy()
-        ):
-            yield quote
+    quotes = await db.transaction(
+        _delete_quotes, message.target, message.listener, quote_ids
+    )
+    yield "Deleted the following quotes:"
+    for quote in quotes:
+        yield quote
 
-        cursor.execute(
-            """
-            DELETE FROM quotes
-            WHERE
-                channel = ?
-                AND listener = ?
-                AND id IN ("""
-            + (",".join(["?"] * len(quote_ids)))
-            + """)
-            """,
-            (message.target, str(message.listener), *quote_ids),
-        )
 
-        conn.commit()
+def _delete_quotes(cursor, target, listener, quote_ids):
+    quotes = fetch.fetch_quotes(cursor, target, listener, quote_ids.copy())
+    cursor.execute(
+        """
+        DELETE FROM quotes
+        WHERE
+            channel = ?
+            AND listener = ?
+            AND id IN ("""
+        + (",".join(["?"] * len(quote_ids)))
+        + """)
+        """,
+        (target, str(listener), *quote_ids),
+    )
+    cursor.connection.commit()
+    ids.remove_ids(listener, target, quote_ids)
+    return quotes
 
 
 def _parse_quote_ids(message):
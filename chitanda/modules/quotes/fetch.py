@@ -1,21 +1,22 @@
-from chitanda.database import database
+from chitanda.database import db
 from chitanda.decorators import channel_only, register
 from chitanda.errors import BotError
 
+from . import ids
+
 
 @register("quote")
 @channel_only
 async def call(message):
     """Fetch quotes by ID or one random quote from the channel."""
-    with database() as (conn, cursor):
-        if not message.contents:
-            yield _fetch_random_quote(cursor, message.target, message.listener)
-        else:
-            quote_ids = _parse_quote_ids(message.contents)
-            for quote in fetch_quotes(
-                cursor, message.target, message.listener, quote_ids
-            ):
-                yield quote
+    if not message.contents:
+        yield await db.read(_fetch_random_quote, message.target, message.listener)
+    else:
+        quote_ids = _parse_quote_ids(message.contents)
+        for quote in await db.read(
+            fetch_quotes, message.target, message.listener, quote_ids
+        ):
+            yield quote
 
 
 def fetch_quotes(cursor, target, listener, quote_ids):
@@ -37,12 +38,15 @@ def fetch_quotes(cursor, target, listener, quote_ids):
         """,
         (target, str(listener), *quote_ids),
     )
-    quotes = cursor.fetchall()
-    for quote in quotes:
-        yield f'#{quote["id"]} by {quote["adder"]}: {quote["quote"]}'
+    quotes = []
+    for quote in cursor.fetchall():
+        quotes.append(f'#{quote["id"]} by {quote["adder"]}: {quote["quote"]}')
         quote_ids.remove(quote["id"])
     if quote_ids:
-        yield (f'Quote(s) {", ".join(str(qid) for qid in quote_ids)} ' "do not exist.")
+        quotes.append(
+            f'Quote(s) {", ".join(str(qid) for qid in quote_ids)} do not exist.'
+        )
+    return quotes
 
 
 def _parse_quote_ids(message):
@@ -57,23 +61,31 @@ def _parse_quote_ids(message):
 
 
 def _fetch_random_quote(cursor, target, listener):
-    cursor.execute(
-        """
-        SELECT
-            id,
-            quote,
-            time,
-            adder
-        FROM quotes
-        WHERE
-            channel = ?
-            AND listener = ?
-        ORDER BY random()
-        LIMIT 1
-        """,
-        (target, str(listener)),
-    )
-    quote = cursor.fetchone()
-    if quote:
-        return f'#{quote["id"]} by {quote["adder"]}: {quote["quote"]}'
+    for _ in range(2):
+        quote_id = ids.random_id(cursor, listener, target)
+        if quote_id is None:
+            break
+
+        cursor.execute(
+            """
+            SELECT
+                id,
+                quote,
+                time,
+                adder
+            FROM quotes
+            WHERE
+                id = ?
+                AND channel = ?
+                AND listener = ?
+            """,
+            (quote_id, target, str(listener)),
+        )
+        quote = cursor.fetchone()
+        if quote:
+            return f'#{quote["id"]} by {quote["adder"]}: {quote["quote"]}'
+
+        # The cached IDs are stale, so reload them and try again.
+        ids.invalidate(listener, target)
+
     return "This channel has no quotes saved."
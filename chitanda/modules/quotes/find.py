@@ -1,33 +1,67 @@
-from chitanda.database import database
+import re
+
+from chitanda.database import db
 from chitanda.decorators import args, channel_only, register
 
+TERM_REGEX = re.compile(r'"([^"]*)"|(\S+)')
+
 
 @register("quote find")
 @channel_only
 @args(r"(.+)")
 async def call(message):
     """Find a quote by its content."""
-    with database() as (conn, cursor):
-        cursor.execute(
-            """
-            SELECT
-                id,
-                quote,
-                time,
-                adder
-            FROM quotes
-            WHERE
-                channel = ?
-                AND listener = ?
-                AND quote LIKE ?
-            ORDER BY random()
-            LIMIT 3
-            """,
-            (message.target, str(message.listener), f"%{message.args[0]}%"),
-        )
-        quotes = cursor.fetchall()
-        if quotes:
-            for quote in quotes:
-                yield f'#{quote["id"]} by {quote["adder"]}: {quote["quote"]}'
+    query = _build_query(message.args[0])
+    quotes = await _search_quotes(message, query) if query else []
+    if quotes:
+        for quote in quotes:
+            yield f'#{quote["id"]} by {quote["adder"]}: {quote["quote"]}'
+    else:
+        yield "No quotes found."
+
+
+async def _search_quotes(message, query):
+    return await db.fetchall(
+        """
+        SELECT
+            quotes.id,
+            quotes.quote,
+            quotes.time,
+            quotes.adder
+        FROM quotes_fts
+        JOIN quotes
+            ON quotes.id = quotes_fts.id
+            AND quotes.channel = quotes_fts.channel
+            AND quotes.listener = quotes_fts.listener
+        WHERE
+            quotes_fts MATCH ?
+            AND quotes_fts.channel = ?
+            AND quotes_fts.listener = ?
+        ORDER BY bm25(quotes_fts)
+        LIMIT 3
+        """,
+        (query, str(message.target), str(message.listener)),
+    )
+
+
+def _build_query(search):
+    """
+    Convert a search into an FTS5 query matching quotes that contain all of
+    its terms. Double-quoted text is searched as a phrase and a term ending
+    with ``*`` is searched as a prefix. Everything else is quoted, so that
+    FTS5 operators and punctuation in the search are matched literally.
+    """
+    terms = []
+    for phrase, word in TERM_REGEX.findall(search):
+        if phrase:
+            terms.append(_quote(phrase))
+        elif word.endswith("*") and len(word) > 1:
+            terms.append(f"{_quote(word.rstrip('*'))}*")
         else:
-            yield "No quotes found."
+            terms.append(_quote(word))
+    return " ".join(terms)
+
+
+def _quote(text):
+    escaped = text.replace('"', '""')
+    return f'"{escaped}"'
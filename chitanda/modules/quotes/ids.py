@@ -0,0 +1,85 @@
+import random
+import threading
+from bisect import insort
+
+# Map (listener, channel) to a sorted list of the channel's quote IDs. A list is
+# loaded on first use and kept up to date as quotes are added and deleted, so
+# that picking a random quote or the next quote ID doesn't scan the channel.
+_ids = {}
+# Map (listener, channel) to a count of the changes to the channel's IDs, so
+# that a list loaded while the IDs changed isn't cached.
+_versions = {}
+_lock = threading.Lock()
+
+
+def next_id(cursor, listener, channel):
+    ids = _get_ids(cursor, listener, channel)
+    with _lock:
+        return ids[-1] + 1 if ids else 1
+
+
+def random_id(cursor, listener, channel):
+    ids = _get_ids(cursor, listener, channel)
+    with _lock:
+        return random.choice(ids) if ids else None
+
+
+def add_id(listener, channel, quote_id):
+    """Cache the ID of a new quote. Call this once the quote is committed."""
+    with _lock:
+        ids = _ids.get(_changed(listener, channel))
+        if ids is not None:
+            insort(ids, quote_id)
+
+
+def remove_ids(listener, channel, quote_ids):
+    with _lock:
+        ids = _ids.get(_changed(listener, channel))
+        if ids is not None:
+            quote_ids = set(quote_ids)
+            ids[:] = [id_ for id_ in ids if id_ not in quote_ids]
+
+
+def invalidate(listener, channel):
+    with _lock:
+        _ids.pop(_changed(listener, channel), None)
+
+
+def _get_ids(cursor, listener, channel):
+    key = _key(listener, channel)
+    with _lock:
+        if key in _ids:
+            return _ids[key]
+        version = _versions.get(key, 0)
+
+    cursor.execute(
+        """
+        SELECT id
+        FROM quotes
+        WHERE listener = ? AND channel = ?
+        ORDER BY id ASC
+        """,
+        key,
+    )
+    ids = [row["id"] for row in cursor.fetchall()]
+
+    # Another thread may have loaded the list in the meantime, and possibly
+    # already added to it. If the IDs changed while this list was loaded, it
+    # may be missing the change, so it's used only once.
+    with _lock:
+        if key in _ids:
+            return _ids[key]
+        if _versions.get(key, 0) == version:
+            _ids[key] = ids
+        return ids
+
+
+def _key(listener, channel):
+    return str(listener), str(channel)
+
+
+def _changed(listener, channel):
+    """Record a change to the channel's IDs and return its key."""
+    key = _key(listener, channel)
+    _versions[key] = _versions.get(key, 0) + 1
+    return key
@@ -0,0 +1,26 @@
+CREATE VIRTUAL TABLE quotes_fts USING fts5 (
+    quote,
+    id UNINDEXED,
+    channel UNINDEXED,
+    listener UNINDEXED
+);
+
+INSERT INTO quotes_fts (quote, id, channel, listener)
+SELECT quote, id, channel, listener FROM quotes;
+
+CREATE TRIGGER quotes_fts_insert AFTER INSERT ON quotes BEGIN
+    INSERT INTO quotes_fts (quote, id, channel, listener)
+    VALUES (new.quote, new.id, new.channel, new.listener);
+END;
+
+CREATE TRIGGER quotes_fts_delete AFTER DELETE ON quotes BEGIN
+    DELETE FROM quotes_fts
+    WHERE id = old.id AND channel = old.channel AND listener = old.listener;
+END;
+
+CREATE TRIGGER quotes_fts_update AFTER UPDATE ON quotes BEGIN
+    DELETE FROM quotes_fts
+    WHERE id = old.id AND channel = old.channel AND listener = old.listener;
+    INSERT INTO quotes_fts (quote, id, channel, listener)
+    VALUES (new.quote, new.id, new.channel, new.listener);
+END;
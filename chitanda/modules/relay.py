@@ -1,23 +1,145 @@
+import asyncio
 import logging
 import re
+import time
+from collections import defaultdict, deque
 from functools import singledispatch
+from urllib.parse import urlparse
 
 import aiohttp
 from discord import AsyncWebhookAdapter, Webhook
 
 from chitanda.config import config
-from chitanda.listeners import DiscordListener, IRCListener
+from chitanda.decorators import ordered
+from chitanda.errors import InvalidListener
+from chitanda.listeners import DiscordListener, IRCListener, Priority
 from chitanda.util import get_listener
 
 logger = logging.getLogger(__name__)
 
+# Maps (listener, channel) to a tuple of the (listener, target) pairs linked to
+# it. It is rebuilt whenever the relay config is reloaded.
+_index = {}
+_index_links = None  # The relay config that the index was built from.
+
+# The maximum number of targets relayed to at once.
+RELAY_CONCURRENCY = 8
+
+# Defaults for the ``relay_queue`` config: the number of messages queued per
+# target, the seconds within which messages from one author are merged, and
+# whether to ``drop_oldest`` or ``summarize`` messages that overflow the queue.
+DEFAULT_QUEUE_CONFIG = {"size": 50, "window": 2, "overflow": "drop_oldest"}
+# The longest message that merged messages may add up to.
+MAX_MERGED_LENGTH = 2000
+# The webhook username of relayed messages without an author, such as the
+# notices of skipped messages.
+RELAY_USERNAME = "relay"
+
+_semaphore = None
+_queues = {}  # Maps (listener, channel) to the target's RelayQueue.
+_sessions = {}  # Maps webhook hosts to their HTTP sessions.
+_webhooks = {}  # Maps webhook URLs to their Webhook objects.
+
+
+class RelayQueue:
+    """
+    A bounded queue of messages to relay to one target, sent in order by its
+    own task. While messages back up, consecutive messages from one author
+    sent within the window of each other are merged into one.
+    """
+
+    def __init__(self, listener, target, size, window, overflow):
+        self.listener = listener
+        self.target = target
+        self.size = size
+        self.window = window
+        self.overflow = overflow
+        self.items = deque()  # Lists of [author, message, queued_at].
+        self.task = None
+        self.skipped = 0  # Dropped messages not yet summarized.
+        self.dropped = 0
+        self.lag = 0.0
+        self.max_lag = 0.0
+
+    def put(self, author, message):
+        now = time.monotonic()
+        if self.items:
+            last = self.items[-1]
+            merged = last[1] + _merge_separator(self.listener) + message
+            if (
+                last[0] == author
+                and now - last[2] <= self.window
+                and len(merged) <= MAX_MERGED_LENGTH
+            ):
+                last[1] = merged
+                return
+
+        if len(self.items) >= self.size:
+            self.items.popleft()
+            self.skipped += 1
+            self.dropped += 1
+        self.items.append([author, message, now])
+
+        if self.task is None:
+            self.task = asyncio.ensure_future(self._run())
+
+    @property
+    def stats(self):
+        """Queue depth, lag, and drop statistics for monitoring."""
+        return {
+            "depth": len(self.items),
+            "lag": self.lag,
+            "max_lag": self.max_lag,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self):
+        try:
+            while self.items:
+                if self.skipped:
+                    await self._send_skipped()
+                author, message, queued_at = self.items.popleft()
+                self.lag = time.monotonic() - queued_at
+                self.max_lag = max(self.max_lag, self.lag)
+                await self._send(author, message)
+        finally:
+            self.task = None
+
+    async def _send_skipped(self):
+        skipped, self.skipped = self.skipped, 0
+        logger.info(f'Dropped {skipped} messages relayed to {self.target["channel"]}.')
+        if self.overflow == "summarize":
+            await self._send(None, f"[{skipped} messages skipped]")
+
+    async def _send(self, author, message):
+        global _semaphore
+        if _semaphore is None:
+            _semaphore = asyncio.Semaphore(RELAY_CONCURRENCY)
+
+        async with _semaphore:
+            try:
+                await _relay_message(self.listener, self.target, author, message)
+            except Exception as e:
+                logger.error(f'Failed to relay to {self.target["channel"]}: {e}')
+
+
+def get_queue_stats():
+    """Statistics of each target's relay queue, keyed by listener and channel."""
+    return {
+        (str(listener), channel): queue.stats
+        for (listener, channel), queue in _queues.items()
+    }
+
 
 def setup(bot):  # pragma: no cover
     bot.message_handlers.append(on_message)
     bot.response_handlers.append(on_response)
+    bot.shutdown_handlers.append(_close_sessions)
 
 
+@ordered
 async def on_message(message):
+    # Ordered, so that a message is queued before any response to it.
     await _relay(
         message.bot,
         message.listener,
@@ -37,29 +159,69 @@ async def on_response(response):
 
 
 async def _relay(bot, listener, target, contents, source=None):
-    targets = _get_linked_targets(listener, target)
-    for target in targets:
-        target_listener = get_listener(bot, target["listener"])
-        for (author, message) in _get_relay_messages(listener, contents, source):
-            await _relay_message(target_listener, target, author, message)
+    targets = _get_linked_targets(bot, listener, target)
+    if not targets:
+        return
+
+    messages = list(_get_relay_messages(listener, contents, source))
+    for target_listener, link_target in targets:
+        queue = _get_queue(target_listener, link_target)
+        for (author, message) in messages:
+            queue.put(author, message)
+
+
+def _get_queue(listener, target):
+    key = (listener, str(target["channel"]))
+    if key not in _queues:
+        _queues[key] = RelayQueue(
+            listener,
+            target,
+            **{**DEFAULT_QUEUE_CONFIG, **config.get("relay_queue", {})},
+        )
+    return _queues[key]
+
+
+@singledispatch
+def _merge_separator(listener):
+    return " | "
+
 
+@_merge_separator.register(DiscordListener)
+def _merge_separator_discord(listener):
+    return "\n"
 
-def _get_linked_targets(listener, target):
+
+def _get_linked_targets(bot, listener, target):
     """
     Get all targets that are linked to the message source.
     """
-    targets = []
-    for link in config["relay"]:
-        link = link.copy()
-        for i, link_target in enumerate(link):
-            eq_listener = link_target["listener"] == str(listener)
-            eq_target = link_target["channel"] == str(target)
-            if eq_listener and eq_target:
-                del link[i]
-                targets += link
-                break
+    global _index, _index_links
+    if config["relay"] is not _index_links:
+        _index, _index_links = _build_index(bot, config["relay"]), config["relay"]
+
+    return _index.get((listener, str(target)), ())
 
-    return targets
+
+def _build_index(bot, links):
+    index = defaultdict(list)
+    for link in links:
+        resolved = []
+        for link_target in link:
+            try:
+                resolved.append(
+                    (get_listener(bot, link_target["listener"]), link_target)
+                )
+            except InvalidListener:
+                logger.warning(
+                    f'Relay listener {link_target["listener"]} does not exist.'
+                )
+
+        for listener, link_target in resolved:
+            index[(listener, str(link_target["channel"]))] += [
+                pair for pair in resolved if pair[1] is not link_target
+            ]
+
+    return {key: tuple(targets) for key, targets in index.items()}
 
 
 @singledispatch
@@ -105,7 +267,12 @@ async def _relay_message(listener, target, author, message):
     """
     This relays the message to the target.
     """
-    await listener.message(target["channel"], f"<{author}> {message}")
+    if author:
+        message = f"<{author}> {message}"
+
+    await listener.message(
+        target["channel"], message, priority=Priority.RELAY, wait=True
+    )
 
 
 @_relay_message.register(IRCListener)
@@ -120,26 +287,50 @@ async def _relay_irc(listener, target, author, message):
         author = f"\x03{color:02d}\x02<{author[:1]}\x02\x02{author[1:]}>\x02\x0F"
         message = f"{author} {message}"
 
-    await listener.message(target["channel"], message)
+    await listener.message(
+        target["channel"], message, priority=Priority.RELAY, wait=True
+    )
 
 
 @_relay_message.register(DiscordListener)
 async def _relay_discord(listener, target, author, message):
     """
     For Discord, relay the message using a webhook. Requires server admin to
-    configure a webhook endpoint.
+    configure a webhook endpoint. Messages without an author are sent under
+    a fixed username, as there is no member to take an avatar from.
     """
-    async with aiohttp.ClientSession() as session:
-        webhook = Webhook.from_url(
-            target["webhook"],
-            adapter=AsyncWebhookAdapter(session),
-        )
+    if author:
+        avatar_url = await _locate_sender_avatar_url(listener, target, author)
+    else:
+        author, avatar_url = RELAY_USERNAME, None
+
+    await _get_webhook(target["webhook"]).send(
+        content=await _substitute_discord_nicknames(listener, target, message),
+        username=author,
+        avatar_url=avatar_url,
+    )
 
-        await webhook.send(
-            content=await _substitute_discord_nicknames(listener, target, message),
-            username=author,
-            avatar_url=await _locate_sender_avatar_url(listener, target, author),
+
+def _get_webhook(url):
+    """
+    Get the webhook for a URL. Webhooks are cached, and webhooks on the same
+    host share an HTTP session so that connections are reused.
+    """
+    if url not in _webhooks:
+        host = urlparse(url).netloc
+        if host not in _sessions:
+            _sessions[host] = aiohttp.ClientSession()
+        _webhooks[url] = Webhook.from_url(
+            url, adapter=AsyncWebhookAdapter(_sessions[host])
         )
+    return _webhooks[url]
+
+
+async def _close_sessions():
+    for session in _sessions.values():
+        await session.close()
+    _sessions.clear()
+    _webhooks.clear()
 
 
 async def _locate_sender_avatar_url(listener, target, author):
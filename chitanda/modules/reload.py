@@ -19,6 +19,9 @@ async def call(message):
         logger.error(f"Error reloading config: {e}")
         raise BotError("Couldn't reload config.")
 
+    # Reloading re-runs the modules' code, which resets their state, so state
+    # such as buffered writes and open sessions is saved and closed first.
+    await message.bot.run_shutdown_handlers()
     try:
         load_commands(message.bot, run_setup=False)
     except Exception as e:  # noqa: E203
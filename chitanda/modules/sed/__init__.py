@@ -0,0 +1,165 @@
+import logging
+import re
+from functools import lru_cache
+
+from chitanda.config import config
+from chitanda.decorators import args, channel_only, ordered, register
+from chitanda.errors import BotError
+from chitanda.history import history
+from chitanda.listeners import DiscordListener, IRCListener
+from chitanda.modules.sed.literals import candidates, required_literals
+from chitanda.modules.sed.nfa import Regex, Unsupported
+from chitanda.modules.sed.pool import WorkerPool, find_and_replace
+from chitanda.util import irc_unstyle, trim_message
+
+logger = logging.getLogger(__name__)
+
+PATTERN = r"(?:\.| )?s/(.*?)(?<!\\)/(.*?)(?:(?<!\\)/([gi]{,2})?)?$"
+REGEX = re.compile(PATTERN)
+REGEX_WITH_PREFIX = re.compile(r".sed +" + PATTERN)
+TIMEOUT = 1
+# The most work that the linear-time matcher may do on the event loop per
+# substitution, counted as its program size times the characters searched.
+# This keeps the slowest in-process searches to a few milliseconds. Larger
+# searches are run in the workers, where they can time out.
+LINEAR_BUDGET = 10_000
+# The number of worker processes that substitutions are run in.
+POOL_SIZE = 2
+
+_pool = None
+
+
+def setup(bot):  # pragma: no cover
+    bot.message_handlers.append(log_message)
+    bot.message_handlers.append(on_message)
+    bot.response_handlers.append(on_response)
+    bot.shutdown_handlers.append(_close_pool)
+
+
+@ordered
+async def log_message(message):
+    # Ordered, so that a message is logged before any response to it.
+    if not message.private and not (
+        REGEX.match(message.contents) or REGEX_WITH_PREFIX.match(message.contents)
+    ):
+        history.add(
+            message.listener,
+            message.target,
+            message.formatted_author,
+            _clean_message(message.contents, message.listener),
+        )
+
+
+async def on_message(message):
+    if not message.private:
+        match = REGEX.match(message.contents)
+        if match:
+            message_log = history.get(message.listener, message.target)
+            return await _substitute(match.groups(), message_log)
+
+
+async def on_response(response):
+    history.add(
+        response.listener,
+        response.target,
+        _get_author(response.listener),
+        _clean_message(response.contents, response.listener),
+    )
+
+
+def _get_author(listener):
+    if isinstance(listener, DiscordListener):
+        return f"<@{listener.user.id}>"
+    elif isinstance(listener, IRCListener):
+        return listener.nickname
+
+
+@register("sed")
+@channel_only
+@args(REGEX)
+async def call(message):
+    """Find and replace a message in the message history."""
+    return await _substitute(
+        message.args, history.get(message.listener, message.target)
+    )
+
+
+async def _substitute(match, message_log):
+    flags = _parse_flags(match[2])
+    regex = _compile_regex(match[0], flags)
+
+    count = 0 if flags["global"] else 1
+
+    response = await _find_and_replace(message_log, regex, match[1], count)
+    return trim_message(response, length=400)
+
+
+async def _find_and_replace(message_log, regex, repl, count):
+    ignorecase = bool(regex.flags & re.IGNORECASE)
+    prefilter = {
+        "literals": required_literals(regex.pattern, ignorecase),
+        "folded": ignorecase,
+    }
+
+    linear_regex = _compile_linear_regex(regex.pattern, ignorecase)
+    if (
+        linear_regex is not None
+        and config.get("sed", {}).get("linear", True)
+        and _within_linear_budget(linear_regex, message_log, prefilter)
+    ):
+        return find_and_replace(message_log, linear_regex, repl, count, **prefilter)
+
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool(POOL_SIZE)
+    return await _pool.run(message_log, regex, repl, count, TIMEOUT, **prefilter)
+
+
+@lru_cache(maxsize=64)
+def _compile_linear_regex(pattern, ignorecase):
+    """
+    Compile the pattern for the linear-time matcher, which is safe to run
+    in-process, or return ``None`` if the pattern needs the ``re`` engine.
+    """
+    try:
+        return Regex(pattern, ignorecase=ignorecase)
+    except Unsupported:
+        return None
+
+
+def _within_linear_budget(linear_regex, message_log, prefilter):
+    budget = LINEAR_BUDGET // linear_regex.size
+    for line in candidates(message_log, **prefilter):
+        budget -= len(line)
+        if budget < 0:
+            return False
+    return True
+
+
+async def _close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def _parse_flags(flags):
+    return {
+        "global": "g" in flags if flags else False,
+        "nocase": "i" in flags if flags else False,
+    }
+
+
+def _compile_regex(regex, flags):
+    try:
+        if flags["nocase"]:
+            return re.compile(regex, flags=re.IGNORECASE)
+        return re.compile(regex)
+    except re.error:  # noqa E722
+        raise BotError(f"{regex} is not a valid regex.")
+
+
+def _clean_message(message, listener):
+    if isinstance(listener, IRCListener):
+        return irc_unstyle(message)
+    return message
@@ -0,0 +1,142 @@
+import re
+from functools import lru_cache
+
+from chitanda.modules.sed.nfa import ESCAPES, QUANTIFIER
+
+# The number of characters consumed after the backslash by escapes whose
+# arguments aren't literals.
+_ESCAPE_LENGTHS = {"x": 3, "u": 5, "U": 9}
+_INLINE_FLAGS = re.compile(r"\(\?[aiLmsux-]")
+# Characters that ``re`` matches case-insensitively with each other, but whose
+# case-folded forms don't contain each other.
+_UNFOLDABLE = re.compile("[iI\u0130\u0131]")
+
+
+@lru_cache(maxsize=64)
+def required_literals(pattern, ignorecase=False):
+    """
+    Return substrings that every match of the pattern must contain, longest
+    first. Only literals outside of groups and character classes are found,
+    and none are found if the pattern has a top-level alternation or inline
+    flags, so the result may be empty but never contains a substring that a
+    match could lack.
+    """
+    if _INLINE_FLAGS.search(pattern):
+        return ()
+    tokens = _tokenize(pattern)
+    if tokens is None:
+        return ()
+
+    literals = []
+    run = []
+    for index, (kind, value) in enumerate(tokens):
+        following = tokens[index + 1] if index + 1 < len(tokens) else (None, None)
+        if kind == "literal" and following[0] == "repeat":
+            # A repeated literal is required once unless it can repeat zero
+            # times, and ends the run either way.
+            if following[1]:
+                run.append(value)
+            literals.append("".join(run))
+            run = []
+        elif kind == "literal":
+            run.append(value)
+        elif kind != "repeat":
+            literals.append("".join(run))
+            run = []
+    literals.append("".join(run))
+
+    if ignorecase:
+        # Any part of a required literal is also required, so literals are
+        # split around the characters that case folding can't compare.
+        literals = [
+            part.casefold()
+            for literal in literals
+            for part in _UNFOLDABLE.split(literal)
+        ]
+    literals = {literal for literal in literals if literal}
+    return tuple(sorted(literals, key=lambda literal: (-len(literal), literal)))
+
+
+def candidates(message_log, literals, folded=False):
+    """
+    Yield the lines of the message log that contain every literal. If
+    ``folded`` is true, the literals are case-folded and are looked for in the
+    log's case-folded lines.
+    """
+    if not literals:
+        yield from message_log
+    elif folded:
+        for line, folded in zip(message_log, message_log.folded()):
+            if all(literal in folded for literal in literals):
+                yield line
+    else:
+        for line in message_log:
+            if all(literal in line for literal in literals):
+                yield line
+
+
+def _tokenize(pattern):
+    """
+    Split the top level of the pattern into ``("literal", char)``,
+    ``("repeat", is_required)``, and ``("other", None)`` tokens, or return
+    ``None`` if the pattern has a top-level alternation.
+    """
+    tokens = []
+    depth = 0
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\":
+            token, index = _escape(pattern, index + 1)
+        elif char == "[":
+            token, index = ("other", None), _skip_class(pattern, index + 1)
+        elif char in "()":
+            # A group is a single token, added when it's opened.
+            depth += 1 if char == "(" else -1
+            token, index = ("other", None), index + 1
+            if char == ")":
+                continue
+        elif char == "|" and not depth:
+            return None
+        elif char in "*+?":
+            token, index = ("repeat", char == "+"), index + 1
+        elif char == "{" and pattern[index : index + 2] != "{}":
+            match = QUANTIFIER.match(pattern, index)
+            if match:
+                token, index = ("repeat", int(match.group(1) or 0) > 0), match.end()
+            else:
+                token, index = ("literal", char), index + 1
+        elif char in ".^$":
+            token, index = ("other", None), index + 1
+        else:
+            token, index = ("literal", char), index + 1
+
+        if depth == 0 or (char == "(" and depth == 1):
+            tokens.append(token)
+    return tokens
+
+
+def _escape(pattern, index):
+    char = pattern[index]
+    if char in ESCAPES:
+        return ("literal", ESCAPES[char]), index + 1
+    elif char.isdigit():
+        while index < len(pattern) and pattern[index].isdigit():
+            index += 1
+        return ("other", None), index
+    elif char == "N":
+        return ("other", None), pattern.index("}", index) + 1
+    elif char.isascii() and char.isalpha():
+        return ("other", None), index + _ESCAPE_LENGTHS.get(char, 1)
+    return ("literal", char), index + 1
+
+
+def _skip_class(pattern, index):
+    """Return the index after the end of the class that starts at ``index``."""
+    if pattern[index : index + 1] == "^":
+        index += 1
+    if pattern[index : index + 1] == "]":
+        index += 1
+    while pattern[index] != "]":
+        index += 2 if pattern[index] == "\\" else 1
+    return index + 1
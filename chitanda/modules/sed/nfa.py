@@ -0,0 +1,515 @@
+import re
+import string
+from functools import lru_cache
+
+# The largest bounded repetition that is compiled; its body is copied once per
+# repetition.
+MAX_REPEAT = 100
+# The most instructions that a pattern is compiled to, as nested repetitions
+# multiply their copies.
+MAX_PROGRAM = 1000
+
+_CATEGORIES = {
+    "d": str.isdecimal,
+    "s": str.isspace,
+    "w": lambda char: char.isalnum() or char == "_",
+}
+ESCAPES = {"a": "\a", "f": "\f", "n": "\n", "r": "\r", "t": "\t", "v": "\v"}
+QUANTIFIER = re.compile(r"\{(\d*)(,?)(\d*)\}")
+
+
+class Unsupported(Exception):
+    """Raised for patterns that need features of a backtracking engine."""
+
+
+class Regex:
+    """
+    A regex matched by simulating its NFA, which takes time linear in the
+    length of the string. Supports literals, character classes, groups,
+    alternation, greedy and lazy repetition, and anchors, with the semantics
+    of Python's ``re``. Backreferences are only supported in replacements.
+
+    Raises ``Unsupported`` for anything else, such as lookarounds,
+    backreferences in the pattern, and inline flags, and for patterns that
+    compile to over ``MAX_PROGRAM`` instructions.
+    """
+
+    def __init__(self, pattern, ignorecase=False):
+        self.pattern = pattern
+        self.ignorecase = ignorecase
+        self.groups = 0
+        self.groupindex = {}
+        tree = _Parser(self, pattern).parse()
+        self._program = _Compiler(self).compile(tree)
+        # The work done per character searched is at most proportional to it.
+        self.size = len(self._program)
+
+    def search(self, string, pos=0):
+        return self._search(string, pos, must_advance=False)
+
+    def sub(self, repl, string, count=0):
+        template = _parse_template(repl, self.groups, tuple(self.groupindex.items()))
+        parts = []
+        pos = end = 0
+        must_advance = False
+        while pos <= len(string):
+            match = self._search(string, pos, must_advance)
+            if match is None:
+                break
+            parts.append(string[end : match.start()])
+            parts.append(match.expand(template))
+            pos = end = match.end()
+            must_advance = match.start() == match.end()
+            count -= 1
+            if count == 0:
+                break
+        parts.append(string[end:])
+        return "".join(parts)
+
+    def _search(self, string, pos, must_advance):
+        """
+        Run the NFA from every position from ``pos`` onwards at once, keeping
+        threads in order of priority so that the match found is the one that a
+        backtracking engine would find. If ``must_advance`` is true, an empty
+        match at ``pos`` is rejected, as ``re.sub`` does after an empty match.
+        """
+        program = self._program
+        empty = (None,) * (2 * self.groups + 2)
+        threads, seen = [], set()
+        matched = None
+        for index in range(pos, len(string) + 1):
+            if matched is None:
+                self._add_thread(threads, seen, 0, empty, string, index)
+            if not threads:
+                if matched is not None:
+                    break
+                seen = set()
+                continue
+
+            char = string[index] if index < len(string) else None
+            next_threads, next_seen = [], set()
+            for pc, captures in threads:
+                op, arg = program[pc]
+                if op == _MATCH:
+                    if must_advance and captures[0] == captures[1] == pos:
+                        continue
+                    matched = captures
+                    break  # Lower priority threads can't win anymore.
+                elif char is not None and arg(char):
+                    self._add_thread(
+                        next_threads, next_seen, pc + 1, captures, string, index + 1
+                    )
+            threads, seen = next_threads, next_seen
+
+        return _Match(string, matched, self.groupindex) if matched else None
+
+    def _add_thread(self, threads, seen, pc, captures, string, index):
+        """
+        Add the thread at ``pc`` to ``threads``, following jumps, splits,
+        saves, and assertions in order of priority. Each instruction is only
+        visited once per position, which keeps the number of threads bounded.
+        """
+        stack = [(pc, captures)]
+        while stack:
+            pc, captures = stack.pop()
+            if pc in seen:
+                continue
+            seen.add(pc)
+
+            op, arg = self._program[pc]
+            if op == _JUMP:
+                stack.append((arg, captures))
+            elif op == _SPLIT:
+                stack.append((arg[1], captures))
+                stack.append((arg[0], captures))
+            elif op == _SAVE:
+                captures = captures[:arg] + (index,) + captures[arg + 1 :]
+                stack.append((pc + 1, captures))
+            elif op == _ASSERT:
+                if arg(string, index):
+                    stack.append((pc + 1, captures))
+            else:
+                threads.append((pc, captures))
+
+
+class _Match:
+    def __init__(self, string, captures, groupindex):
+        self.string = string
+        self._captures = captures
+        self._groupindex = groupindex
+
+    def start(self):
+        return self._captures[0]
+
+    def end(self):
+        return self._captures[1]
+
+    def group(self, group=0):
+        group = self._groupindex.get(group, group)
+        start, end = self._captures[2 * group : 2 * group + 2]
+        return self.string[start:end] if start is not None and end is not None else None
+
+    def expand(self, template):
+        return "".join(
+            part if isinstance(part, str) else self.group(part) or ""
+            for part in template
+        )
+
+
+# Instructions are (op, arg) pairs. Consuming instructions have a predicate
+# for the character as their arg.
+_CHAR, _JUMP, _SPLIT, _SAVE, _ASSERT, _MATCH = range(6)
+
+_ASSERTIONS = {
+    "^": lambda string, index: index == 0,
+    "A": lambda string, index: index == 0,
+    "$": lambda string, index: index == len(string)
+    or (index == len(string) - 1 and string[index] == "\n"),
+    "Z": lambda string, index: index == len(string),
+    "b": lambda string, index: _is_word_at(string, index - 1)
+    != _is_word_at(string, index),
+    "B": lambda string, index: _is_word_at(string, index - 1)
+    == _is_word_at(string, index),
+}
+
+
+def _is_word_at(string, index):
+    return 0 <= index < len(string) and _CATEGORIES["w"](string[index])
+
+
+class _Parser:
+    """
+    Parses a pattern into a tree of tuples. The pattern has already been
+    compiled by ``re``, so it is known to be valid.
+    """
+
+    def __init__(self, regex, pattern):
+        self.regex = regex
+        self.pattern = pattern
+        self.index = 0
+
+    def parse(self):
+        tree = self._alternation()
+        if self.index < len(self.pattern):
+            raise Unsupported(self.pattern)
+        return tree
+
+    def _peek(self, length=1):
+        return self.pattern[self.index : self.index + length]
+
+    def _next(self):
+        self.index += 1
+        return self.pattern[self.index - 1]
+
+    def _alternation(self):
+        branches = [self._concatenation()]
+        while self._peek() == "|":
+            self._next()
+            branches.append(self._concatenation())
+        return ("alt", branches) if len(branches) > 1 else branches[0]
+
+    def _concatenation(self):
+        items = []
+        while self.index < len(self.pattern) and self._peek() not in "|)":
+            items.append(self._repetition(self._atom()))
+        return ("concat", items)
+
+    def _repetition(self, atom):
+        char = self._peek()
+        if char in ("*", "+", "?"):
+            self._next()
+            low, high = {"*": (0, None), "+": (1, None), "?": (0, 1)}[char]
+        else:
+            match = self._peek(2) != "{}" and QUANTIFIER.match(self.pattern, self.index)
+            if not match:
+                return atom
+            self.index = match.end()
+            low, comma, high = match.groups()
+            high = high if comma else low
+            low, high = int(low or 0), int(high) if high else None
+            if low > MAX_REPEAT or (high or 0) > MAX_REPEAT:
+                raise Unsupported(self.pattern)
+
+        if (high is None or high > 1) and _is_nullable(atom):
+            # ``re`` stops repeating a body once it matches the empty string,
+            # which the NFA doesn't reproduce.
+            raise Unsupported(self.pattern)
+
+        greedy = self._peek() != "?"
+        if not greedy:
+            self._next()
+        if self._peek() == "+":  # Possessive repetition.
+            raise Unsupported(self.pattern)
+        return ("repeat", atom, low, high, greedy)
+
+    def _atom(self):
+        char = self._next()
+        if char == "(":
+            return self._group()
+        elif char == "[":
+            return self._class()
+        elif char == ".":
+            return ("char", lambda char: char != "\n")
+        elif char in "^$":
+            return ("assert", _ASSERTIONS[char])
+        elif char == "\\":
+            return self._escape()
+        return ("char", self._literal(char))
+
+    def _group(self):
+        if self._peek(2) == "?:":
+            self.index += 2
+            group = None
+        elif self._peek(3) == "?P<":
+            end = self.pattern.index(">", self.index)
+            name = self.pattern[self.index + 3 : end]
+            self.index = end + 1
+            group = self._new_group()
+            self.regex.groupindex[name] = group
+        elif self._peek() == "?":
+            raise Unsupported(self.pattern)
+        else:
+            group = self._new_group()
+
+        tree = self._alternation()
+        self._next()  # The closing parenthesis.
+        return ("group", group, tree)
+
+    def _new_group(self):
+        self.regex.groups += 1
+        return self.regex.groups
+
+    def _escape(self):
+        char = self._next()
+        if char in "AZbB":
+            return ("assert", _ASSERTIONS[char])
+        return ("char", self._escaped_predicate(char))
+
+    def _class(self):
+        negate = self._peek() == "^"
+        if negate:
+            self._next()
+
+        predicates = []
+        first = True
+        while first or self._peek() != "]":
+            first = False
+            char = self._next()
+            if char == "\\":
+                escaped = self._next()
+                if escaped.lower() in _CATEGORIES:
+                    predicates.append(self._escaped_predicate(escaped))
+                    continue
+                char = self._escaped_char(escaped)
+            if self._peek() == "-" and self._peek(2) != "-]":
+                self._next()
+                end = self._next()
+                if end == "\\":
+                    end = self._escaped_char(self._next())
+                predicates.append(self._range(char, end))
+            else:
+                predicates.append(self._literal(char))
+        self._next()  # The closing bracket.
+
+        return ("char", lambda char: negate != any(p(char) for p in predicates))
+
+    def _escaped_predicate(self, char):
+        if char.lower() in _CATEGORIES:
+            category = _CATEGORIES[char.lower()]
+            if char.isupper():
+                return lambda char: not category(char)
+            return category
+        return self._literal(self._escaped_char(char))
+
+    def _escaped_char(self, char):
+        if char in ESCAPES:
+            return ESCAPES[char]
+        elif char in string.ascii_letters or char in string.digits:
+            # Backreferences, octal, hex, and unicode escapes.
+            raise Unsupported(self.pattern)
+        return char
+
+    def _literal(self, literal):
+        if self.regex.ignorecase:
+            literal = literal.lower()
+            return lambda char: char.lower() == literal
+        return literal.__eq__
+
+    def _range(self, start, end):
+        if self.regex.ignorecase:
+            return lambda char: any(
+                start <= c <= end for c in (char, char.lower(), char.upper())
+            )
+        return lambda char: start <= char <= end
+
+
+def _is_nullable(tree):
+    kind, *args = tree
+    if kind == "char":
+        return False
+    elif kind == "concat":
+        return all(_is_nullable(item) for item in args[0])
+    elif kind == "alt":
+        return any(_is_nullable(branch) for branch in args[0])
+    elif kind == "group":
+        return _is_nullable(args[1])
+    elif kind == "repeat":
+        return args[1] == 0 or _is_nullable(args[0])
+    return True  # Assertions.
+
+
+class _Compiler:
+    def __init__(self, regex):
+        self.regex = regex
+        self.program = []
+
+    def compile(self, tree):
+        self._emit(_SAVE, 0)
+        self._compile(tree)
+        self._emit(_SAVE, 1)
+        self._emit(_MATCH, None)
+        return self.program
+
+    def _emit(self, op, arg):
+        if len(self.program) == MAX_PROGRAM:
+            raise Unsupported(self.regex.pattern)
+        self.program.append((op, arg))
+        return len(self.program) - 1
+
+    def _patch(self, pc, arg):
+        self.program[pc] = (self.program[pc][0], arg)
+
+    def _compile(self, tree):
+        kind, *args = tree
+        getattr(self, f"_compile_{kind}")(*args)
+
+    def _compile_char(self, predicate):
+        self._emit(_CHAR, predicate)
+
+    def _compile_assert(self, assertion):
+        self._emit(_ASSERT, assertion)
+
+    def _compile_concat(self, items):
+        for item in items:
+            self._compile(item)
+
+    def _compile_group(self, group, tree):
+        if group is None:
+            return self._compile(tree)
+        self._emit(_SAVE, 2 * group)
+        self._compile(tree)
+        self._emit(_SAVE, 2 * group + 1)
+
+    def _compile_alt(self, branches):
+        jumps = []
+        for branch in branches[:-1]:
+            split = self._emit(_SPLIT, None)
+            self._compile(branch)
+            jumps.append(self._emit(_JUMP, None))
+            self._patch(split, (split + 1, len(self.program)))
+        self._compile(branches[-1])
+        for jump in jumps:
+            self._patch(jump, len(self.program))
+
+    def _compile_repeat(self, tree, low, high, greedy):
+        if high is None:
+            return self._compile_loop(tree, low, greedy)
+
+        for _ in range(low):
+            self._compile(tree)
+        splits = []
+        for _ in range(high - low):
+            splits.append(self._emit(_SPLIT, None))
+            self._compile(tree)
+        for split in splits:
+            self._patch_split(split, split + 1, greedy)
+
+    def _compile_loop(self, tree, low, greedy):
+        # The loop is compiled as ``x+`` rather than ``x*`` so that a body that
+        # matches the empty string still leaves the loop with its groups set.
+        skip = self._emit(_SPLIT, None) if low == 0 else None
+        for _ in range(low - 1):
+            self._compile(tree)
+        body = len(self.program)
+        self._compile(tree)
+        self._patch_split(self._emit(_SPLIT, None), body, greedy)
+        if skip is not None:
+            self._patch_split(skip, skip + 1, greedy)
+
+    def _patch_split(self, split, body, greedy):
+        skip = len(self.program)
+        self._patch(split, (body, skip) if greedy else (skip, body))
+
+
+@lru_cache(maxsize=64)
+def _parse_template(repl, groups, groupindex):
+    """
+    Parse a replacement into a list of strings and group numbers, following
+    the rules of ``re.sub``.
+    """
+    template = [""]
+    index = 0
+    while index < len(repl):
+        if repl[index] == "\\":
+            part, index = _parse_escape(repl, index + 1, dict(groupindex))
+            if isinstance(part, int) and not 0 <= part <= groups:
+                raise re.error(f"invalid group reference {part}")
+        else:
+            part, index = repl[index], index + 1
+
+        if isinstance(part, str) and isinstance(template[-1], str):
+            template[-1] += part
+        else:
+            template.append(part)
+    return template
+
+
+def _parse_escape(repl, index, groupindex):
+    """
+    Parse the escape after the backslash at ``index - 1``, returning a string
+    or group number and the index after the escape.
+    """
+    if index == len(repl):
+        raise re.error("bad escape (end of pattern)")
+
+    char = repl[index]
+    index += 1
+    if char == "g":
+        end = repl.find(">", index)
+        if repl[index : index + 1] != "<" or end == -1:
+            raise re.error("missing group name")
+        name = repl[index + 1 : end]
+        if not name.isdigit() and name not in groupindex:
+            raise re.error(f"unknown group name {name!r}")
+        return int(name) if name.isdigit() else groupindex[name], end + 1
+    elif char == "0":
+        digits = _take(repl, index, string.octdigits, 2)
+        return chr(int(digits or "0", 8) & 0xFF), index + len(digits)
+    elif char in string.digits:
+        return _parse_number(repl, index - 1)
+    elif char in ESCAPES or char == "b":
+        return ESCAPES.get(char, "\b"), index
+    elif char in string.ascii_letters:
+        raise re.error(f"bad escape \\{char}")
+    return "\\" if char == "\\" else "\\" + char, index
+
+
+def _parse_number(repl, index):
+    """Parse a group number or a three digit octal escape."""
+    octal = _take(repl, index, string.octdigits, 3)
+    if len(octal) == 3:
+        if int(octal, 8) > 0o377:
+            raise re.error(f"octal escape value \\{octal} outside of range")
+        return chr(int(octal, 8)), index + 3
+
+    number = _take(repl, index, string.digits, 2)
+    return int(number), index + len(number)
+
+
+def _take(repl, index, characters, limit):
+    """Return up to ``limit`` characters of ``repl`` that are in ``characters``."""
+    taken = ""
+    while len(taken) < limit and repl[index : index + 1] in tuple(characters):
+        taken += repl[index]
+        index += 1
+    return taken
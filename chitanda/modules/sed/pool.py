@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import re
+from collections import OrderedDict, deque
+from multiprocessing import Pipe, Process
+
+from chitanda.errors import BotError
+from chitanda.modules.sed.literals import candidates
+
+logger = logging.getLogger(__name__)
+
+# The number of message logs that each worker keeps a copy of.
+WORKER_LOGS = 64
+
+
+class Worker:
+    """
+    A process that runs substitutions, keeping its own copy of the message
+    logs that it has been sent recently.
+    """
+
+    def __init__(self):
+        self.conn, child_conn = Pipe()
+        self.process = Process(target=_work, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.synced = OrderedDict()  # Maps log IDs to the ``added`` count sent.
+        logger.info(f"Started Process {self.process.pid} for sed commands.")
+
+    async def run(self, message_log, job, timeout):
+        self.conn.send((*self._sync(message_log), job))
+        await self._wait_readable(timeout)
+        return self.conn.recv()
+
+    def kill(self):
+        logger.info(f"Killing Process {self.process.pid}.")
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def _sync(self, message_log):
+        """
+        Return the messages of the log that the worker lacks, along with the
+        IDs of the least recently used logs that the worker should drop.
+        """
+        synced = self.synced.pop(message_log.id, None)
+        self.synced[message_log.id] = message_log.added
+        dropped = []
+        while len(self.synced) > WORKER_LOGS:
+            dropped.append(self.synced.popitem(last=False)[0])
+
+        new = message_log.added - (synced or 0)
+        reset = synced is None or new >= len(message_log)
+        if reset:
+            messages = list(message_log)
+        else:
+            messages = [message_log[i] for i in range(new)]
+        return dropped, message_log.id, message_log.maxlen, reset, messages
+
+    async def _wait_readable(self, timeout):
+        loop = asyncio.get_event_loop()
+        readable = loop.create_future()
+        fd = self.conn.fileno()
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait_for(readable, timeout)
+        finally:
+            loop.remove_reader(fd)
+
+
+class WorkerPool:
+    """
+    A pool of prestarted workers. A worker that times out is killed and
+    replaced with a fresh one.
+    """
+
+    def __init__(self, size):
+        self.workers = [Worker() for _ in range(size)]
+        self._idle = asyncio.Queue()
+        for worker in self.workers:
+            self._idle.put_nowait(worker)
+
+    async def run(self, message_log, regex, repl, count, timeout, **prefilter):
+        """
+        Run ``find_and_replace`` on the message log in a worker. ``prefilter``
+        holds the keyword arguments of ``find_and_replace``.
+        """
+        worker = await self._idle.get()
+        job = (regex, repl, count, prefilter)
+        try:
+            return await worker.run(message_log, job, timeout)
+        except (asyncio.TimeoutError, EOFError, OSError) as e:
+            worker = self._replace(worker)
+            if isinstance(e, asyncio.TimeoutError):
+                raise BotError("Regex substitution timed out.")
+            raise BotError("Regex substitution failed.")
+        except asyncio.CancelledError:
+            # The worker's response would be read by the next substitution.
+            worker = self._replace(worker)
+            raise
+        finally:
+            self._idle.put_nowait(worker)
+
+    def close(self):
+        for worker in self.workers:
+            worker.kill()
+        self.workers.clear()
+
+    def _replace(self, worker):
+        worker.kill()
+        self.workers.remove(worker)
+        self.workers.append(Worker())
+        return self.workers[-1]
+
+
+class _LogCopy:
+    """A worker's copy of a message log, which caches its case-folded lines."""
+
+    def __init__(self, messages, maxlen):
+        self._lines = deque(([m, None] for m in messages), maxlen=maxlen)
+
+    def __iter__(self):
+        return (line for line, _ in self._lines)
+
+    def extend_newer(self, messages):
+        self._lines.extendleft([m, None] for m in reversed(messages))
+
+    def folded(self):
+        for entry in self._lines:
+            if entry[1] is None:
+                entry[1] = entry[0].casefold()
+            yield entry[1]
+
+
+def _work(conn):
+    logs = {}
+    while True:
+        try:
+            dropped, log_id, maxlen, reset, messages, job = conn.recv()
+        except EOFError:
+            return
+
+        for dropped_id in dropped:
+            del logs[dropped_id]
+
+        if reset:
+            log = logs[log_id] = _LogCopy(messages, maxlen)
+        else:
+            log = logs[log_id]
+            log.extend_newer(messages)
+        regex, repl, count, prefilter = job
+        conn.send(find_and_replace(log, regex, repl, count, **prefilter))
+
+
+def find_and_replace(message_log, regex, repl, count, literals=(), folded=False):
+    """
+    Substitute the newest message in the log that the regex matches. Only
+    messages that contain the ``literals`` required by the regex are searched.
+    """
+    try:
+        for message in candidates(message_log, literals, folded):
+            if regex.search(message):
+                return regex.sub(repl, message, count=count)
+        return "No matching message found."
+    except re.error:
+        return "Invalid regex substitution."
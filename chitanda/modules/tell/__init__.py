@@ -1,32 +1,53 @@
+import asyncio
 import logging
 from datetime import datetime
 
-from chitanda.database import database
+from chitanda.config import config
+from chitanda.database import db
 from chitanda.decorators import args, channel_only, register
 
 logger = logging.getLogger(__name__)
 
 TIME_FORMAT = "%b %d, %H:%M:%S"
+PACK_SEPARATOR = " | "
+
+# A future resolving to the set of (listener, channel, recipient) keys that have
+# pending tells, so that messages from users without tells don't query the
+# database. It is loaded from the database on first use after a (re)load.
+_pending = None
 
 
 def setup(bot):  # pragma: no cover
     bot.message_handlers.append(tell_handler)
+    _load_pending()
 
 
 async def tell_handler(message):
     if message.private:
         return
 
-    for row in _fetch_tells(message.target, message.listener, message.author):
-        time = datetime.fromisoformat(row["time"]).strftime(TIME_FORMAT)
+    key = _pending_key(message.listener, message.target, message.author)
+    pending = await _get_pending()
+    if key not in pending:
+        return
+
+    # Remove the key before fetching, so that a tell saved during delivery adds
+    # it back. If delivery is interrupted, the tells are still pending.
+    pending.discard(key)
+    delivered = False
+    try:
+        rows = await _fetch_tells(message.target, message.listener, message.author)
+        for line in _format_tells(message, rows):
+            yield line
+        await _delete_tells([row["id"] for row in rows])
         logger.info(
-            f"Sent tell to {message.author} in {message.target} "
+            f"Sent {len(rows)} tell(s) to {message.author} in {message.target} "
             f"on {message.listener}."
         )
-        yield (
-            f'{message.author}: On {time}, {row["sender"]} said: ' f'{row["message"]}'
-        )
-        _delete_tell(row["id"])
+        delivered = True
+    finally:
+        if not delivered:
+            pending.add(key)
 
 
 @register("tell")
@@ -34,22 +55,23 @@ async def tell_handler(message):
 @args(r"([^ ]+) (.+)")
 async def call(message):
     """Save a message for a user the next time they are seen."""
-    with database() as (conn, cursor):
-        cursor.execute(
-            """
-            INSERT INTO tells (
-                channel, listener, message, recipient, sender
-            ) VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                message.target,
-                str(message.listener),
-                message.args[1],
-                message.args[0],
-                message.author,
-            ),
-        )
-        conn.commit()
+    await db.execute(
+        """
+        INSERT INTO tells (
+            channel, listener, message, recipient, sender
+        ) VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            message.target,
+            str(message.listener),
+            message.args[1],
+            message.args[0],
+            message.author,
+        ),
+    )
+    (await _get_pending()).add(
+        _pending_key(message.listener, message.target, message.args[0])
+    )
     logger.info(
         f"Added a tell for {message.args[0]} in {message.target} on "
         f"{message.listener}"
@@ -57,29 +79,82 @@ async def call(message):
     return f"{message.args[0]} will be told when next seen."
 
 
-def _fetch_tells(target, listener, author):
-    with database() as (conn, cursor):
-        cursor.execute(
-            """
-            SELECT
-                id,
-                message,
-                time,
-                sender
-            FROM tells
-            WHERE
-                channel = ?
-                AND listener = ?
-                AND recipient = ?
-            ORDER BY id ASC
-            """,
-            (target, str(listener), author),
-        )
-        return cursor.fetchall()
+async def _fetch_tells(target, listener, author):
+    return await db.fetchall(
+        """
+        SELECT
+            id,
+            message,
+            time,
+            sender
+        FROM tells
+        WHERE
+            channel = ?
+            AND listener = ?
+            AND recipient = ?
+        ORDER BY id ASC
+        """,
+        (target, str(listener), author),
+    )
+
+
+async def _delete_tells(tell_ids):
+    if not tell_ids:
+        return
+    logger.debug(f"Deleting tells {tell_ids}.")
+    await db.execute(
+        f'DELETE FROM tells WHERE id IN ({",".join(["?"] * len(tell_ids))})',
+        tuple(tell_ids),
+    )
+
+
+def _format_tells(message, rows):
+    tells = []
+    for row in rows:
+        time = datetime.fromisoformat(row["time"]).strftime(TIME_FORMAT)
+        tells.append(f'On {time}, {row["sender"]} said: {row["message"]}')
+
+    prefix = f"{message.author}: "
+    if not config.get("tell", {}).get("pack", False):
+        return [prefix + tell for tell in tells]
+    return _pack_tells(
+        prefix, tells, message.listener.max_message_length(message.target)
+    )
+
+
+def _pack_tells(prefix, tells, length):
+    """
+    Join the tells into as few lines as fit within the maximum length in bytes.
+    A tell that doesn't fit in a line on its own is put on its own line.
+    """
+    lines = []
+    for tell in tells:
+        packed = f"{lines[-1]}{PACK_SEPARATOR}{tell}" if lines else None
+        if packed and len(packed.encode()) <= length:
+            lines[-1] = packed
+        else:
+            lines.append(prefix + tell)
+    return lines
+
+
+def _pending_key(listener, channel, recipient):
+    return str(listener), str(channel), str(recipient).lower()
+
+
+def _load_pending():
+    global _pending
+    _pending = asyncio.ensure_future(db.read(_fetch_pending))
+
+
+async def _get_pending():
+    if _pending is None:
+        _load_pending()
+    return await _pending
 
 
-def _delete_tell(tell_id):
-    logger.debug(f"Deleting tell {tell_id}.")
-    with database() as (conn, cursor):
-        cursor.execute("DELETE FROM tells WHERE id = ?", (tell_id,))
-        conn.commit()
+def _fetch_pending(cursor):
+    cursor.execute("SELECT DISTINCT listener, channel, recipient FROM tells")
+    return {
+        _pending_key(row["listener"], row["channel"], row["recipient"])
+        for row in cursor.fetchall()
+    }
@@ -0,0 +1,2 @@
+CREATE INDEX tells_channel_listener_recipient_idx
+ON tells (channel, listener, recipient);
@@ -29,26 +29,63 @@ class Message:
 
     def call_command(self):
         if self.contents.startswith(config["trigger_character"]):
-            self.contents = self.contents[1:]
-            for trigger, command in self._get_sorted_commands():
-                if self.contents == trigger or self.contents.startswith(f"{trigger} "):
-                    self.contents = self.contents[len(trigger) + 1 :]
-                    logger.info(f"Command triggered: {trigger}.")
-                    return command.call(self)
+            contents = self.contents[1:]
+            match = self.bot.command_index.find(self.listener, contents)
+            if match:
+                trigger, command = match
+                self.contents = contents[len(trigger) + 1 :]
+                logger.info(f"Command triggered: {trigger}.")
+                return command.call(self)
 
         raise NoCommandFound
 
-    def _get_sorted_commands(self):
-        modules = set(
-            config["modules"].get("global", [])
-            + config["modules"].get(str(self.listener), [])
-        )
-        commands = {
-            k: v
-            for k, v in self.bot.commands.items()
-            if get_module_name(v.__name__) in modules
+
+class CommandIndex:
+    """
+    A longest-match table of command triggers for each listener. It is built
+    when modules are (re)loaded, so that looking up a command depends on the
+    length of the message rather than the number of commands.
+    """
+
+    def __init__(self, commands, modules):
+        global_modules = modules.get("global", [])
+        self._global = self._build_table(commands, global_modules)
+        self._tables = {
+            listener: self._build_table(commands, global_modules + enabled)
+            for listener, enabled in modules.items()
+            if listener != "global"
+        }
+        self._max_length = max((len(t) for t in commands), default=0)
+
+    @staticmethod
+    def _build_table(commands, modules):
+        modules = set(modules)
+        return {
+            trigger: command
+            for trigger, command in commands.items()
+            if get_module_name(command.__name__) in modules
         }
-        return sorted(commands.items(), key=lambda t: len(t[0]), reverse=True)
+
+    def find(self, listener, contents):
+        """
+        Return the ``(trigger, command)`` pair of the longest trigger that
+        ``contents`` starts with, followed by a space or the end of the
+        message. Return ``None`` if no trigger matches.
+        """
+        table = self._tables.get(str(listener), self._global)
+
+        if len(contents) <= self._max_length:
+            end = len(contents)
+        else:
+            end = contents.rfind(" ", 0, self._max_length + 1)
+
+        while end > 0:
+            trigger = contents[:end]
+            if trigger in table:
+                return trigger, table[trigger]
+            end = contents.rfind(" ", 0, end)
+
+        return None
 
 
 class Response:
@@ -117,3 +154,24 @@ def trim_message(message, length=240):
     if len(message) > length:
         return f"{message[:length - 3]}..."
     return message
+
+
+def split_message(message, length):
+    """
+    Split a message into lines of at most ``length`` bytes when UTF-8 encoded,
+    breaking on spaces where possible and never inside a character. Empty lines
+    are dropped.
+    """
+    for line in message.splitlines():
+        while len(line.encode()) > length:
+            # The number of characters whose encoding fits in the length.
+            cut = len(line.encode()[:length].decode(errors="ignore"))
+            space = line.rfind(" ", 0, cut + 1)
+            if space > 0:
+                yield line[:space].rstrip(" ")
+                line = line[space + 1 :].lstrip(" ")
+            else:
+                yield line[:cut]
+                line = line[cut:]
+        if line:
+            yield line
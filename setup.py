@@ -38,6 +38,7 @@ setup(
         "chitanda.modules.irc_channels",
         "chitanda.modules.lastfm",
         "chitanda.modules.quotes",
+        "chitanda.modules.sed",
         "chitanda.modules.tell",
     ],
     package_dir={"": "."},
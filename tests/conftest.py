@@ -4,7 +4,7 @@ import pytest
 from click.testing import CliRunner
 
 from chitanda.commands import migrate
-from chitanda.database import create_database_if_nonexistent
+from chitanda.database import close_database, create_database_if_nonexistent
 
 
 @pytest.fixture
@@ -14,4 +14,5 @@ def test_db(monkeypatch):
     create_database_if_nonexistent()
     CliRunner().invoke(migrate)
     yield db_path
+    close_database()
     db_path.unlink()
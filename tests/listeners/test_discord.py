@@ -1,9 +1,15 @@
-from asyncio import Future
-from unittest.mock import AsyncMock, Mock, patch
+import asyncio
+from unittest.mock import AsyncMock, Mock, call, patch
 
 import pytest
 
 from chitanda.listeners import DiscordListener
+from chitanda.listeners.discord import CHANNEL_BURST
+
+
+async def _drain(listener):
+    while any(sender.task for sender in listener.senders.values()):
+        await asyncio.sleep(0)
 
 
 @pytest.mark.asyncio
@@ -12,9 +18,10 @@ async def test_discord_listener_message():
     with patch.object(DiscordListener, "get_channel", mock) as gc:
         listener = DiscordListener(Mock())
         await listener.message(123, "message")
-        assert gc.return_value.send.called_with(content="message")
-        assert not listener.message_queue[123]
-        assert not listener.message_lock[123]
+        await _drain(listener)
+        gc.assert_called_with(123)
+        gc.return_value.send.assert_called_once_with(content="message")
+        assert not listener.senders[123].queue
 
 
 @pytest.mark.asyncio
@@ -23,31 +30,102 @@ async def test_discord_listener_message_embed():
     with patch.object(DiscordListener, "get_channel", mock) as gc:
         listener = DiscordListener(Mock())
         await listener.message(123, "message", embed=True)
-        assert gc.return_value.send.called_with(embed="message")
+        await _drain(listener)
+        gc.return_value.send.assert_called_once_with(embed="message")
 
 
 @pytest.mark.asyncio
 async def test_discord_listener_message_private():
     with patch.object(
-        DiscordListener, "get_dm_channel_id", return_value=AsyncMock(return_value=789)
+        DiscordListener, "get_dm_channel_id", AsyncMock(return_value=789)
     ):
         mock = Mock(return_value=Mock(send=AsyncMock(return_value=123)))
         with patch.object(DiscordListener, "get_channel", mock) as gc:
             listener = DiscordListener(Mock())
             await listener.message(123, "message", private=True)
-            assert gc.called_with(789)
-            assert gc.return_value.send.called_with(embed="message")
+            await _drain(listener)
+            gc.assert_called_with(789)
+            gc.return_value.send.assert_called_once_with(content="message")
 
 
 @pytest.mark.asyncio
 async def test_discord_listener_error():
     with patch.object(DiscordListener, "get_channel") as gc:
-        gc.return_value.send.return_value = Future()
-        gc.return_value.send.return_value.set_exception(Exception)
+        gc.return_value.send = AsyncMock(side_effect=[Exception, None])
+        listener = DiscordListener(Mock())
+        await listener.message(123, "message", embed=True)
+        await listener.message(123, "message2")
+        await _drain(listener)
+        assert gc.return_value.send.call_count == 2
+        assert listener.senders[123].task is None
+
+
+@pytest.mark.asyncio
+async def test_discord_listener_message_coalesced():
+    with patch.object(DiscordListener, "get_channel") as gc:
+        gc.return_value.send = AsyncMock()
+        listener = DiscordListener(Mock())
+        for line in ["a", "b", "c"]:
+            await listener.message(123, line)
+        await listener.message(123, "embed", embed=True)
+        await listener.message(123, "d" * 1999)
+        await listener.message(123, "e")
+        await _drain(listener)
+        assert gc.return_value.send.call_args_list == [
+            call(content="a\nb\nc"),
+            call(embed="embed"),
+            call(content="d" * 1999),
+            call(content="e"),
+        ]
+
+
+@pytest.mark.asyncio
+async def test_discord_listener_message_split():
+    with patch.object(DiscordListener, "get_channel") as gc:
+        gc.return_value.send = AsyncMock()
+        listener = DiscordListener(Mock())
+        await listener.message(123, " ".join(["word"] * 500))
+        await _drain(listener)
+        sent = [c[1]["content"] for c in gc.return_value.send.call_args_list]
+        assert len(sent) == 2
+        assert all(len(content) <= 2000 for content in sent)
+
+
+@pytest.mark.asyncio
+async def test_discord_listener_rate_limited(monkeypatch):
+    delays = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay):
+        if delay:
+            delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr("chitanda.listeners.scheduler.asyncio.sleep", sleep)
+    with patch.object(DiscordListener, "get_channel") as gc:
+        gc.return_value.send = AsyncMock()
+        listener = DiscordListener(Mock())
+        for _ in range(7):
+            await listener.message(123, "embed", embed=True)
+        await _drain(listener)
+        assert gc.return_value.send.call_count == 7
+        assert len(delays) == 2
+
+
+@pytest.mark.asyncio
+async def test_discord_listener_evicts_idle_senders(monkeypatch):
+    monkeypatch.setattr("chitanda.listeners.discord.SENDER_IDLE_TIMEOUT", 0)
+    with patch.object(DiscordListener, "get_channel") as gc:
+        gc.return_value.send = AsyncMock()
         listener = DiscordListener(Mock())
-        with pytest.raises(Exception):
-            await listener.message(123, "message")
-        assert not listener.message_lock[123]
+        await listener.message(123, "message")
+        await _drain(listener)
+        await asyncio.sleep(0)
+        assert 123 in listener.senders
+
+        listener.senders[123].bucket._tokens = CHANNEL_BURST
+        await asyncio.sleep(0)
+        assert 123 not in listener.senders
 
 
 @pytest.mark.asyncio
@@ -79,6 +157,43 @@ async def test_get_dm_channel_id_create_dm():
         assert 123 == await DiscordListener(Mock()).get_dm_channel_id(1)
 
 
+@pytest.mark.asyncio
+async def test_get_dm_channel_id_cached():
+    discord_user = Mock(dm_channel=Mock(id=123))
+    with patch.object(
+        DiscordListener, "fetch_user", AsyncMock(return_value=discord_user)
+    ) as fetch_user:
+        listener = DiscordListener(Mock())
+        assert 123 == await listener.get_dm_channel_id(1)
+        assert 123 == await listener.get_dm_channel_id(1)
+        fetch_user.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_get_dm_channel_id_cache_bounded(monkeypatch):
+    monkeypatch.setattr("chitanda.listeners.discord.DM_CACHE_SIZE", 2)
+    with patch.object(
+        DiscordListener, "fetch_user", AsyncMock(return_value=Mock())
+    ) as fetch_user:
+        listener = DiscordListener(Mock())
+        for user_id in [1, 2, 1, 3]:
+            fetch_user.return_value.dm_channel.id = user_id * 10
+            await listener.get_dm_channel_id(user_id)
+        assert list(listener.dm_channel_ids) == [1, 3]
+        assert fetch_user.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_dm_channel_forgotten_on_failed_send():
+    with patch.object(DiscordListener, "get_channel") as gc:
+        gc.return_value.send = AsyncMock(side_effect=Exception)
+        listener = DiscordListener(Mock())
+        listener.dm_channel_ids.update({1: 10, 2: 20})
+        await listener.message(1, "message", private=True)
+        await _drain(listener)
+        assert listener.dm_channel_ids == {2: 20}
+
+
 @pytest.mark.asyncio
 async def test_on_message():
     bot = Mock(handle_message=AsyncMock(return_value=None))
@@ -118,3 +233,63 @@ async def test_is_not_admin(monkeypatch):
         {"admins": {str(listener): ["zad"]}},
     )
     assert not await listener.is_admin("azul")
+
+
+def test_max_message_length():
+    assert 2000 == DiscordListener(None).max_message_length(123)
+
+
+@pytest.mark.parametrize("members_intent", [False, True])
+def test_members_intent(members_intent):
+    listener = DiscordListener(None, members_intent=members_intent)
+    assert members_intent == listener.intents.members
+
+
+@pytest.mark.asyncio
+async def test_find_prefix_matches_cached():
+    member = Mock(id=1, display_name="azul")
+    member.name = "azul"
+    guild = Mock(id=5, chunked=False, query_members=AsyncMock(return_value=[member]))
+    with patch.object(DiscordListener, "get_channel", return_value=Mock(guild=guild)):
+        listener = DiscordListener(Mock())
+        assert [member] == await listener.find_prefix_matches(2, "az")
+        assert [member] == await listener.find_prefix_matches(2, "azul")
+        guild.query_members.assert_called_once_with("az")
+
+        # Others may share the prefix, so only exact matches are cached.
+        assert [member] == await listener.find_prefix_matches(2, "az")
+        assert 2 == guild.query_members.call_count
+
+
+@pytest.mark.asyncio
+async def test_find_prefix_matches_chunked():
+    member = Mock(id=1, display_name="azul")
+    member.name = "azul"
+    guild = Mock(id=5, chunked=True, members=[member], query_members=AsyncMock())
+    with patch.object(DiscordListener, "get_channel", return_value=Mock(guild=guild)):
+        listener = DiscordListener(Mock())
+        assert [member] == await listener.find_prefix_matches(2, "az")
+        assert [] == await listener.find_prefix_matches(2, "b")
+        guild.query_members.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_find_prefix_matches_events():
+    guild = Mock(id=5, chunked=False, query_members=AsyncMock(return_value=[]))
+    member = Mock(id=1, display_name="azul", guild=guild)
+    member.name = "azul"
+    with patch.object(DiscordListener, "get_channel", return_value=Mock(guild=guild)):
+        listener = DiscordListener(Mock())
+        await listener.on_member_join(member)
+        assert [member] == await listener.find_prefix_matches(2, "azul")
+
+        await listener.on_member_remove(member)
+        assert [] == await listener.find_prefix_matches(2, "azul")
+        assert [] == await listener.find_prefix_matches(2, "azul")
+        guild.query_members.assert_called_once_with("azul")
+
+        await listener.on_member_update(None, member)
+        assert [member] == await listener.find_prefix_matches(2, "azul")
+
+        await listener.on_guild_remove(guild)
+        assert not listener.member_indexes
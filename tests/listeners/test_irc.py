@@ -1,9 +1,12 @@
+import asyncio
 from asyncio import Future
 from unittest.mock import AsyncMock, Mock, call, patch
 
 import pytest
+from pydle.features.ircv3.tags import TaggedMessage
 
-from chitanda.listeners import IRCListener
+from chitanda.listeners import IRCListener, Priority
+from chitanda.listeners.irc import DEFAULT_THROTTLE
 
 
 def test_repr():
@@ -26,6 +29,16 @@ async def test_perform(monkeypatch):
         assert listener.performed is True
 
 
+@pytest.mark.asyncio
+async def test_on_connect_returns():
+    listener = IRCListener(None, "a", "irc.freenode.fake")
+    with patch.object(listener, "set_mode"), patch.object(
+        listener, "_perform"
+    ) as perform:
+        await asyncio.wait_for(listener.on_connect(), timeout=1)
+        perform.assert_called_once()
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("method", ["on_channel_message", "on_private_message"])
 async def test_on_message(method):
@@ -112,3 +125,97 @@ async def test_is_authed(identified, account, authed, monkeypatch):
             assert await listener.is_authed("azul")
         else:
             assert not await listener.is_authed("azul")
+
+
+def test_max_message_length():
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake")
+    listener.nickname = "chitanda"
+    assert 512 - len("chitanda!*@* PRIVMSG #chan :") - 25 == (
+        listener.max_message_length("#chan")
+    )
+
+
+@pytest.mark.asyncio
+async def test_message_scheduled():
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake")
+    with patch("chitanda.listeners.irc.pydle.Client.message") as message:
+        await listener.message("#chan", "hi")
+        await listener.message("#chan", "relayed", priority=Priority.RELAY)
+        while listener.scheduler._task is not None:
+            await asyncio.sleep(0)
+
+    assert message.call_args_list == [call("#chan", "hi"), call("#chan", "relayed")]
+
+
+@pytest.mark.asyncio
+async def test_message_wait():
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake")
+    with patch("chitanda.listeners.irc.pydle.Client.message") as message:
+        await listener.message("#chan", "hi", wait=True)
+        message.assert_called_once_with("#chan", "hi")
+
+
+def test_throttle_config():
+    listener = IRCListener(None, "a", "irc.freenode.fake", throttle={"burst": 2})
+    assert listener.scheduler._bucket.burst == 2
+    assert listener.scheduler._bucket.rate == DEFAULT_THROTTLE["rate"]
+
+
+@pytest.mark.asyncio
+async def test_is_authed_cached(monkeypatch):
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake")
+    with patch.object(
+        listener,
+        "whois",
+        AsyncMock(return_value={"identified": True, "account": "azul"}),
+    ) as whois:
+        await listener.is_authed("azul")
+        await listener.is_authed("azul")
+        whois.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "raw, invalidated",
+    [
+        (":azul!a@b NICK zad", ["azul", "zad"]),
+        (":azul!a@b PART #chan", ["azul"]),
+        (":azul!a@b QUIT :bye", ["azul"]),
+        (":op!a@b KICK #chan azul,zad", ["azul", "zad"]),
+        (":azul!a@b ACCOUNT azul", ["azul"]),
+    ],
+)
+async def test_whois_invalidated(raw, invalidated):
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake")
+    with patch.object(listener.whois_cache, "invalidate") as invalidate:
+        await listener.on_raw(TaggedMessage.parse(raw.encode()))
+        invalidate.assert_called_once_with(*invalidated)
+
+
+@pytest.mark.asyncio
+async def test_message_split_and_packed():
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake")
+    length = listener.max_message_length("#chan")
+    with patch("chitanda.listeners.irc.pydle.Client.message") as message:
+        await listener.message("#chan", "a" * (length - 10) + " " + "ü" * 20)
+        await listener.message("#chan", "short")
+        await listener.message("#chan", "line")
+        while listener.scheduler._task is not None:
+            await asyncio.sleep(0)
+
+    assert message.call_args_list == [
+        call("#chan", "a" * (length - 10)),
+        call("#chan", "ü" * 20 + " | short | line"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_message_not_packed():
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake", pack=False)
+    with patch("chitanda.listeners.irc.pydle.Client.message") as message:
+        await listener.message("#chan", "one")
+        await listener.message("#chan", "two")
+        while listener.scheduler._task is not None:
+            await asyncio.sleep(0)
+
+    assert message.call_args_list == [call("#chan", "one"), call("#chan", "two")]
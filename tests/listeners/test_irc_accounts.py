@@ -0,0 +1,169 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from chitanda.listeners import IRCListener
+
+HOSTNAME = "127.0.0.1"
+
+
+class FakeIRCServer:
+    """A minimal IRC server that negotiates capabilities and answers WHOIS."""
+
+    def __init__(self, caps, accounts):
+        self.caps = caps
+        self.accounts = accounts
+        self.whois_requests = []
+        self.writer = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, HOSTNAME, 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self.writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def send(self, line):
+        self.writer.write(f"{line}\r\n".encode())
+
+    async def handle(self, reader, writer):
+        self.writer = writer
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            command, *params = line.split(" ")
+            if line == "CAP LS 302":
+                self.send(f"CAP * LS :{' '.join(self.caps)}")
+            elif command == "CAP" and params[0] == "REQ":
+                self.send(f"CAP * ACK {' '.join(params[1:])}")
+            elif command == "USER":
+                self.send(":fake 001 chitanda :Welcome")
+                self.send(":fake 375 chitanda :MOTD")
+                self.send(":fake 376 chitanda :End of MOTD")
+            elif command == "WHOIS":
+                self.whois(params[0])
+
+    def whois(self, nickname):
+        self.whois_requests.append(nickname)
+        self.send(f":fake 311 chitanda {nickname} u h * :{nickname}")
+        if self.accounts.get(nickname):
+            self.send(f":fake 330 chitanda {nickname} {self.accounts[nickname]} :as")
+        self.send(f":fake 318 chitanda {nickname} :End of WHOIS")
+
+
+async def _wait_for(predicate):
+    for _ in range(200):
+        if predicate():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Timed out waiting for the fake IRC server.")
+
+
+@pytest.fixture(autouse=True)
+def irc_config(monkeypatch):
+    monkeypatch.setattr(
+        "chitanda.listeners.irc.config",
+        {
+            "irc_servers": {HOSTNAME: {"perform": []}},
+            "admins": {f"IRCListener@{HOSTNAME}": ["azul"]},
+        },
+    )
+
+
+@asynccontextmanager
+async def connect(caps, accounts=None):
+    server = FakeIRCServer(caps, accounts or {})
+    port = await server.start()
+    listener = IRCListener(Mock(handle_message=AsyncMock()), "chitanda", HOSTNAME)
+    await listener.connect(HOSTNAME, port, tls=False)
+    try:
+        await _wait_for(lambda: listener.performed)
+        yield server, listener
+    finally:
+        listener.own_eventloop = False  # Don't let pydle stop the test's loop.
+        await listener.disconnect(expected=True)
+        await server.close()
+        await asyncio.sleep(0.01)  # Let the connections finish closing.
+
+
+@pytest.mark.asyncio
+async def test_account_tag():
+    async with connect(["account-tag", "account-notify"]) as (server, listener):
+        server.send("@account=azul :azul!a@b PRIVMSG #chan :.quote add hi")
+        server.send(":zad!a@b PRIVMSG #chan :.lastfm")
+        await _wait_for(lambda: listener.bot.handle_message.call_count == 2)
+
+        assert "azul" == await listener.is_authed("azul")
+        assert await listener.is_admin("azul")
+        assert not await listener.is_authed("zad")
+        assert not server.whois_requests
+
+
+@pytest.mark.asyncio
+async def test_extended_join_and_account_notify():
+    async with connect(["extended-join", "account-notify"]) as (server, listener):
+        server.send(":azul!a@b JOIN #chan azul :Azul")
+        server.send(":zad!a@b JOIN #chan * :Zad")
+        await _wait_for(lambda: len(listener.accounts) == 2)
+        assert "azul" == await listener.is_authed("azul")
+        assert not await listener.is_authed("zad")
+
+        server.send(":zad!a@b ACCOUNT zadacc")
+        server.send(":azul!a@b ACCOUNT *")
+        await _wait_for(lambda: listener.accounts[listener.normalize("zad")])
+        assert "zadacc" == await listener.is_authed("zad")
+        assert not await listener.is_admin("azul")
+
+        server.send(":zad!a@b NICK zed")
+        await _wait_for(lambda: "zed" in listener.accounts)
+        assert "zadacc" == await listener.is_authed("zed")
+        assert not server.whois_requests
+
+
+@pytest.mark.asyncio
+async def test_whois_fallback():
+    async with connect([], accounts={"azul": "azul"}) as (server, listener):
+        server.send("@account=zad :zad!a@b PRIVMSG #chan :.lastfm")
+        await _wait_for(lambda: listener.bot.handle_message.called)
+
+        assert not listener.accounts
+        assert await listener.is_admin("azul")
+        assert not await listener.is_authed("zad")
+        assert ["azul", "zad"] == server.whois_requests
+
+
+@pytest.mark.asyncio
+async def test_untracked_user_falls_back_to_whois():
+    async with connect(["account-notify"], accounts={"azul": "azul"}) as (
+        server,
+        listener,
+    ):
+        assert "azul" == await listener.is_authed("azul")
+        assert ["azul"] == server.whois_requests
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "leave", [":chitanda!c@h PART #a", ":op!a@b KICK #a chitanda :bye"]
+)
+async def test_accounts_forgotten_when_bot_leaves(leave):
+    async with connect(["extended-join", "account-notify"]) as (server, listener):
+        server.send(":chitanda!c@h JOIN #a * :chitanda")
+        server.send(":chitanda!c@h JOIN #b * :chitanda")
+        server.send(":azul!a@b JOIN #a azul :Azul")
+        server.send(":zad!a@b JOIN #a zad :Zad")
+        server.send(":zad!a@b JOIN #b zad :Zad")
+        await _wait_for(lambda: "zad" in listener.accounts)
+        assert "azul" in listener.accounts
+
+        server.send(leave)
+        await _wait_for(lambda: "#a" not in listener.channels)
+        assert "azul" not in listener.accounts
+        assert "zad" in listener.accounts
+        assert not await listener.is_admin("azul")
+        assert ["azul"] == server.whois_requests
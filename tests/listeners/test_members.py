@@ -0,0 +1,101 @@
+from unittest.mock import Mock
+
+from chitanda.listeners import members
+from chitanda.listeners.members import MemberIndex
+
+
+def _member(id_, display_name, name=None):
+    member = Mock(id=id_, display_name=display_name)
+    member.name = name or display_name
+    return member
+
+
+def test_find_prefix():
+    index = MemberIndex()
+    azul, azure, zad = _member(1, "Azul"), _member(2, "azure"), _member(3, "zad")
+    index.fill([azul, azure, zad])
+    assert [azul, azure] == index.find("az")
+    assert [azul] == index.find("AZUL")
+    assert [] == index.find("b")
+
+
+def test_find_partial_index_exact_only():
+    index = MemberIndex()
+    alice = _member(1, "alice")
+    index.add(alice)
+    assert index.find("ali") is None
+    assert [alice] == index.find("Alice")
+
+
+def test_find_username():
+    index = MemberIndex()
+    member = _member(1, "Nickname", "username")
+    index.add(member)
+    assert [member] == index.find("username")
+    assert [member] == index.find("nickname")
+
+
+def test_add_replaces_member():
+    index = MemberIndex()
+    index.add(_member(1, "old"))
+    new = _member(1, "new")
+    index.add(new)
+    assert len(index) == 1
+    assert index.find("old") is None
+    assert [new] == index.find("new")
+
+
+def test_query_results_expire(monkeypatch):
+    index = MemberIndex()
+    index.add_query_result("azul", [_member(1, "azul")])
+    index.add_query_result("ghost", [])
+    monkeypatch.setattr(members, "QUERY_TTL", 0)
+    assert index.find("azul") is None
+    assert index.find("ghost") is None
+    assert not len(index)
+
+
+def test_complete_index_doesnt_expire(monkeypatch):
+    index = MemberIndex()
+    member = _member(1, "azul")
+    index.fill([member])
+    monkeypatch.setattr(members, "QUERY_TTL", 0)
+    assert [member] == index.find("az")
+
+
+def test_remove():
+    index = MemberIndex()
+    index.add(_member(1, "azul", "user"))
+    index.remove(1)
+    index.remove(2)
+    assert not len(index)
+    assert index.find("azul") is None
+    assert index.find("user") is None
+
+
+def test_refresh():
+    index = MemberIndex()
+    member = _member(1, "azul")
+    index.add(member)
+    member.name = member.display_name = "renamed"
+    index.refresh(1)
+    index.refresh(2)
+    assert [member] == index.find("renamed")
+    assert index.find("azul") is None
+
+
+def test_query_misses():
+    index = MemberIndex()
+    index.add_query_result("Ghost", [])
+    assert [] == index.find("ghost")
+
+    ghost = _member(1, "ghost")
+    index.add(ghost)
+    assert [ghost] == index.find("ghost")
+
+
+def test_query_result_added():
+    index = MemberIndex()
+    member = _member(1, "azul")
+    index.add_query_result("azul", [member])
+    assert [member] == index.find("azul")
@@ -0,0 +1,125 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from chitanda.listeners.scheduler import MessageScheduler, Priority, TokenBucket
+
+
+async def _drain(scheduler):
+    while scheduler._task is not None:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_burst():
+    bucket = TokenBucket(rate=1, burst=3)
+    for _ in range(3):
+        await bucket.acquire()
+    assert bucket._tokens < 1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits(monkeypatch):
+    sleep = AsyncMock()
+    monkeypatch.setattr("chitanda.listeners.scheduler.asyncio.sleep", sleep)
+    bucket = TokenBucket(rate=2, burst=1)
+    await bucket.acquire()
+    await bucket.acquire()
+    assert sleep.call_args[0][0] == pytest.approx(0.5, abs=0.01)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_round_robin():
+    send = AsyncMock()
+    scheduler = MessageScheduler(send, rate=100, burst=100)
+    for i in range(3):
+        scheduler.enqueue("#flood", f"flood{i}")
+    scheduler.enqueue("#quiet", "hi")
+
+    await _drain(scheduler)
+    assert [c[0] for c in send.call_args_list] == [
+        ("#flood", "flood0"),
+        ("#quiet", "hi"),
+        ("#flood", "flood1"),
+        ("#flood", "flood2"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_priority():
+    send = AsyncMock()
+    scheduler = MessageScheduler(send, rate=100, burst=100)
+    scheduler.enqueue("#chan", "relay1", Priority.RELAY)
+    scheduler.enqueue("#chan", "relay2", Priority.RELAY)
+    scheduler.enqueue("#other", "reply", Priority.REPLY)
+
+    await _drain(scheduler)
+    assert [c[0][1] for c in send.call_args_list] == ["reply", "relay1", "relay2"]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_send_error():
+    send = AsyncMock(side_effect=[ValueError("oops"), None])
+    scheduler = MessageScheduler(send, rate=100, burst=100)
+    scheduler.enqueue("#chan", "one")
+    scheduler.enqueue("#chan", "two")
+
+    await _drain(scheduler)
+    assert send.call_count == 2
+    assert scheduler.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_stats():
+    scheduler = MessageScheduler(AsyncMock(), rate=100, burst=100)
+    scheduler.enqueue("#chan", "one")
+    scheduler.enqueue("#chan", "two", Priority.RELAY)
+    scheduler.enqueue("#other", "three", Priority.RELAY)
+
+    stats = scheduler.stats
+    assert stats["depth"] == 3
+    assert stats["depth_by_priority"] == {"reply": 1, "relay": 2}
+    assert stats["targets"] == 2
+
+    await _drain(scheduler)
+    stats = scheduler.stats
+    assert stats["depth"] == 0
+    assert stats["sent"] == 3
+    assert stats["max_wait"] >= stats["mean_wait"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_merge():
+    send = AsyncMock()
+
+    def merge(target, message, next_message):
+        if len(message) + len(next_message) <= 6:
+            return message + next_message
+
+    scheduler = MessageScheduler(send, rate=100, burst=100, merge=merge)
+    for message in ["ab", "cd", "ef", "ghijk"]:
+        scheduler.enqueue("#chan", message)
+    scheduler.enqueue("#other", "xy")
+    scheduler.enqueue("#chan", "relay", Priority.RELAY)
+
+    await _drain(scheduler)
+    assert [c[0] for c in send.call_args_list] == [
+        ("#chan", "abcdef"),
+        ("#other", "xy"),
+        ("#chan", "ghijk"),
+        ("#chan", "relay"),
+    ]
+    assert scheduler.depth == 0
+
+
+@pytest.mark.asyncio
+async def test_scheduler_enqueue_future():
+    send = AsyncMock(side_effect=[ValueError("oops"), None])
+    scheduler = MessageScheduler(send, rate=100, burst=100)
+    failed = scheduler.enqueue("#chan", "one")
+    sent = scheduler.enqueue("#chan", "two")
+    assert not sent.done()
+
+    await asyncio.wait_for(asyncio.gather(failed, sent), 1)
+    assert send.call_count == 2
@@ -0,0 +1,79 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from chitanda.listeners.whois import WhoisCache
+
+INFO = {"identified": True, "account": "azul"}
+
+
+@pytest.mark.asyncio
+async def test_cached():
+    whois = AsyncMock(return_value=INFO)
+    cache = WhoisCache(whois)
+    assert INFO == await cache.get("azul")
+    assert INFO == await cache.get("AZUL")
+    whois.assert_called_once_with("azul")
+
+
+@pytest.mark.asyncio
+async def test_expired(monkeypatch):
+    whois = AsyncMock(return_value=INFO)
+    cache = WhoisCache(whois, ttl=10)
+    monkeypatch.setattr("chitanda.listeners.whois.time.monotonic", lambda: 100)
+    await cache.get("azul")
+    monkeypatch.setattr("chitanda.listeners.whois.time.monotonic", lambda: 111)
+    await cache.get("azul")
+    assert whois.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_coalesced():
+    lookup = asyncio.get_event_loop().create_future()
+    calls = []
+
+    async def whois(nickname):
+        calls.append(nickname)
+        return await lookup
+
+    cache = WhoisCache(whois)
+    results = asyncio.gather(*(cache.get("azul") for _ in range(5)))
+    await asyncio.sleep(0)
+    lookup.set_result(INFO)
+    assert [INFO] * 5 == await results
+    assert ["azul"] == calls
+    assert "azul" in cache._results
+
+
+@pytest.mark.asyncio
+async def test_invalidate():
+    whois = AsyncMock(return_value=INFO)
+    cache = WhoisCache(whois)
+    await cache.get("azul")
+    cache.invalidate("Azul")
+    await cache.get("azul")
+    assert whois.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_invalidate_in_flight():
+    lookup = asyncio.get_event_loop().create_future()
+    cache = WhoisCache(lambda nickname: asyncio.shield(lookup))
+
+    result = asyncio.ensure_future(cache.get("azul"))
+    await asyncio.sleep(0)
+    cache.invalidate("azul")
+    lookup.set_result(INFO)
+    assert INFO == await result
+    assert not cache._results
+    assert not cache._pending
+
+
+@pytest.mark.asyncio
+async def test_error_not_cached():
+    whois = AsyncMock(side_effect=[ValueError, INFO])
+    cache = WhoisCache(whois)
+    with pytest.raises(ValueError):
+        await cache.get("azul")
+    assert INFO == await cache.get("azul")
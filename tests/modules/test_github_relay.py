@@ -3,6 +3,7 @@ from unittest.mock import AsyncMock, Mock, patch
 import pytest
 
 from chitanda.errors import BotError
+from chitanda.listeners import Priority
 from chitanda.modules.github_relay import (
     _check_signature,
     _construct_commit_message,
@@ -326,6 +327,7 @@ async def test_handle_issue():
     listener.message.assert_called_with(
         target="#chan",
         message="azul opened issue 8 in chitanda - fix bot - url//",
+        priority=Priority.RELAY,
     )
 
 
@@ -349,6 +351,7 @@ async def test_handle_pull_request():
     listener.message.assert_called_with(
         target="#chan",
         message=("azul opened pull request 8 in chitanda - fix bot - url//"),
+        priority=Priority.RELAY,
     )
 
 
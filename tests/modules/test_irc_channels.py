@@ -1,13 +1,19 @@
-from unittest.mock import AsyncMock, Mock, call
+import asyncio
+import sqlite3
+from unittest.mock import AsyncMock, Mock
 
 import pytest
 
 from chitanda.database import database
 from chitanda.errors import BotError
 from chitanda.listeners import IRCListener
+from chitanda.modules import irc_channels
 from chitanda.modules.irc_channels import (
     _get_channels_to_rejoin,
+    _pack_channels,
+    _rejoin,
     _rejoin_channels,
+    flush,
     join,
     on_join,
     on_part,
@@ -16,6 +22,12 @@ from chitanda.modules.irc_channels import (
 from chitanda.util import Message
 
 
+@pytest.fixture(autouse=True)
+def reset_changes(monkeypatch):
+    monkeypatch.setattr("chitanda.modules.irc_channels._changes", {})
+    monkeypatch.setattr("chitanda.modules.irc_channels._flush_task", None)
+
+
 @pytest.mark.asyncio
 async def test_join():
     listener = Mock(
@@ -106,6 +118,7 @@ async def test_on_join(test_db):
     listener.nickname = "chitanda"
     listener.on_join = AsyncMock(return_value=True)
     await on_join(listener, "#channel", "chitanda")
+    await flush()
     with database() as (conn, cursor):
         cursor.execute(
             """
@@ -122,6 +135,7 @@ async def test_on_join_other_user(test_db):
     listener.nickname = "chitanda"
     listener.on_join = AsyncMock(return_value=True)
     await on_join(listener, "#channel", "azul")
+    await flush()
     with database() as (conn, cursor):
         cursor.execute(
             """
@@ -145,7 +159,11 @@ async def test_on_part(test_db):
             """
         )
         conn.commit()
-        await on_part(listener, "#channel", "chitanda", None)
+
+    await on_part(listener, "#channel", "chitanda", None)
+    await flush()
+
+    with database() as (conn, cursor):
         cursor.execute(
             """
             SELECT 1 FROM irc_channels WHERE name = "#channel"
@@ -168,7 +186,11 @@ async def test_on_part_other_user(test_db):
             """
         )
         conn.commit()
-        await on_part(listener, "#channel", "azul", None)
+
+    await on_part(listener, "#channel", "azul", None)
+    await flush()
+
+    with database() as (conn, cursor):
         cursor.execute(
             """
             SELECT 1 FROM irc_channels WHERE name = "#channel"
@@ -178,7 +200,43 @@ async def test_on_part_other_user(test_db):
         assert cursor.fetchone()
 
 
-def test_get_channels_to_rejoin(test_db):
+@pytest.mark.asyncio
+async def test_join_part_coalesced(test_db, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.irc_channels.FLUSH_DELAY", 0)
+    listener = IRCListener(None, "chitanda", "irc.freenode.fake")
+    listener.nickname = "chitanda"
+    transaction = AsyncMock()
+    monkeypatch.setattr("chitanda.modules.irc_channels.db.transaction", transaction)
+
+    await on_join(listener, "#a", "chitanda")
+    await on_join(listener, "#b", "chitanda")
+    await on_part(listener, "#a", "chitanda", None)
+    while irc_channels._flush_task is not None:
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+    transaction.assert_called_once()
+    assert transaction.call_args[0][1] == {
+        ("#a", "irc.freenode.fake"): False,
+        ("#b", "irc.freenode.fake"): True,
+    }
+
+
+@pytest.mark.asyncio
+async def test_flush_failure_retried(monkeypatch):
+    monkeypatch.setattr(
+        "chitanda.modules.irc_channels.db.transaction",
+        AsyncMock(side_effect=sqlite3.OperationalError("locked")),
+    )
+    monkeypatch.setattr(
+        "chitanda.modules.irc_channels._changes", {("#a", "server"): True}
+    )
+    await flush()
+    assert irc_channels._changes == {("#a", "server"): True}
+
+
+@pytest.mark.asyncio
+async def test_get_channels_to_rejoin(test_db):
     with database() as (conn, cursor):
         cursor.execute(
             """
@@ -187,31 +245,64 @@ def test_get_channels_to_rejoin(test_db):
             """
         )
         conn.commit()
-        assert _get_channels_to_rejoin() == {"1": ["#1"], "2": ["#2"]}
+    assert await _get_channels_to_rejoin() == {"1": ["#1"], "2": ["#2"]}
 
 
 @pytest.mark.asyncio
-async def test_rejoin_channels():
-    listener1 = Mock(performed=True, join=AsyncMock(return_value=True))
-    listener2 = Mock(performed=True, join=AsyncMock(return_value=True))
+async def test_rejoin(monkeypatch):
+    rejoin_channels = AsyncMock()
+    monkeypatch.setattr(
+        "chitanda.modules.irc_channels._rejoin_channels", rejoin_channels
+    )
+    monkeypatch.setattr(
+        "chitanda.modules.irc_channels._get_channels_to_rejoin",
+        AsyncMock(return_value={"server1": ["#a"], "gone": ["#b"]}),
+    )
+    listener1, listener2 = Mock(), Mock()
     bot = Mock(irc_listeners={"server1": listener1, "server2": listener2})
-    channels = {"server1": ["a", "b"], "server2": ["c", "d"]}
-    await _rejoin_channels(bot, channels)
-    assert not channels
-    assert listener1.join.call_args_list == [call("a"), call("b")]
-    assert listener2.join.call_args_list == [call("c"), call("d")]
+
+    await _rejoin(bot)
+    rejoin_channels.assert_called_once_with(listener1, ["#a"])
 
 
 @pytest.mark.asyncio
-async def test_rejoin_channels_timeout(monkeypatch):
-    async def fut_true(a):
-        return True
+async def test_rejoin_channels(monkeypatch):
+    monkeypatch.setattr(
+        "chitanda.modules.irc_channels.config",
+        {"irc_servers": {"server1": {"join_rate": 1000}}},
+    )
+    listener = Mock(hostname="server1", wait_performed=AsyncMock(), rawmsg=AsyncMock())
+    channels = [f"#{i:03}" for i in range(200)]
+
+    await _rejoin_channels(listener, channels)
+    listener.wait_performed.assert_called_once()
+    batches = [c[0][1].split(",") for c in listener.rawmsg.call_args_list]
+    assert len(batches) == 2
+    assert channels == [channel for batch in batches for channel in batch]
+    assert all(c[0][0] == "JOIN" for c in listener.rawmsg.call_args_list)
 
+
+@pytest.mark.asyncio
+async def test_rejoin_channels_waits_for_perform(monkeypatch):
     monkeypatch.setattr(
-        "chitanda.modules.irc_channels.asyncio",
-        Mock(sleep=fut_true),
+        "chitanda.modules.irc_channels.config", {"irc_servers": {"server1": {}}}
     )
-    bot = Mock(irc_listeners={})
-    channels = {"server1": ["a", "b"], "server2": ["c", "d"]}
-    await _rejoin_channels(bot, channels)
-    assert "server1" in channels and "server2" in channels
+    listener = IRCListener(None, "chitanda", "server1")
+    listener.rawmsg = AsyncMock()
+
+    task = asyncio.ensure_future(_rejoin_channels(listener, ["#a", "#b"]))
+    await asyncio.sleep(0)
+    listener.rawmsg.assert_not_called()
+
+    listener._performed.set()
+    await task
+    listener.rawmsg.assert_called_once_with("JOIN", "#a,#b")
+
+
+def test_pack_channels(monkeypatch):
+    monkeypatch.setattr("chitanda.modules.irc_channels.JOIN_LENGTH", 8)
+    assert list(_pack_channels(["#a", "#b", "#c", "#dddddd", "#e"])) == [
+        ["#a", "#b", "#c"],
+        ["#dddddd"],
+        ["#e"],
+    ]
@@ -126,6 +126,24 @@ async def test_unset(test_db):
         assert not cursor.fetchone()
 
 
+@pytest.mark.asyncio
+async def test_unset_nonexistent(test_db):
+    assert "No Last.FM username to unset." == await unset.call(
+        Message(
+            bot=None,
+            listener=Mock(
+                is_authed=AsyncMock(return_value="azuline"),
+                spec=DiscordListener,
+                __str__=lambda *a: "DiscordListener",
+            ),
+            target="#chan",
+            author="azul",
+            contents="",
+            private=True,
+        )
+    )
+
+
 DEMO_RESPONSES = [
     {
         "recenttracks": {
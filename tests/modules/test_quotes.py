@@ -1,3 +1,5 @@
+import sqlite3
+from pathlib import Path
 from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
@@ -5,9 +7,17 @@ import pytest
 from chitanda.database import database
 from chitanda.errors import BotError
 from chitanda.listeners import DiscordListener
-from chitanda.modules.quotes import add, delete, fetch, find
+from chitanda.modules.quotes import add, delete, fetch, find, ids
 from chitanda.util import Message
 
+MIGRATIONS = Path(find.__file__).parent / "migrations"
+
+
+@pytest.fixture(autouse=True)
+def reset_ids(monkeypatch):
+    monkeypatch.setattr("chitanda.modules.quotes.ids._ids", {})
+    monkeypatch.setattr("chitanda.modules.quotes.ids._versions", {})
+
 
 @pytest.mark.asyncio
 async def test_add_quote(test_db):
@@ -51,6 +61,39 @@ def test_get_quote_id_nonexistent(test_db):
         assert 1 == add._get_quote_id(cursor, "a", "b")
 
 
+def test_get_quote_id_cached(test_db):
+    with database() as (conn, cursor):
+        assert 1 == add._add_quote(cursor, "b", "a", "c", "d")
+        cursor.execute("DELETE FROM quotes")
+        assert 2 == add._get_quote_id(cursor, "b", "a")
+
+
+def test_add_quote_stale_ids(test_db):
+    with database() as (conn, cursor):
+        assert 1 == add._add_quote(cursor, "b", "a", "c", "d")
+        ids._ids[("b", "a")] = []
+        assert 2 == add._add_quote(cursor, "b", "a", "c", "d")
+        assert [1, 2] == ids._ids[("b", "a")]
+
+
+def test_ids_changed_while_loading():
+    cursor = Mock(fetchall=Mock(return_value=[]))
+    cursor.execute.side_effect = lambda *_: ids.add_id("b", "a", 1)
+    assert [] == ids._get_ids(cursor, "b", "a")
+    assert ("b", "a") not in ids._ids
+
+
+def test_ids_add_and_remove(test_db):
+    with database() as (conn, cursor):
+        assert ids.random_id(cursor, "b", "a") is None
+        ids.add_id("b", "a", 3)
+        ids.add_id("b", "a", 1)
+        assert 4 == ids.next_id(cursor, "b", "a")
+        ids.remove_ids("b", "a", [3])
+        assert 1 == ids.random_id(cursor, "b", "a")
+        assert 2 == ids.next_id(cursor, "b", "a")
+
+
 @pytest.mark.asyncio
 async def test_delete_quote(test_db):
     with patch("chitanda.modules.quotes.delete.fetch.fetch_quotes") as f:
@@ -68,22 +111,23 @@ async def test_delete_quote(test_db):
             )
             conn.commit()
 
-            async for r in delete.call(
-                Message(
-                    bot=None,
-                    listener=Mock(
-                        is_admin=AsyncMock(return_value=True),
-                        spec=DiscordListener,
-                        __str__=lambda *a: "DiscordListener",
-                    ),
-                    target="#chan",
-                    author="azul",
-                    contents="1 2 3",
-                    private=False,
-                )
-            ):
-                pass
+        async for r in delete.call(
+            Message(
+                bot=None,
+                listener=Mock(
+                    is_admin=AsyncMock(return_value=True),
+                    spec=DiscordListener,
+                    __str__=lambda *a: "DiscordListener",
+                ),
+                target="#chan",
+                author="azul",
+                contents="1 2 3",
+                private=False,
+            )
+        ):
+            pass
 
+        with database() as (conn, cursor):
             cursor.execute("SELECT COUNT(1) FROM quotes")
             assert 2 == cursor.fetchone()[0]
 
@@ -145,6 +189,20 @@ async def test_fetch_random_quote(test_db):
     assert "This channel has no quotes saved." not in response
 
 
+def test_fetch_random_quote_stale_ids(test_db):
+    with database() as (conn, cursor):
+        cursor.execute(
+            """
+            INSERT INTO quotes (id, channel, listener, quote, adder)
+            VALUES (2, '#chan', 'DiscordListener', 'hi', 'azul')
+            """
+        )
+        ids._ids[("DiscordListener", "#chan")] = [1]
+        assert "#2 by azul: hi" == fetch._fetch_random_quote(
+            cursor, "#chan", "DiscordListener"
+        )
+
+
 @pytest.mark.asyncio
 async def test_fetch_quotes(test_db):
     with database() as (conn, cursor):
@@ -213,7 +271,7 @@ async def test_find_quote(test_db):
                 listener="DiscordListener",
                 target="#chan",
                 author="azul",
-                contents="hi a%",
+                contents="hi ag*",
                 private=False,
             )
         )
@@ -223,6 +281,80 @@ async def test_find_quote(test_db):
     assert response[0] == "#2 by azul: hi again"
 
 
+@pytest.mark.asyncio
+async def test_find_quote_phrase_ranked(test_db):
+    with database() as (conn, cursor):
+        cursor.execute(
+            """
+            INSERT INTO quotes (id, channel, listener, quote, adder)
+            VALUES
+            (1, '#chan', 'DiscordListener', 'again hi', 'azul'),
+            (2, '#chan', 'DiscordListener', 'hi again hi again', 'azul'),
+            (3, '#chan', 'DiscordListener', 'hi again', 'azul'),
+            (4, '#notchan', 'DiscordListener', 'hi again', 'azul')
+            """
+        )
+        conn.commit()
+
+    response = [
+        r
+        async for r in find.call(
+            Message(
+                bot=None,
+                listener="DiscordListener",
+                target="#chan",
+                author="azul",
+                contents='"hi again"',
+                private=False,
+            )
+        )
+    ]
+
+    assert response == ["#2 by azul: hi again hi again", "#3 by azul: hi again"]
+
+
+@pytest.mark.asyncio
+async def test_find_quote_after_delete(test_db):
+    with database() as (conn, cursor):
+        cursor.execute(
+            """
+            INSERT INTO quotes (id, channel, listener, quote, adder)
+            VALUES (1, '#chan', 'DiscordListener', 'hi again', 'azul')
+            """
+        )
+        cursor.execute("DELETE FROM quotes WHERE id = 1")
+        conn.commit()
+
+    response = [
+        r
+        async for r in find.call(
+            Message(
+                bot=None,
+                listener="DiscordListener",
+                target="#chan",
+                author="azul",
+                contents="again",
+                private=False,
+            )
+        )
+    ]
+
+    assert response == ["No quotes found."]
+
+
+@pytest.mark.parametrize(
+    "search, query",
+    [
+        ("hi there", '"hi" "there"'),
+        ('"hi there" friend', '"hi there" "friend"'),
+        ("pre* NOT", '"pre"* "NOT"'),
+        ('say "hi', '"say" """hi"'),
+    ],
+)
+def test_build_query(search, query):
+    assert query == find._build_query(search)
+
+
 @pytest.mark.asyncio
 async def test_find_quote_doesnt_exist(test_db):
     with database() as (conn, cursor):
@@ -251,3 +383,18 @@ async def test_find_quote_doesnt_exist(test_db):
 
     assert len(response) == 1
     assert response[0] == "No quotes found."
+
+
+def test_fts_migration_backfills():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript((MIGRATIONS / "0001.sql").read_text())
+    conn.execute(
+        """
+        INSERT INTO quotes (id, channel, listener, quote, adder)
+        VALUES (1, '#chan', 'DiscordListener', 'hi again', 'azul')
+        """
+    )
+    conn.executescript((MIGRATIONS / "0002.sql").read_text())
+    assert [(1, "#chan")] == conn.execute(
+        "SELECT id, channel FROM quotes_fts WHERE quotes_fts MATCH 'again'"
+    ).fetchall()
@@ -0,0 +1,237 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from chitanda.bot import Chitanda
+from chitanda.listeners import DiscordListener
+from chitanda.modules import relay
+from chitanda.modules.relay import (
+    RELAY_USERNAME,
+    _build_index,
+    _close_sessions,
+    _get_linked_targets,
+    _get_webhook,
+    _relay,
+    _relay_message,
+    get_queue_stats,
+)
+from chitanda.util import Message
+
+IRC = {"listener": "IRCListener@irc.fake", "channel": "#chan"}
+DISCORD = {"listener": "DiscordListener", "channel": "123", "webhook": "url"}
+OTHER = {"listener": "IRCListener@irc.fake", "channel": "#other"}
+
+
+@pytest.fixture(autouse=True)
+def reset_index(monkeypatch):
+    monkeypatch.setattr("chitanda.modules.relay._index", {})
+    monkeypatch.setattr("chitanda.modules.relay._index_links", None)
+    monkeypatch.setattr("chitanda.modules.relay._semaphore", None)
+    monkeypatch.setattr("chitanda.modules.relay._queues", {})
+    monkeypatch.setattr("chitanda.modules.relay._sessions", {})
+    monkeypatch.setattr("chitanda.modules.relay._webhooks", {})
+
+
+async def drain():
+    await asyncio.gather(*(q.task for q in relay._queues.values() if q.task))
+
+
+@pytest.fixture
+def bot():
+    return Mock(irc_listeners={"irc.fake": Mock()}, discord_listener=Mock())
+
+
+def test_build_index(bot):
+    irc, discord = bot.irc_listeners["irc.fake"], bot.discord_listener
+    index = _build_index(bot, [[IRC, DISCORD, OTHER]])
+    assert index[(irc, "#chan")] == ((discord, DISCORD), (irc, OTHER))
+    assert index[(discord, "123")] == ((irc, IRC), (irc, OTHER))
+    assert index[(irc, "#other")] == ((irc, IRC), (discord, DISCORD))
+
+
+def test_build_index_invalid_listener(bot):
+    missing = {"listener": "IRCListener@gone", "channel": "#chan"}
+    index = _build_index(bot, [[IRC, missing, DISCORD]])
+    assert index[(bot.discord_listener, "123")] == (
+        (bot.irc_listeners["irc.fake"], IRC),
+    )
+
+
+def test_get_linked_targets_unlinked(bot, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.relay.config", {"relay": [[IRC, DISCORD]]})
+    assert () == _get_linked_targets(bot, bot.discord_listener, 456)
+
+
+def test_get_linked_targets_rebuilt_on_reload(bot, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.relay.config", {"relay": [[IRC, DISCORD]]})
+    assert _get_linked_targets(bot, bot.discord_listener, 123)
+    index = relay._index
+    assert _get_linked_targets(bot, bot.discord_listener, 123)
+    assert relay._index is index
+
+    monkeypatch.setattr("chitanda.modules.relay.config", {"relay": []})
+    assert () == _get_linked_targets(bot, bot.discord_listener, 123)
+
+
+@pytest.mark.asyncio
+async def test_relay(bot, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.relay.config", {"relay": [[IRC, OTHER]]})
+    relay_message = AsyncMock()
+    monkeypatch.setattr("chitanda.modules.relay._relay_message", relay_message)
+    irc = bot.irc_listeners["irc.fake"]
+
+    await _relay(bot, irc, "#chan", "hi", source=Mock(author="azul"))
+    await drain()
+    relay_message.assert_called_once_with(irc, OTHER, "azul", "hi")
+
+
+@pytest.mark.asyncio
+async def test_message_relayed_before_reply(bot, monkeypatch):
+    monkeypatch.setattr("chitanda.bot.config", {"webserver": {"enable": False}})
+    monkeypatch.setattr("chitanda.modules.relay.config", {"relay": [[IRC, OTHER]]})
+    relayed = []
+
+    async def relay_message(listener, target, author, message):
+        relayed.append(message)
+
+    async def reply():
+        return "hi"
+
+    async def dispatch(message):
+        await chitanda.handle_response(reply(), source=message)
+
+    monkeypatch.setattr("chitanda.modules.relay._relay_message", relay_message)
+    chitanda = Chitanda()
+    chitanda.irc_listeners = bot.irc_listeners
+    chitanda.message_handlers.append(relay.on_message)
+    chitanda.response_handlers.append(relay.on_response)
+    irc = bot.irc_listeners["irc.fake"]
+    irc.message = AsyncMock()
+
+    with patch.object(chitanda, "dispatch_command", side_effect=dispatch):
+        await chitanda.handle_message(
+            Message(chitanda, irc, "#chan", "azul", ".say hi", False)
+        )
+    await drain()
+    assert relayed == [".say hi", "hi"]
+
+
+@pytest.mark.asyncio
+async def test_relay_slow_target_doesnt_block(bot, monkeypatch):
+    monkeypatch.setattr(
+        "chitanda.modules.relay.config", {"relay": [[IRC, DISCORD, OTHER]]}
+    )
+    webhook_sent = asyncio.Event()
+    relayed = []
+
+    async def relay_message(listener, target, author, message):
+        if target is DISCORD:
+            await webhook_sent.wait()
+        relayed.append(target["channel"])
+
+    monkeypatch.setattr("chitanda.modules.relay._relay_message", relay_message)
+    await _relay(bot, bot.irc_listeners["irc.fake"], "#chan", "hi")
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert relayed == ["#other"]
+
+    webhook_sent.set()
+    await drain()
+    assert relayed == ["#other", "123"]
+
+
+@pytest.mark.asyncio
+async def test_relay_target_error(bot, monkeypatch):
+    monkeypatch.setattr(
+        "chitanda.modules.relay.config", {"relay": [[IRC, DISCORD, OTHER]]}
+    )
+    relay_message = AsyncMock(side_effect=[ValueError, None])
+    monkeypatch.setattr("chitanda.modules.relay._relay_message", relay_message)
+
+    await _relay(bot, bot.irc_listeners["irc.fake"], "#chan", "hi")
+    await drain()
+    assert relay_message.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_relay_merges_bursts(bot, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.relay.config", {"relay": [[IRC, OTHER]]})
+    relay_message = AsyncMock()
+    monkeypatch.setattr("chitanda.modules.relay._relay_message", relay_message)
+    irc = bot.irc_listeners["irc.fake"]
+
+    for author, message in [("azul", "a"), ("azul", "b"), ("tom", "c"), ("tom", "d")]:
+        await _relay(bot, irc, "#chan", message, source=Mock(author=author))
+    await drain()
+    assert [c.args[2:] for c in relay_message.call_args_list] == [
+        ("azul", "a | b"),
+        ("tom", "c | d"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_relay_doesnt_merge_outside_window(bot, monkeypatch):
+    monkeypatch.setattr(
+        "chitanda.modules.relay.config",
+        {"relay": [[IRC, OTHER]], "relay_queue": {"window": -1}},
+    )
+    relay_message = AsyncMock()
+    monkeypatch.setattr("chitanda.modules.relay._relay_message", relay_message)
+    irc = bot.irc_listeners["irc.fake"]
+
+    for message in ["a", "b", "c"]:
+        await _relay(bot, irc, "#chan", message, source=Mock(author="azul"))
+    await drain()
+    assert relay_message.call_count == 3
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "overflow, expected",
+    [
+        ("drop_oldest", [("a", "2"), ("b", "3")]),
+        ("summarize", [(None, "[2 messages skipped]"), ("a", "2"), ("b", "3")]),
+    ],
+)
+async def test_relay_queue_overflow(bot, monkeypatch, overflow, expected):
+    monkeypatch.setattr(
+        "chitanda.modules.relay.config",
+        {"relay": [[IRC, OTHER]], "relay_queue": {"size": 2, "overflow": overflow}},
+    )
+    relay_message = AsyncMock()
+    monkeypatch.setattr("chitanda.modules.relay._relay_message", relay_message)
+    irc = bot.irc_listeners["irc.fake"]
+
+    for author, message in [("a", "0"), ("b", "1"), ("a", "2"), ("b", "3")]:
+        await _relay(bot, irc, "#chan", message, source=Mock(author=author))
+    await drain()
+    assert [c.args[2:] for c in relay_message.call_args_list] == expected
+    assert get_queue_stats()[(str(irc), "#other")]["dropped"] == 2
+
+
+@pytest.mark.asyncio
+async def test_relay_skipped_notice_to_discord(monkeypatch):
+    webhook = Mock(send=AsyncMock())
+    monkeypatch.setattr("chitanda.modules.relay._get_webhook", lambda url: webhook)
+    listener = Mock(spec=DiscordListener, find_prefix_matches=AsyncMock())
+
+    await _relay_message(listener, DISCORD, None, "[2 messages skipped]")
+    listener.find_prefix_matches.assert_not_awaited()
+    webhook.send.assert_awaited_once_with(
+        content="[2 messages skipped]", username=RELAY_USERNAME, avatar_url=None
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_webhook_cached():
+    url1 = f"https://discord.com/api/webhooks/{'1' * 18}/{'a' * 68}"
+    url2 = f"https://discord.com/api/webhooks/{'2' * 18}/{'a' * 68}"
+    try:
+        webhook = _get_webhook(url1)
+        assert webhook is _get_webhook(url1)
+        assert webhook is not _get_webhook(url2)
+        assert len(relay._sessions) == 1
+    finally:
+        await _close_sessions()
+    assert not relay._sessions and not relay._webhooks
@@ -11,9 +11,10 @@ from chitanda.util import Message
 async def test_reload(monkeypatch):
     monkeypatch.setattr("chitanda.modules.reload.config", Mock())
     monkeypatch.setattr("chitanda.modules.reload.load_commands", Mock())
+    bot = Mock(run_shutdown_handlers=AsyncMock())
     assert "Commands reloaded." == await call(
         Message(
-            bot=None,
+            bot=bot,
             listener=Mock(is_admin=AsyncMock(return_value=True)),
             target=None,
             author=None,
@@ -21,6 +22,7 @@ async def test_reload(monkeypatch):
             private=False,
         )
     )
+    bot.run_shutdown_handlers.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -50,7 +52,7 @@ async def test_reload_error_commands(monkeypatch):
     with pytest.raises(BotError):
         await call(
             Message(
-                bot=None,
+                bot=Mock(run_shutdown_handlers=AsyncMock()),
                 listener=Mock(is_admin=AsyncMock(return_value=True)),
                 target=None,
                 author=None,
@@ -1,76 +1,107 @@
+import re
+import time
 from asyncio import Future
-from collections import deque
 from unittest.mock import Mock, patch
 
 import pytest
 
+from chitanda.history import MessageHistory
 from chitanda.listeners import DiscordListener, IRCListener
-from chitanda.modules.sed import _get_author, call, on_message, on_response
+from chitanda.modules import sed
+from chitanda.modules.sed import (
+    LINEAR_BUDGET,
+    _close_pool,
+    _compile_linear_regex,
+    _find_and_replace,
+    _get_author,
+    call,
+    log_message,
+    on_message,
+    on_response,
+)
 from chitanda.util import Message, Response
 
 
-@pytest.mark.asyncio
-async def test_on_message_match():
-    with patch("chitanda.modules.sed._substitute", return_value=Future()) as sub:
-        with patch("chitanda.modules.sed._attach_message_log"):
-            sub.return_value.set_result(123)
-            listener = Mock(message_log={"#chan": []})
-            await on_message(
-                Message(
-                    bot=None,
-                    listener=listener,
-                    target="#chan",
-                    author=None,
-                    contents="s/from/to",
-                    private=False,
-                )
-            )
-            sub.assert_called()
+@pytest.fixture(autouse=True)
+def sed_config(monkeypatch):
+    monkeypatch.setattr("chitanda.modules.sed.config", {})
 
 
-@pytest.mark.asyncio
-async def test_on_message_no_match():
-    with patch("chitanda.modules.sed._attach_message_log"):
-        with patch("chitanda.modules.sed._format_message"):
-            message_log = Mock(spec=deque)
-            listener = Mock(message_log={"#chan": message_log})
-            await on_message(
-                Message(
-                    bot=None,
-                    listener=listener,
-                    target="#chan",
-                    author=None,
-                    contents="f/from/to",
-                    private=False,
-                )
-            )
-            message_log.appendleft.assert_called()
+@pytest.fixture(autouse=True)
+def history(monkeypatch):
+    history = MessageHistory(memory_mb=1)
+    monkeypatch.setattr("chitanda.modules.sed.history", history)
+    return history
 
 
 @pytest.mark.asyncio
-async def test_on_message_no_channel():
-    with patch("chitanda.modules.sed._attach_message_log") as attach:
+async def test_on_message_match(history):
+    with patch("chitanda.modules.sed._substitute", return_value=Future()) as sub:
+        sub.return_value.set_result(123)
+        listener = Mock()
         await on_message(
             Message(
                 bot=None,
-                listener=None,
-                target=None,
+                listener=listener,
+                target="#chan",
                 author=None,
-                contents=None,
-                private=True,
+                contents="s/from/to",
+                private=False,
             )
         )
-        attach.assert_not_called()
+        sub.assert_called_once_with(
+            ("from", "to", None), history.get(listener, "#chan")
+        )
 
 
 @pytest.mark.asyncio
-async def test_on_response():
-    # Tests on_response, _attach_message_log, and _get_author for IRC
+async def test_log_message(history):
+    listener = Mock()
+    await log_message(
+        Message(
+            bot=None,
+            listener=listener,
+            target="#chan",
+            author="azul",
+            contents="f/from/to",
+            private=False,
+        )
+    )
+    assert list(history.get(listener, "#chan")) == ["<azul> f/from/to"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("contents", ["s/from/to", ".sed s/from/to"])
+async def test_log_message_skips_substitutions(history, contents):
+    listener = Mock()
+    message = Message(None, listener, "#chan", "azul", contents, private=False)
+    await log_message(message)
+    assert not history.get(listener, "#chan")
+
+
+@pytest.mark.asyncio
+async def test_on_message_no_channel(history):
+    await on_message(
+        Message(
+            bot=None,
+            listener=None,
+            target=None,
+            author=None,
+            contents=None,
+            private=True,
+        )
+    )
+    assert history.stats["channels"] == 0
+
+
+@pytest.mark.asyncio
+async def test_on_response(history):
+    # Tests on_response, _clean_message, and _get_author for IRC
     listener = IRCListener(None, "chitanda", "irc.freenode.fake")
     listener.nickname = "chitanda"
 
-    await on_response(Response(None, listener, "#chan", "hello"))
-    assert listener.message_log["#chan"].popleft() == "<chitanda> hello"
+    await on_response(Response(None, listener, "#chan", "\x02hello"))
+    assert list(history.get(listener, "#chan")) == ["<chitanda> hello"]
 
 
 def test_get_author_discord():
@@ -80,15 +111,88 @@ def test_get_author_discord():
 
 
 @pytest.mark.asyncio
-async def test_call_substitution():
-    listener = Mock(message_log={"#chan": deque(["<a> hello", "<a> i like dardaR"])})
-    assert "<a> i like azulazul" == await call(
-        Message(
-            bot=None,
-            listener=listener,
-            target="#chan",
-            author=None,
-            contents="s/dar/azul/gi",
-            private=False,
+async def test_call_substitution(history):
+    listener = Mock()
+    history.add(listener, "#chan", "a", "i like dardaR")
+    history.add(listener, "#chan", "a", "hello")
+    try:
+        assert "<a> i like azulazul" == await call(
+            Message(
+                bot=None,
+                listener=listener,
+                target="#chan",
+                author=None,
+                contents="s/dar/azul/gi",
+                private=False,
+            )
+        )
+    finally:
+        await _close_pool()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "pattern, repl, linear, expected",
+    [
+        (r"l+", "L", True, "<a> heLo"),
+        (r"(l)\1", "L", False, "<a> heLo"),
+        (r"(?<=e)l", "L", False, "<a> heLlo"),
+    ],
+)
+async def test_find_and_replace_engine(history, pattern, repl, linear, expected):
+    history.add(None, "#chan", "a", "hello")
+    message_log = history.get(None, "#chan")
+    try:
+        result = await _find_and_replace(message_log, re.compile(pattern), repl, 1)
+        assert result == expected
+        assert (sed._pool is None) == linear
+    finally:
+        await _close_pool()
+
+
+@pytest.mark.asyncio
+async def test_find_and_replace_linear_disabled(history, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.sed.config", {"sed": {"linear": False}})
+    history.add(None, "#chan", "a", "hello")
+    message_log = history.get(None, "#chan")
+    try:
+        assert "<a> heLo" == await _find_and_replace(
+            message_log, re.compile("l+"), "L", 1
         )
+        assert sed._pool is not None
+    finally:
+        await _close_pool()
+
+
+@pytest.mark.asyncio
+async def test_find_and_replace_over_linear_budget(history, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.sed.LINEAR_BUDGET", 100)
+    for _ in range(10):
+        history.add(None, "#chan", "a", "hello")
+    message_log = history.get(None, "#chan")
+    try:
+        assert "<a> heLo" == await _find_and_replace(
+            message_log, re.compile("l+"), "L", 1
+        )
+        assert sed._pool is not None
+    finally:
+        await _close_pool()
+
+
+@pytest.mark.asyncio
+async def test_find_and_replace_within_linear_budget_is_fast(history):
+    # Every line contains the required literal and keeps many threads alive,
+    # but none match, so the whole budget is searched on the event loop.
+    regex = re.compile(r"(\w+\s?)+x")
+    line = "x" + "ab " * 20
+    size = _compile_linear_regex(regex.pattern, False).size
+    for _ in range(LINEAR_BUDGET // size // (len(line) + 10)):
+        history.add(None, "#chan", "a", line)
+    message_log = history.get(None, "#chan")
+
+    start = time.perf_counter()
+    assert "No matching message found." == await _find_and_replace(
+        message_log, regex, "y", 1
     )
+    assert time.perf_counter() - start < 0.05
+    assert sed._pool is None
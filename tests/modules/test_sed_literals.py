@@ -0,0 +1,65 @@
+import re
+
+import pytest
+
+from chitanda.history import MessageHistory
+from chitanda.modules.sed.literals import candidates, required_literals
+
+
+@pytest.mark.parametrize(
+    "pattern, literals",
+    [
+        ("hello", ("hello",)),
+        ("colou?r", ("colo", "r")),
+        ("hello wor.d", ("hello wor", "d")),
+        ("ab+c", ("ab", "c")),
+        ("a*bc", ("bc",)),
+        (r"foo\.bar", ("foo.bar",)),
+        ("(foo|bar)baz", ("baz",)),
+        (r"\d+ apples", (" apples",)),
+        ("[xyz]abc", ("abc",)),
+        (r"\x41BC", ("BC",)),
+        ("tea{2}", ("tea",)),
+        ("x{}y", ("x{}y",)),
+        (r"(a)\1b", ("b",)),
+        ("foo|bar", ()),
+        ("[|]foo", ("foo",)),
+        ("(?i)abc", ()),
+        (".*", ()),
+    ],
+)
+def test_required_literals(pattern, literals):
+    assert required_literals(pattern) == literals
+
+
+def test_required_literals_ignorecase():
+    assert required_literals("Straße", ignorecase=True) == ("strasse",)
+    assert required_literals("Fish tail", ignorecase=True) == ("sh ta", "f", "l")
+
+
+@pytest.mark.parametrize("pattern", ["i", "I", "\u0130", "\u0131", "kiwi", "KIWI"])
+def test_candidates_ignorecase_matches_re(pattern):
+    history = MessageHistory(memory_mb=1)
+    for text in ["kiwi", "KIWI", "k\u0130w\u0130", "k\u0131w\u0131", "kowo"]:
+        history.add(None, "#chan", "a", text)
+    channel = history.get(None, "#chan")
+
+    regex = re.compile(pattern, re.IGNORECASE)
+    literals = required_literals(pattern, ignorecase=True)
+    assert set(candidates(channel, literals, folded=True)) >= {
+        line for line in channel if regex.search(line)
+    }
+
+
+def test_candidates():
+    history = MessageHistory(memory_mb=1)
+    for text in ["Hello there", "hello world", "goodbye"]:
+        history.add(None, "#chan", "a", text)
+    channel = history.get(None, "#chan")
+
+    assert list(candidates(channel, ("hello",))) == ["<a> hello world"]
+    assert list(candidates(channel, ("hello",), folded=True)) == [
+        "<a> hello world",
+        "<a> Hello there",
+    ]
+    assert len(list(candidates(channel, ()))) == 3
@@ -0,0 +1,84 @@
+import re
+import time
+
+import pytest
+
+from chitanda.modules.sed.nfa import Regex, Unsupported
+
+STRINGS = ["", "hello world", "aaab", "colour color", "x1 y22\nz", "ÀbC abc"]
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        r"l+",
+        r"o$",
+        r"^h|d$",
+        r"(a|ab)(c|bcd)(d*)",
+        r"a+?b",
+        r"colou?r",
+        r"\bc\w+",
+        r"[^a-z ]+",
+        r"[]a]",
+        r"\d{1,2}",
+        r"x{,1}",
+        r"a{}",
+        r"(?:l|o)+",
+        r"(?P<first>\w)(\w*)",
+        r".*",
+        r"\s\S",
+        r"l\B",
+        r"x*",
+    ],
+)
+@pytest.mark.parametrize("ignorecase", [False, True])
+def test_matches_re(pattern, ignorecase):
+    expected = re.compile(pattern, flags=re.IGNORECASE if ignorecase else 0)
+    regex = Regex(pattern, ignorecase=ignorecase)
+    for string in STRINGS:
+        match = regex.search(string)
+        expected_match = expected.search(string)
+        assert (match and match.group()) == (expected_match and expected_match.group())
+        for count in (0, 1):
+            assert regex.sub("<\\g<0>>", string, count) == expected.sub(
+                "<\\g<0>>", string, count
+            )
+
+
+@pytest.mark.parametrize(
+    "repl", [r"\2\1", r"\g<first>-\g<2>", r"\n\t\\", r"\101\0", r"\.", r"\1x"]
+)
+def test_sub_template(repl):
+    pattern = r"(?P<first>\w)(\w*)"
+    assert Regex(pattern).sub(repl, "ab cd") == re.sub(pattern, repl, "ab cd")
+
+
+@pytest.mark.parametrize("repl", [r"\3", r"\g<nope>", r"\q", "\\"])
+def test_sub_template_invalid(repl):
+    with pytest.raises(re.error):
+        Regex(r"(\w)(\w)").sub(repl, "ab")
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        r"(a)\1",
+        r"(?=a)",
+        r"(?<!a)b",
+        r"(?i)a",
+        r"\x41",
+        r"a{200}",
+        r"(a*)*",
+        r"(a|)+",
+        r"(?:(?:(?:a{100}){100}){100})",
+    ],
+)
+def test_unsupported(pattern):
+    with pytest.raises(Unsupported):
+        Regex(pattern)
+
+
+def test_linear_time():
+    start = time.monotonic()
+    assert Regex(r"(a+)+$").search("a" * 30 + "b") is None
+    assert time.monotonic() - start < 1
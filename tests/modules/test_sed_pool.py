@@ -0,0 +1,121 @@
+import re
+
+import pytest
+
+from chitanda.errors import BotError
+from chitanda.history import MessageHistory
+from chitanda.modules.sed.pool import WorkerPool
+
+
+@pytest.fixture
+def history():
+    history = MessageHistory(memory_mb=1, channel_length=3)
+    history.add(None, "#chan", "a", "hello")
+    return history
+
+
+@pytest.fixture
+def message_log(history):
+    return history.get(None, "#chan")
+
+
+def test_worker_syncs_new_messages(history, message_log):
+    pool = WorkerPool(1)
+    try:
+        worker = pool.workers[0]
+        log_id = message_log.id
+        assert worker._sync(message_log) == ([], log_id, 3, True, ["<a> hello"])
+        history.add(None, "#chan", "b", "hi")
+        assert worker._sync(message_log) == ([], log_id, 3, False, ["<b> hi"])
+        assert worker._sync(message_log) == ([], log_id, 3, False, [])
+        for i in range(3):
+            history.add(None, "#chan", "a", str(i))
+        assert worker._sync(message_log)[3:] == (True, ["<a> 2", "<a> 1", "<a> 0"])
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_drops_least_recent_logs(history, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.sed.pool.WORKER_LOGS", 2)
+    for i in range(3):
+        history.add(None, f"#chan{i}", "a", "hello")
+    logs = [history.get(None, f"#chan{i}") for i in range(3)]
+
+    pool = WorkerPool(1)
+    try:
+        worker = pool.workers[0]
+        for log in logs[:2]:
+            await pool.run(log, re.compile("h"), "j", 1, 1)
+        assert worker._sync(logs[0])[0] == []
+        assert worker._sync(logs[2])[0] == [logs[1].id]
+        assert list(worker.synced) == [logs[0].id, logs[2].id]
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_reuses_workers(history, message_log):
+    pool = WorkerPool(1)
+    try:
+        pid = pool.workers[0].process.pid
+        assert "<a> jello" == await pool.run(message_log, re.compile("h"), "j", 1, 1)
+
+        history.add(None, "#chan", "b", "hi")
+        history.add(None, "#chan", "b", "there")
+        assert "<b> ji" == await pool.run(message_log, re.compile("hi"), "ji", 1, 1)
+        assert "<a> hello" == await pool.run(message_log, re.compile("l+"), "ll", 1, 1)
+        assert pid == pool.workers[0].process.pid
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_no_match(message_log):
+    pool = WorkerPool(1)
+    try:
+        result = await pool.run(message_log, re.compile("x"), "y", 1, 1)
+        assert result == "No matching message found."
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_replaces_timed_out_worker(history, message_log):
+    history.add(None, "#chan", "a", "a" * 40 + "b")
+    pool = WorkerPool(1)
+    try:
+        worker = pool.workers[0]
+        with pytest.raises(BotError):
+            await pool.run(message_log, re.compile(r"(a+)+$"), "", 1, 0.1)
+        assert not worker.process.is_alive()
+        assert pool.workers[0] is not worker
+
+        history.add(None, "#chan", "a", "back")
+        assert "<a> black" == await pool.run(message_log, re.compile("b"), "bl", 1, 1)
+    finally:
+        pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_prefilters_literals():
+    history = MessageHistory(memory_mb=1)
+    history.add(None, "#chan", "a", "aa hello")
+    for _ in range(1023):
+        history.add(None, "#chan", "a", "a" * 30 + "!")
+    message_log = history.get(None, "#chan")
+
+    pool = WorkerPool(1)
+    try:
+        result = await pool.run(
+            message_log,
+            re.compile(r"(a+)+\1 HELLO", re.IGNORECASE),
+            "hi",
+            1,
+            1,
+            literals=(" hello",),
+            folded=True,
+        )
+        assert result == "<a> hi"
+    finally:
+        pool.close()
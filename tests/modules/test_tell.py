@@ -1,18 +1,31 @@
-from unittest.mock import call, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 
 from chitanda.database import database
-from chitanda.modules.tell import _delete_tell, _fetch_tells
+from chitanda.modules.tell import _delete_tells, _fetch_tells, _get_pending, _pack_tells
 from chitanda.modules.tell import call as call_cmd
 from chitanda.modules.tell import tell_handler
 from chitanda.util import Message
 
 
+@pytest.fixture(autouse=True)
+def reset_pending(monkeypatch):
+    monkeypatch.setattr("chitanda.modules.tell._pending", None)
+    monkeypatch.setattr("chitanda.modules.tell.config", {})
+
+
+@pytest.fixture
+def pending():
+    pending = {("None", "None", "newuser")}
+    with patch("chitanda.modules.tell._get_pending", AsyncMock(return_value=pending)):
+        yield pending
+
+
 @pytest.mark.asyncio
-async def test_tell_handler():
+async def test_tell_handler(pending):
     with patch("chitanda.modules.tell._fetch_tells") as fetch:
-        with patch("chitanda.modules.tell._delete_tell") as delete:
+        with patch("chitanda.modules.tell._delete_tells") as delete:
             fetch.return_value = [
                 {
                     "time": "2019-01-01T12:34:56",
@@ -39,13 +52,102 @@ async def test_tell_handler():
                 "newuser: On Jan 01, 12:34:56, azul said: hi",
                 "newuser: On Jan 02, 12:34:56, azul said: hi again",
             ]
-            assert delete.call_args_list == [call(1), call(2)]
+            delete.assert_called_once_with([1, 2])
+            assert not pending
+
+
+@pytest.mark.asyncio
+async def test_tell_handler_packed(pending, monkeypatch):
+    monkeypatch.setattr("chitanda.modules.tell.config", {"tell": {"pack": True}})
+    listener = Mock(
+        max_message_length=Mock(return_value=100), __str__=lambda *a: "None"
+    )
+    with patch("chitanda.modules.tell._fetch_tells") as fetch:
+        with patch("chitanda.modules.tell._delete_tells") as delete:
+            fetch.return_value = [
+                {
+                    "time": "2019-01-01T12:34:56",
+                    "sender": "azul",
+                    "message": "hi",
+                    "id": 1,
+                },
+                {
+                    "time": "2019-01-02T12:34:56",
+                    "sender": "azul",
+                    "message": "hi again",
+                    "id": 2,
+                },
+                {
+                    "time": "2019-01-03T12:34:56",
+                    "sender": "azul",
+                    "message": "bye",
+                    "id": 3,
+                },
+            ]
+
+            responses = [
+                r
+                async for r in tell_handler(
+                    Message(None, listener, None, "newuser", None, False)
+                )
+            ]
+
+            assert responses == [
+                "newuser: On Jan 01, 12:34:56, azul said: hi | "
+                "On Jan 02, 12:34:56, azul said: hi again",
+                "newuser: On Jan 03, 12:34:56, azul said: bye",
+            ]
+            delete.assert_called_once_with([1, 2, 3])
+
+
+def test_pack_tells():
+    assert _pack_tells("a: ", ["1234", "5678", "1234567890", "9"], 14) == [
+        "a: 1234 | 5678",
+        "a: 1234567890",
+        "a: 9",
+    ]
+
+
+def test_pack_tells_measures_bytes():
+    assert _pack_tells("a: ", ["1234", "ééé"], 14) == ["a: 1234", "a: ééé"]
+
+
+@pytest.mark.asyncio
+async def test_tell_handler_not_pending():
+    with patch("chitanda.modules.tell._get_pending", AsyncMock(return_value=set())):
+        with patch("chitanda.modules.tell._fetch_tells") as fetch:
+            assert not [
+                r
+                async for r in tell_handler(
+                    Message(None, None, None, "newuser", None, False)
+                )
+            ]
+            fetch.assert_not_called()
 
 
 @pytest.mark.asyncio
-async def test_tell_handler_private():
+async def test_tell_handler_interrupted(pending):
     with patch("chitanda.modules.tell._fetch_tells") as fetch:
-        with patch("chitanda.modules.tell._delete_tell"):
+        with patch("chitanda.modules.tell._delete_tells"):
+            fetch.return_value = [
+                {
+                    "time": "2019-01-01T12:34:56",
+                    "sender": "azul",
+                    "message": "hi",
+                    "id": 1,
+                }
+            ]
+
+            handler = tell_handler(Message(None, None, None, "NewUser", None, False))
+            await handler.__anext__()
+            await handler.aclose()
+            assert pending == {("None", "None", "newuser")}
+
+
+@pytest.mark.asyncio
+async def test_tell_handler_private(pending):
+    with patch("chitanda.modules.tell._fetch_tells") as fetch:
+        with patch("chitanda.modules.tell._delete_tells"):
             fetch.return_value = [
                 {
                     "time": "2019-01-01T12:34:56",
@@ -87,9 +189,31 @@ async def test_add_tell(test_db):
             """
         )
         assert cursor.fetchone()
+    assert ("DiscordListener", "#chan", "newuser") in await _get_pending()
 
 
-def test_fetch_tells(test_db):
+@pytest.mark.asyncio
+async def test_get_pending(test_db):
+    with database() as (conn, cursor):
+        cursor.execute(
+            """
+            INSERT INTO tells
+                (channel, listener, message, recipient, sender)
+            VALUES
+                ("#chan", "DiscordListener", "hi", "Azul", "newuser"),
+                ("#chan", "DiscordListener", "hi again", "azul", "newuser"),
+                (123, "DiscordListener", "hi", "456", "newuser")
+            """
+        )
+        conn.commit()
+    assert await _get_pending() == {
+        ("DiscordListener", "#chan", "azul"),
+        ("DiscordListener", "123", "456"),
+    }
+
+
+@pytest.mark.asyncio
+async def test_fetch_tells(test_db):
     with database() as (conn, cursor):
         cursor.execute(
             """
@@ -104,10 +228,11 @@ def test_fetch_tells(test_db):
             """
         )
         conn.commit()
-    assert len(_fetch_tells("#chan", "DiscordListener", "azul")) == 1
+    assert len(await _fetch_tells("#chan", "DiscordListener", "azul")) == 1
 
 
-def test_delete_tell(test_db):
+@pytest.mark.asyncio
+async def test_delete_tells(test_db):
     with database() as (conn, cursor):
         cursor.execute(
             """
@@ -115,11 +240,25 @@ def test_delete_tell(test_db):
                 id, channel, listener, message, recipient, sender
             ) VALUES
                 (1, "#chan", "DiscordListener", "hi", "azul", "newuser"),
-                (2, "#notchan", "DiscordListener", "hi", "azul", "newuser")
+                (2, "#notchan", "DiscordListener", "hi", "azul", "newuser"),
+                (3, "#chan", "DiscordListener", "hi", "azul", "newuser")
             """
         )
         conn.commit()
-    _delete_tell(1)
+    await _delete_tells([1, 3])
     with database() as (conn, cursor):
         cursor.execute("SELECT COUNT(1) FROM tells")
         assert 1 == cursor.fetchone()[0]
+
+
+def test_tells_index(test_db):
+    with database() as (conn, cursor):
+        cursor.execute(
+            """
+            EXPLAIN QUERY PLAN
+            SELECT id FROM tells
+            WHERE channel = "#chan" AND listener = "DiscordListener"
+                AND recipient = "azul"
+            """
+        )
+        assert "tells_channel_listener_recipient_idx" in cursor.fetchone()["detail"]
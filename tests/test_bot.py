@@ -1,9 +1,11 @@
+import asyncio
 from asyncio import Future
 from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 
 from chitanda.bot import Chitanda, NoCommandFound
+from chitanda.decorators import ordered
 from chitanda.errors import BotError
 from chitanda.util import Message, Response
 
@@ -104,15 +106,22 @@ def test_connect_irc(asyncio, irc_listener, monkeypatch):
     assert "hostname2" in chitanda.irc_listeners
 
 
+@pytest.mark.asyncio
 @patch("chitanda.bot.DiscordListener")
-def test_connect_discord(discord_listener, monkeypatch):
+async def test_connect_discord(discord_listener, monkeypatch):
     monkeypatch.setattr(
         "chitanda.bot.config",
         {"webserver": {"enable": True}, "discord_token": "token"},
     )
+    listener = discord_listener.return_value
+    listener.start, listener.close = AsyncMock(), AsyncMock()
     chitanda = Chitanda()
     chitanda._connect_discord()
-    assert discord_listener.return_value.run.called_with("token")
+    await asyncio.sleep(0)
+    listener.start.assert_awaited_once_with("token")
+
+    await chitanda.shutdown()
+    listener.close.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -152,6 +161,70 @@ async def test_handle_message_bot_error(monkeypatch):
         listener.message.assert_called_with(2, "Error: test error")
 
 
+@pytest.mark.asyncio
+async def test_handle_message_ordered_before_dispatch(monkeypatch):
+    monkeypatch.setattr("chitanda.bot.config", {"webserver": {"enable": True}})
+    calls = []
+
+    @ordered
+    async def rewrite(message):
+        await asyncio.sleep(0.01)
+        calls.append("rewrite")
+        message.contents = "rewritten"
+
+    async def dispatch(message):
+        calls.append(("dispatch", message.contents))
+
+    chitanda = Chitanda()
+    chitanda.message_handlers.append(rewrite)
+    with patch.object(chitanda, "dispatch_command", side_effect=dispatch):
+        await chitanda.handle_message(Message(chitanda, Mock(), 2, 3, "orig", 5))
+
+    assert calls == ["rewrite", ("dispatch", "rewritten")]
+
+
+@pytest.mark.asyncio
+async def test_handle_message_slow_handler_doesnt_block(monkeypatch):
+    monkeypatch.setattr("chitanda.bot.config", {"webserver": {"enable": True}})
+    monkeypatch.setattr("chitanda.bot.HANDLER_TIMEOUT", 0.05)
+    calls = []
+
+    async def stuck(message):
+        await asyncio.sleep(10)
+        calls.append("stuck")
+
+    async def fast(message):
+        calls.append("fast")
+
+    async def dispatch(message):
+        calls.append("dispatch")
+
+    chitanda = Chitanda()
+    chitanda.message_handlers += [stuck, fast]
+    with patch.object(chitanda, "dispatch_command", side_effect=dispatch):
+        await asyncio.wait_for(
+            chitanda.handle_message(Message(chitanda, Mock(), 2, 3, 4, 5)), 1
+        )
+
+    assert sorted(calls) == ["dispatch", "fast"]
+
+
+@pytest.mark.asyncio
+async def test_handle_message_unordered_bot_error(monkeypatch):
+    monkeypatch.setattr("chitanda.bot.config", {"webserver": {"enable": True}})
+    listener = Mock(message=AsyncMock())
+
+    async def broken(message):
+        raise BotError("test error")
+
+    chitanda = Chitanda()
+    chitanda.message_handlers.append(broken)
+    with patch.object(chitanda, "dispatch_command", AsyncMock()) as dispatch:
+        await chitanda.handle_message(Message(chitanda, listener, 2, 3, 4, 5))
+        dispatch.assert_called_once()
+    listener.message.assert_called_with(2, "Error: test error")
+
+
 @pytest.mark.asyncio
 async def test_dispatch_command(monkeypatch):
     monkeypatch.setattr("chitanda.bot.config", {"webserver": {"enable": True}})
@@ -309,3 +382,15 @@ async def test_call_response_handlers(monkeypatch):
         await chitanda.call_response_handlers("abc")
         handler1.assert_called_with("abc")
         handler2.assert_called_with("abc")
+
+
+@pytest.mark.asyncio
+async def test_shutdown(monkeypatch):
+    monkeypatch.setattr("chitanda.bot.config", {"webserver": {"enable": False}})
+    handler1 = AsyncMock(side_effect=ValueError)
+    handler2 = AsyncMock(return_value=True)
+    chitanda = Chitanda()
+    chitanda.shutdown_handlers = [handler1, handler2]
+    await chitanda.shutdown()
+    handler1.assert_called_once()
+    handler2.assert_called_once()
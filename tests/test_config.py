@@ -16,6 +16,13 @@ def test_config_lazy_load(monkeypatch):
     assert config._config is not None
 
 
+def test_config_get(monkeypatch):
+    monkeypatch.setattr("chitanda.config.CONFIG_PATH", SAMPLE_CONFIG)
+    config = Config()
+    assert config.get("trigger_character") == "."
+    assert config.get("nonexistent", 123) == 123
+
+
 def test_config_reload(monkeypatch):
     with CliRunner().isolated_filesystem():
         monkeypatch.setattr("chitanda.config.CONFIG_PATH", SAMPLE_CONFIG)
@@ -1,3 +1,6 @@
+import asyncio
+import sqlite3
+import threading
 from pathlib import Path
 from unittest.mock import Mock, patch
 
@@ -10,9 +13,12 @@ from chitanda.database import (
     _find_migrations,
     _get_versions,
     calculate_migrations_needed,
+    close_database,
+    configure_database,
     confirm_database_is_updated,
     create_database_if_nonexistent,
     database,
+    db,
 )
 from chitanda.errors import BotError
 
@@ -30,6 +36,108 @@ def test_database_contextmanager(monkeypatch):
             assert cursor.fetchone()[0] == 1
 
 
+def test_database_reuses_connections(test_db):
+    with database() as (writer, _):
+        pass
+    with database() as (writer_again, _):
+        assert writer is writer_again
+
+    with database(readonly=True) as (reader, _):
+        assert reader is not writer
+    with database(readonly=True) as (reader_again, _):
+        assert reader is reader_again
+
+
+def test_database_readonly(test_db):
+    with database(readonly=True) as (conn, cursor):
+        with pytest.raises(sqlite3.OperationalError):
+            cursor.execute("DELETE FROM versions")
+
+
+def test_database_overflow_readers(test_db, monkeypatch):
+    monkeypatch.setattr("chitanda.database.READER_POOL_SIZE", 1)
+    close_database()
+    with database(readonly=True) as (reader1, _):
+        with database(readonly=True) as (reader2, _):
+            assert reader1 is not reader2
+
+    # Only the first released reader is kept in the pool.
+    with database(readonly=True) as (reader, _):
+        assert reader is reader2
+
+
+def test_configure_database(test_db):
+    configure_database({"synchronous": "FULL"})
+    try:
+        with database() as (conn, cursor):
+            cursor.execute("PRAGMA synchronous")
+            assert 2 == cursor.fetchone()[0]
+            cursor.execute("PRAGMA journal_mode")
+            assert "wal" == cursor.fetchone()[0]
+    finally:
+        configure_database({})
+
+
+@pytest.mark.asyncio
+async def test_async_database(test_db):
+    await db.execute("INSERT INTO versions (source, version) VALUES ('a', 1)")
+    assert 2 == await db.executemany(
+        "INSERT INTO versions (source, version) VALUES (?, ?)",
+        [("b", 1), ("c", 1)],
+    )
+    assert (
+        1 == (await db.fetchone("SELECT version FROM versions WHERE source = 'a'"))[0]
+    )
+    assert 3 == len(
+        await db.fetchall("SELECT * FROM versions WHERE source IN ('a', 'b', 'c')")
+    )
+
+
+@pytest.mark.asyncio
+async def test_async_database_off_loop(test_db):
+    loop_thread = threading.current_thread()
+
+    def thread_of(cursor):
+        return threading.current_thread()
+
+    assert loop_thread is not await db.transaction(thread_of)
+    assert loop_thread is not await db.read(thread_of)
+
+
+@pytest.mark.asyncio
+async def test_async_database_transaction_isolated(test_db):
+    started = threading.Event()
+
+    def insert_and_fail(cursor):
+        cursor.execute("INSERT INTO versions (source, version) VALUES ('a', 1)")
+        started.set()
+        threading.Event().wait(0.05)
+        raise ValueError
+
+    transaction = asyncio.ensure_future(db.transaction(insert_and_fail))
+    await asyncio.sleep(0)  # Submit the transaction to the writer thread.
+    assert started.wait(1)
+    with database() as (conn, cursor):
+        cursor.execute("INSERT INTO versions (source, version) VALUES ('b', 1)")
+        conn.commit()
+
+    with pytest.raises(ValueError):
+        await transaction
+    rows = await db.fetchall("SELECT source FROM versions WHERE source IN ('a', 'b')")
+    assert ["b"] == [row["source"] for row in rows]
+
+
+@pytest.mark.asyncio
+async def test_async_database_transaction_rollback(test_db):
+    def insert_and_fail(cursor):
+        cursor.execute("INSERT INTO versions (source, version) VALUES ('a', 1)")
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        await db.transaction(insert_and_fail)
+    assert not await db.fetchall("SELECT * FROM versions WHERE source = 'a'")
+
+
 def test_create_nonexistent_database(monkeypatch):
     with CliRunner().isolated_filesystem():
         monkeypatch.setattr(
@@ -0,0 +1,101 @@
+import sys
+
+import pytest
+
+from chitanda.history import (
+    AUTHOR_OVERHEAD,
+    CHANNEL_OVERHEAD,
+    MESSAGE_OVERHEAD,
+    MessageHistory,
+)
+
+
+@pytest.fixture
+def history():
+    return MessageHistory(memory_mb=1, channel_length=3)
+
+
+def test_channel_history(history):
+    for author, text in [("a", "one"), ("b", "two"), ("a", "three"), ("b", "four")]:
+        history.add("listener", "#chan", author, text)
+
+    channel = history.get("listener", "#chan")
+    assert len(channel) == 3
+    assert channel.added == 4
+    assert list(channel) == ["<b> four", "<a> three", "<b> two"]
+    assert channel[0] == "<b> four" and channel[2] == "<b> two"
+    assert list(channel.messages()) == [("b", "four"), ("a", "three"), ("b", "two")]
+    with pytest.raises(IndexError):
+        channel[3]
+
+
+def test_authors_interned(history):
+    history.add("listener", "#chan", "azul", "hi")
+    history.add("listener", "#other", "azul", "hi")
+    assert history.stats["authors"] == 1
+
+    for i in range(3):
+        history.add("listener", "#chan", "tom", str(i))
+    assert history.stats["authors"] == 2
+    assert list(history.get("listener", "#chan"))[-1] == "<tom> 0"
+
+
+def test_memory_accounting(history):
+    history.add("listener", "#chan", "azul", "hello")
+    assert history.memory == (
+        CHANNEL_OVERHEAD
+        + AUTHOR_OVERHEAD
+        + sys.getsizeof("azul")
+        + MESSAGE_OVERHEAD
+        + sys.getsizeof("hello")
+    )
+
+
+def test_evicts_least_recently_used_channels():
+    history = MessageHistory(memory_mb=1)
+    text = "x" * 1000
+    for i in range(100):
+        for _ in range(5):
+            history.add("listener", f"#chan{i}", "azul", text)
+    history.get("listener", "#chan0")
+
+    for _ in range(600):
+        history.add("listener", "#busy", "azul", text)
+
+    stats = history.stats
+    assert stats["memory"] <= stats["budget"]
+    assert stats["evicted"] > 0
+    channels = [target for _, target in history._channels]
+    assert "#chan0" in channels and "#busy" in channels
+    assert "#chan1" not in channels
+
+
+def test_single_channel_over_budget():
+    history = MessageHistory(memory_mb=0.01)
+    for i in range(100):
+        history.add("listener", "#chan", f"user{i}", "x" * 100)
+
+    stats = history.stats
+    assert stats["memory"] <= stats["budget"]
+    assert 0 < stats["messages"] < 100
+    assert stats["authors"] == stats["messages"]
+
+
+def test_budget_from_config(monkeypatch):
+    monkeypatch.setattr("chitanda.history.config", {"history": {"memory_mb": 2}})
+    assert MessageHistory().stats["budget"] == 2 * 2 ** 20
+
+
+def test_folded_lines_cached(history):
+    history.add("listener", "#chan", "Azul", "HELLO")
+    channel = history.get("listener", "#chan")
+    memory = history.memory
+
+    assert list(channel.folded()) == ["<azul> hello"]
+    assert history.memory == memory + sys.getsizeof("<azul> hello")
+    assert list(channel.folded()) == ["<azul> hello"]
+    assert history.memory == memory + sys.getsizeof("<azul> hello")
+
+    for i in range(3):
+        history.add("listener", "#chan", "Azul", str(i))
+    assert history.memory < memory + 3 * sys.getsizeof("<azul> hello")
@@ -5,33 +5,42 @@ import pytest
 from chitanda.loader import _get_module_names, _is_module_enabled, load_commands
 
 
+@patch("chitanda.loader.CommandIndex")
+@patch("chitanda.loader.config")
 @patch("chitanda.loader.importlib")
 @patch("chitanda.loader.sys")
 @patch("chitanda.loader._is_module_enabled")
 @patch("chitanda.loader._get_module_names")
-def test_load_commands(get_module_names, is_module_enabled, sys, importlib):
+def test_load_commands(
+    get_module_names, is_module_enabled, sys, importlib, config, command_index
+):
     get_module_names.return_value = ["chii.a", "chii.b", "chii.c", "chii.d"]
     is_module_enabled.side_effect = [True, True, False, False]
     sys.modules = {"chii.b": 456, "chii.d": Mock()}
 
-    load_commands(123, run_setup=False)
+    bot = Mock()
+    load_commands(bot, run_setup=False)
     assert "chii.d" not in sys.modules
     importlib.reload.assert_called_with(456)
     importlib.import_module.assert_called_with("chii.a")
+    assert bot.command_index == command_index.return_value
 
 
+@patch("chitanda.loader.CommandIndex")
+@patch("chitanda.loader.config")
 @patch("chitanda.loader.importlib")
 @patch("chitanda.loader.sys")
 @patch("chitanda.loader._is_module_enabled")
 @patch("chitanda.loader._get_module_names")
-def test_run_setup(get_module_names, is_module_enabled, sys, importlib):
+def test_run_setup(get_module_names, is_module_enabled, sys, importlib, *_):
     get_module_names.return_value = ["chii.a", "chii.b"]
     is_module_enabled.side_effect = [True, True]
     chii_b = Mock()
     sys.modules = {"chii.a": None, "chii.b": chii_b}
 
-    load_commands(123, run_setup=True)
-    assert chii_b.setup.called_with(123)
+    bot = Mock()
+    load_commands(bot, run_setup=True)
+    assert chii_b.setup.called_with(bot)
 
 
 @pytest.mark.parametrize(
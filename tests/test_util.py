@@ -6,10 +6,12 @@ from click.testing import CliRunner
 
 from chitanda.errors import InvalidListener, NoCommandFound
 from chitanda.util import (
+    CommandIndex,
     Message,
     create_app_dirs,
     get_listener,
     irc_unstyle,
+    split_message,
     trim_message,
 )
 
@@ -23,10 +25,17 @@ TEST_PARSE_CONFIG = {
 }
 
 
+def _bot(commands):
+    return Mock(
+        commands=commands,
+        command_index=CommandIndex(commands, TEST_PARSE_CONFIG["modules"]),
+    )
+
+
 def test_parse_command(monkeypatch):
     monkeypatch.setattr("chitanda.util.config", TEST_PARSE_CONFIG)
     cmd = Mock(__name__="cmd", call=Mock(return_value=123))
-    bot = Mock(commands={"cmd": cmd})
+    bot = _bot({"cmd": cmd})
 
     message = Message(bot, "TestListener", 2, 3, ".cmd", 5)
     assert 123 == message.call_command()
@@ -36,7 +45,7 @@ def test_parse_command(monkeypatch):
 def test_parse_command_multi_word(monkeypatch):
     monkeypatch.setattr("chitanda.util.config", TEST_PARSE_CONFIG)
     cmd = Mock(__name__="multi_word", call=Mock(return_value=123))
-    bot = Mock(commands={"multi word": cmd})
+    bot = _bot({"multi word": cmd})
 
     message = Message(bot, "TestListener", 2, 3, ".multi word command", 5)
     assert 123 == message.call_command()
@@ -46,7 +55,7 @@ def test_parse_command_multi_word(monkeypatch):
 def test_parse_command_not_enabled(monkeypatch):
     monkeypatch.setattr("chitanda.util.config", TEST_PARSE_CONFIG)
     cmd = Mock(__name__="ramwolf", call=Mock(return_value=123))
-    bot = Mock(commands={"ramwolf": cmd})
+    bot = _bot({"ramwolf": cmd})
 
     message = Message(bot, "AppleListener", 2, 3, ".ramwolf", 5)
     with pytest.raises(NoCommandFound):
@@ -56,7 +65,7 @@ def test_parse_command_not_enabled(monkeypatch):
 def test_parse_command_trigger_match(monkeypatch):
     monkeypatch.setattr("chitanda.util.config", TEST_PARSE_CONFIG)
     cmd = Mock(__name__="henlo", call=Mock(return_value=123))
-    bot = Mock(commands={"henlo ": cmd})
+    bot = _bot({"henlo ": cmd})
     message = Message(bot, "TestListener", 2, 3, ".not henlo", 5)
     with pytest.raises(NoCommandFound):
         message.call_command()
@@ -64,12 +73,40 @@ def test_parse_command_trigger_match(monkeypatch):
 
 def test_parse_command_no_trigger_match(monkeypatch):
     monkeypatch.setattr("chitanda.util.config", TEST_PARSE_CONFIG)
-    bot = Mock(commands={"henlo ": 1})
+    bot = _bot({"henlo ": Mock(__name__="henlo")})
     message = Message(bot, "TestListener", 2, 3, "henlo", 5)
     with pytest.raises(NoCommandFound):
         message.call_command()
 
 
+def test_parse_command_longest_match(monkeypatch):
+    monkeypatch.setattr("chitanda.util.config", TEST_PARSE_CONFIG)
+    short = Mock(__name__="multi_word", call=Mock(return_value=1))
+    long_ = Mock(__name__="multi_word", call=Mock(return_value=2))
+    bot = _bot({"multi": short, "multi word": long_})
+
+    message = Message(bot, "TestListener", 2, 3, ".multi word command", 5)
+    assert 2 == message.call_command()
+    assert long_.call.call_args[0][0].contents == "command"
+
+
+def test_parse_command_listener_module(monkeypatch):
+    monkeypatch.setattr("chitanda.util.config", TEST_PARSE_CONFIG)
+    cmd = Mock(__name__="ramwolf", call=Mock(return_value=123))
+    bot = _bot({"ramwolf": cmd})
+
+    message = Message(bot, "BananaListener", 2, 3, ".ramwolf", 5)
+    assert 123 == message.call_command()
+
+
+def test_command_index_long_message():
+    cmd = Mock(__name__="cmd")
+    index = CommandIndex({"cmd": cmd, "cmd sub": cmd}, {"global": ["cmd"]})
+    assert ("cmd sub", cmd) == index.find("AnyListener", "cmd sub " + "a " * 100)
+    assert ("cmd", cmd) == index.find("AnyListener", "cmd " + "a" * 100)
+    assert index.find("AnyListener", "cmdsub " + "a" * 100) is None
+
+
 def test_create_app_dirs(monkeypatch):
     with CliRunner().isolated_filesystem():
         config_dir = Path.cwd() / "config"
@@ -125,3 +162,21 @@ def test_irc_unstyle():
 )
 def test_trim_message(input_, output):
     assert output == trim_message(input_, length=9)
+
+
+@pytest.mark.parametrize(
+    "input_, output",
+    [
+        ("short", ["short"]),
+        ("one two three", ["one two", "three"]),
+        ("line one\n\nline two", ["line one", "line two"]),
+        ("abcdefghijkl", ["abcdefgh", "ijkl"]),
+        ("aa  bbbbbbbb", ["aa", "bbbbbbbb"]),
+        ("日本語のテキスト", ["日本", "語の", "テキ", "スト"]),
+        ("é é é é é", ["é é é", "é é"]),
+    ],
+)
+def test_split_message(input_, output):
+    lines = list(split_message(input_, length=8))
+    assert output == lines
+    assert all(len(line.encode()) <= 8 for line in lines)